@@ -2,12 +2,13 @@
 
 import argparse
 import datetime
+import glob
 import json
-import math
 import multiprocessing
 import os
 import sys
 import time
+import h5py
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
 CALIBRATION_DIR = os.path.dirname(CURRENT_DIR)
@@ -22,13 +23,18 @@ ADCCAL_GATHER_METHOD_DIR = os.path.join(GATHER_DIR, "adccal", "methods")
 PTCCAL_GATHER_METHOD_DIR = os.path.join(GATHER_DIR, "ptccal", "methods")
 
 PROCESS_DIR = os.path.join(SRC_DIR, "process")
-ADCCAL_PROCESS_METHOD_DIR = os.path.join(PROCESS_DIR, "adccal", "methods")
+ADCCAL_PROCESS_DIR = os.path.join(PROCESS_DIR, "adccal")
+ADCCAL_PROCESS_METHOD_DIR = os.path.join(ADCCAL_PROCESS_DIR, "methods")
 PTCCAL_PROCESS_METHOD_DIR = os.path.join(PROCESS_DIR, "ptccal", "methods")
 
 if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 
 import utils  # noqa E402
+from utils_cache import ResultCache  # noqa E402
+from utils_storage import (create_virtual_file,  # noqa E402
+                           get_master_fname)
+import utils_trace  # noqa E402
 
 
 class Analyse(object):
@@ -43,7 +49,15 @@ class Analyse(object):
                  method,
                  method_properties,
                  n_processes,
-                 metadata_fname):
+                 metadata_fname,
+                 process_method=None,
+                 process_method_properties=None,
+                 save_gathered=False,
+                 cache=None,
+                 invalidate_cache=False,
+                 storage=None,
+                 trace_fname=None,
+                 log_level=None):
 
         self._in_base_dir = in_base_dir
         self._out_base_dir = out_base_dir
@@ -62,7 +76,6 @@ class Analyse(object):
         self._n_processes = n_processes
 
         self._n_parts = self._n_cols_total // self._n_cols
-        self._set_job_sets()
 
         self._run_id = run_id
         self._run_type = run_type
@@ -72,30 +85,195 @@ class Analyse(object):
         self._method_properties = method_properties
         self._metadata_fname = metadata_fname
 
-    def _set_job_sets(self):
-        all_jobs = range(self._n_parts)
-        self._n_job_sets = math.ceil(self._n_parts / float(self._n_processes))
+        # only used for run type "all"
+        self._process_method = process_method
+        self._process_method_properties = process_method_properties
+        self._save_gathered = save_gathered
 
-        self._job_sets = []
-        for i in range(self._n_job_sets):
-            start = i*self._n_processes
-            stop = (i+1)*self._n_processes
-            self._job_sets.append(all_jobs[start:stop])
+        # reuse results of earlier runs with identical inputs
+        self._cache = cache
+        self._invalidate_cache = invalidate_cache
+
+        # chunking and compression of the output files
+        self._storage = storage
+
+        # where to write the timings, counters and peak memory of the run
+        self._trace_fname = trace_fname
+        # the level of the log messages (the workers have to set it again
+        # if they are not forked)
+        self._log_level = log_level
 
     def run(self):
         print("\nStarted at", str(datetime.datetime.now()))
         t = time.time()
 
-        if self._run_type == "gather":
-            self.run_gather()
-        elif self._run_type == "process":
-            self.run_process()
-        else:
-            print("Unsupported argument: run_type {}".format(self._run_type))
+        tracer = utils_trace.start_trace("analyse")
+
+        with utils_trace.span(self._run_type):
+            if self._run_type == "gather":
+                self.run_gather()
+            elif self._run_type == "process":
+                self.run_process()
+            elif self._run_type == "all":
+                self.run_all()
+            else:
+                print("Unsupported argument: run_type {}"
+                      .format(self._run_type))
 
         print("\nFinished at", str(datetime.datetime.now()))
         print("took time: ", time.time() - t)
 
+        if self._trace_fname is not None:
+            tracer.write(self._trace_fname)
+
+    def _run_jobs(self, call, jobs):
+        """Runs the jobs on a pool of worker processes.
+
+        Each worker takes the next job as soon as it is finished with the
+        previous one. The workers are reused for all jobs thus the method
+        modules are only imported once per worker.
+
+        Args:
+            call (str): The name of the method to run for each job,
+                        e.g. "_call_gather".
+            jobs (list): A list of tuples (part, kwargs) where kwargs are the
+                         keyword arguments to call the method with.
+        """
+
+        if not jobs:
+            return
+
+        n_workers = max(min(self._n_processes, len(jobs)), 1)
+        tasks = [(call, part, kwargs) for part, kwargs in jobs]
+
+        timings = {}
+        tracer = utils_trace.get_tracer()
+        with multiprocessing.Pool(processes=n_workers) as pool:
+            for part, duration, trace in pool.imap_unordered(self._run_job,
+                                                             tasks):
+                timings[part] = duration
+                tracer.attach(trace, name="part {}".format(part))
+                print("Part {} finished ({}/{}), took time: {:.3f} s"
+                      .format(part, len(timings), len(tasks), duration))
+
+        if timings:
+            print("\nTiming per part (s):")
+            for part in sorted(timings):
+                print("    part {}: {:.3f}".format(part, timings[part]))
+            print("min: {:.3f}, max: {:.3f}, sum: {:.3f}"
+                  .format(min(timings.values()),
+                          max(timings.values()),
+                          sum(timings.values())))
+
+    def _run_cached_jobs(self, call, jobs, merge_jobs=None):
+        """Runs only the jobs whose results are not found in the cache.
+
+        Args:
+            call (str): The name of the method to run for each job.
+            jobs (list): A list of tuples (part, kwargs, in_fnames,
+                         out_fname) where in_fnames are the files the result
+                         depends on and out_fname is the result file.
+            merge_jobs (optional): A function combining the list of
+                                   (part, kwargs) to run into fewer jobs.
+        """
+
+        if merge_jobs is None:
+            def merge_jobs(jobs_to_run):
+                return jobs_to_run
+
+        if self._cache is None:
+            self._run_jobs(call=call,
+                           jobs=merge_jobs([(part, kwargs)
+                                            for part, kwargs, _, _ in jobs]))
+            return
+
+        if self._run_type == "all":
+            method = [self._method, self._process_method]
+            method_properties = {
+                "gather": self._method_properties,
+                "process": self._process_method_properties
+            }
+        else:
+            method = self._method
+            method_properties = self._method_properties
+
+        jobs_to_run = []
+        keys = {}
+        for part, kwargs, in_fnames, out_fname in jobs:
+            key = self._cache.get_key(
+                stage=self._run_type,
+                method=method,
+                method_properties=method_properties,
+                in_fnames=in_fnames,
+                parameters=dict(measurement=self._measurement,
+                                run=self._run_id,
+                                n_rows=self._n_rows,
+                                n_cols=self._n_cols,
+                                part=part,
+                                storage=self._storage)
+            )
+
+            if self._invalidate_cache:
+                self._cache.invalidate(key)
+            elif self._cache.restore(key, out_fname):
+                print("Part {}: reuse cached result {}"
+                      .format(part, out_fname))
+                continue
+
+            jobs_to_run.append((part, kwargs))
+            keys[part] = (key, out_fname)
+
+        if jobs_to_run:
+            jobs_to_run = merge_jobs(jobs_to_run)
+
+        self._run_jobs(call=call, jobs=jobs_to_run)
+
+        for part in sorted(keys):
+            key, out_fname = keys[part]
+            # not every method writes a result file (e.g. descramble_tcpdump)
+            if os.path.exists(out_fname):
+                self._cache.store(key, out_fname)
+
+    def _get_raw_fnames(self, in_fname, meta_fname):
+        """Lists the raw input files the gathered result depends on.
+
+        Args:
+            in_fname (str): The input file name template.
+            meta_fname (str): The metadata file.
+
+        Return:
+            A sorted list of file names.
+        """
+
+        fnames = glob.glob(in_fname.format(prefix="*"))
+        fnames.append(meta_fname)
+
+        return sorted(fnames)
+
+    def _run_job(self, task):
+        """Runs a single job inside a worker process.
+
+        Args:
+            task (tuple): The method name, the part and the keyword arguments
+                          of the job.
+
+        Return:
+            The part, the time it took to run the job and the trace of the
+            job.
+        """
+
+        call, part, kwargs = task
+
+        if self._log_level is not None:
+            utils_trace.configure_logging(self._log_level)
+
+        tracer = utils_trace.start_trace(call.lstrip("_"))
+
+        t = time.time()
+        getattr(self, call)(**kwargs)
+
+        return part, time.time() - t, tracer.to_dict()
+
     def generate_raw_path(self, base_dir):
         dirname = base_dir
         filename = "{prefix}_" + "{}.h5".format(self._run_id)
@@ -134,49 +312,150 @@ class Analyse(object):
         # define output files
         out_dir, out_file_name = self.generate_gather_path(self._out_base_dir)
 
-        for job_set in self._job_sets:
-            jobs = []
-            for p in job_set:
-                col_start = p * self._n_cols
-                col_stop = (p+1) * self._n_cols - 1
-
-                out_fname = out_file_name.format(col_start=col_start,
-                                                 col_stop=col_stop)
-                # doing the join here and outside of loop because if out_dir
-                # contains a placeholder it will not work otherwise
-                out_fname = os.path.join(out_dir, out_fname)
-
-#                if os.path.exists(out_f):
-#                    print("output filename = {}".format(out_f))
-#                    print("WARNING: output file already exist. "
-#                          "Skipping gather.")
-#                else:
-                if self._create_outdir:
-                    utils.create_dir(out_dir)
-
-                kwargs = dict(
-                    input=self._in_base_dir,
-                    in_fname=in_fname,
-                    output=self._out_base_dir,
-                    out_fname=out_fname,
-                    meta_fname=meta_fname,
-                    run=self._run_id,
-                    n_rows=self._n_rows,
-                    n_cols=self._n_cols,
-                    part=p,
-                    method_properties=self._method_properties
-                )
-
-                proc = multiprocessing.Process(target=self._call_gather,
-                                               kwargs=kwargs)
-                jobs.append(proc)
-                proc.start()
-
-            for job in jobs:
-                job.join()
+        jobs = []
+        for p in range(self._n_parts):
+            col_start = p * self._n_cols
+            col_stop = (p+1) * self._n_cols - 1
+
+            out_fname = out_file_name.format(col_start=col_start,
+                                             col_stop=col_stop)
+            # doing the join here and outside of loop because if out_dir
+            # contains a placeholder it will not work otherwise
+            out_fname = os.path.join(out_dir, out_fname)
+
+#            if os.path.exists(out_f):
+#                print("output filename = {}".format(out_f))
+#                print("WARNING: output file already exist. "
+#                      "Skipping gather.")
+#            else:
+            if self._create_outdir:
+                utils.create_dir(out_dir)
+
+            kwargs = dict(
+                input=self._in_base_dir,
+                in_fname=in_fname,
+                output=self._out_base_dir,
+                out_fname=out_fname,
+                meta_fname=meta_fname,
+                run=self._run_id,
+                n_rows=self._n_rows,
+                n_cols=self._n_cols,
+                part=p,
+                method_properties=self._method_properties,
+                storage=self._storage
+            )
+
+            jobs.append((p,
+                         kwargs,
+                         self._get_raw_fnames(in_fname, meta_fname),
+                         out_fname))
+
+        if (self._method_properties
+                and self._method_properties.get("read_once", False)):
+            # read every raw file once for all parts
+            merge_jobs = self._merge_gather_jobs
+        else:
+            merge_jobs = None
+
+        self._run_cached_jobs(call="_call_gather",
+                              jobs=jobs,
+                              merge_jobs=merge_jobs)
+
+        if self._measurement == "adccal":
+            with utils_trace.span("combine"):
+                self._write_gather_master(out_dir, out_file_name)
+
+    def _write_gather_master(self, out_dir, out_file_name):
+        """Writes a file combining all gathered column parts.
+
+        The file contains virtual datasets of the full sensor which refer
+        to the data in the part files (nothing is copied). It is named like
+        a part covering all columns with the suffix "_master", to not be
+        mistaken for a part gathered in one go.
+
+        Args:
+            out_dir (str): The directory containing the gathered files.
+            out_file_name (str): The file name template of the parts.
+        """
+
+        if self._n_parts < 2:
+            # the only part covers the full sensor already
+            return
+
+        part_fnames = []
+        offsets = []
+        widths = []
+        for p in range(self._n_parts):
+            col_start = p * self._n_cols
+            col_stop = (p+1) * self._n_cols - 1
+
+            fname = os.path.join(out_dir,
+                                 out_file_name.format(col_start=col_start,
+                                                      col_stop=col_stop))
+            if not os.path.exists(fname):
+                print("Gathered file {} not found, it is missing in the "
+                      "combined file.".format(fname))
+                continue
+
+            # the columns are taken from the file itself
+            with h5py.File(fname, "r") as f:
+                cols_used = f["collection/colums_used"][()]
+
+            part_fnames.append(fname)
+            offsets.append(int(cols_used[0]))
+            widths.append(int(cols_used[1] - cols_used[0]))
+
+        if not part_fnames:
+            return
+
+        master_fname = os.path.join(
+            out_dir,
+            get_master_fname(
+                out_file_name.format(col_start=0,
+                                     col_stop=self._n_cols_total - 1)
+            )
+        )
+        print("Write combined file", master_fname)
+
+        create_virtual_file(
+            out_fname=master_fname,
+            part_fnames=part_fnames,
+            offsets=offsets,
+            widths=widths,
+            axis=1,
+            metadata={
+                "collection/colums_used": [0, self._n_cols_total],
+                "collection/parts/colums_used": [[o, o + w] for o, w
+                                                 in zip(offsets, widths)],
+                "collection/parts/fnames": [os.path.basename(f).encode()
+                                            for f in part_fnames]
+            }
+        )
+
+    def _merge_gather_jobs(self, jobs):
+        """Combines the gather jobs into one which gathers all parts.
+
+        Args:
+            jobs (list): A list of (part, kwargs) of the single gather jobs.
+
+        Return:
+            A list containing the combined job.
+        """
+
+        part, kwargs = jobs[0]
+
+        kwargs = dict(kwargs)
+        kwargs["parts"] = [(p, kw["out_fname"]) for p, kw in jobs]
+
+        return [(part, kwargs)]
 
     def _call_gather(self, **kwargs):
+        gather_m = self._load_gather_method()
 
+        obj = gather_m(**kwargs)
+        obj.run()
+
+    def _load_gather_method(self):
         if self._measurement == "adccal":
             if ADCCAL_GATHER_METHOD_DIR not in sys.path:
                 sys.path.insert(0, ADCCAL_GATHER_METHOD_DIR)
@@ -186,10 +465,7 @@ class Analyse(object):
         else:
             print("Unsupported type.")
 
-        gather_m = __import__(self._method).Gather
-
-        obj = gather_m(**kwargs)
-        obj.run()
+        return __import__(self._method).Gather
 
     def run_process(self):
         # define input files
@@ -199,60 +475,163 @@ class Analyse(object):
         # define output files
         out_dir, out_file_name = self.generate_process_path(self._out_base_dir)
 
-        for job_set in self._job_sets:
-            jobs = []
-            for p in job_set:
-                col_start = p * self._n_cols
-                col_stop = (p+1) * self._n_cols - 1
-
-                in_fname = in_file_name.format(col_start=col_start,
-                                               col_stop=col_stop)
-                # doing the join here and outside of loop because if in_dir
-                # contains a placeholder it will not work otherwise
-                in_fname = os.path.join(in_dir, in_fname)
-
-                out_fname = out_file_name.format(col_start=col_start,
-                                                 col_stop=col_stop)
-                # doing the join here and outside of loop because if out_dir
-                # contains a placeholder it will not work otherwise
-                out_fname = os.path.join(out_dir, out_fname)
-
-#                if os.path.exists(out_f):
-#                    print("output filename = {}".format(out_f))
-#                    print("WARNING: output file already exist. "
-#                          "Skipping process.")
-#                else:
-                if self._create_outdir:
-                    utils.create_dir(out_dir)
-
-                kwargs = dict(
-                    in_fname=in_fname,
-                    in_dir=self._in_base_dir,
-                    out_fname=out_fname,
-                    run=self._run_id,
-                    method=self._method,
-                    method_properties=self._method_properties
-                )
-
-                proc = multiprocessing.Process(target=self._call_process,
-                                               kwargs=kwargs)
-                jobs.append(proc)
-                proc.start()
-
-            for job in jobs:
-                job.join()
+        jobs = []
+        for p in range(self._n_parts):
+            col_start = p * self._n_cols
+            col_stop = (p+1) * self._n_cols - 1
+
+            in_fname = in_file_name.format(col_start=col_start,
+                                           col_stop=col_stop)
+            # doing the join here and outside of loop because if in_dir
+            # contains a placeholder it will not work otherwise
+            in_fname = os.path.join(in_dir, in_fname)
+
+            out_fname = out_file_name.format(col_start=col_start,
+                                             col_stop=col_stop)
+            # doing the join here and outside of loop because if out_dir
+            # contains a placeholder it will not work otherwise
+            out_fname = os.path.join(out_dir, out_fname)
+
+#            if os.path.exists(out_f):
+#                print("output filename = {}".format(out_f))
+#                print("WARNING: output file already exist. "
+#                      "Skipping process.")
+#            else:
+            if self._create_outdir:
+                utils.create_dir(out_dir)
+
+            kwargs = dict(
+                in_fname=in_fname,
+                in_dir=self._in_base_dir,
+                out_fname=out_fname,
+                run=self._run_id,
+                method=self._method,
+                method_properties=self._method_properties,
+                storage=self._storage
+            )
+
+            jobs.append((p, kwargs, [in_fname], out_fname))
+
+        self._run_cached_jobs(call="_call_process", jobs=jobs)
 
     def _call_process(self, **kwargs):
+        process_m = self._load_process_method(self._method)
+
+        obj = process_m(**kwargs)
+        obj.run()
+
+    def _load_process_method(self, method):
         if self._measurement == "adccal":
-            if ADCCAL_PROCESS_METHOD_DIR not in sys.path:
-                sys.path.insert(0, ADCCAL_PROCESS_METHOD_DIR)
-        elif self.measurement == "ptccal":
+            # the process modules rely on these paths being set, which is
+            # not the case if another "__init__" module was imported before
+            # (e.g. the one of the gather methods)
+            for path in [PROCESS_DIR,
+                         ADCCAL_PROCESS_DIR,
+                         ADCCAL_PROCESS_METHOD_DIR]:
+                if path not in sys.path:
+                    sys.path.insert(0, path)
+        elif self._measurement == "ptccal":
             if PTCCAL_PROCESS_METHOD_DIR not in sys.path:
                 sys.path.insert(0, PTCCAL_PROCESS_METHOD_DIR)
 
-        process_m = __import__(self._method).Process
+        return __import__(method).Process
 
-        obj = process_m(**kwargs)
+    def run_all(self):
+        """Gathers and processes each column part within one job.
+
+        The gathered data is handed over to the process method in memory.
+        Writing it into the gathered directory is only done if save_gathered
+        is enabled (e.g. for debugging), the process method then reads it
+        from the written file.
+        """
+        # define input files
+        in_dir, in_file_name = self.generate_raw_path(self._in_base_dir)
+        in_fname = os.path.join(in_dir, in_file_name)
+
+        # define metadata file
+        meta_dir, meta_file_name = (
+            self.generate_metadata_path(self._in_base_dir)
+        )
+        meta_fname = os.path.join(meta_dir, meta_file_name)
+
+        # define gathered files (only written if save_gathered is set)
+        gather_base_dir = os.path.join(self._out_base_dir, "gathered")
+        gather_dir, gather_file_name = (
+            self.generate_gather_path(gather_base_dir)
+        )
+
+        # define output files
+        out_dir, out_file_name = self.generate_process_path(
+            os.path.join(self._out_base_dir, "processed")
+        )
+        utils.create_dir(out_dir)
+
+        raw_fnames = self._get_raw_fnames(in_fname, meta_fname)
+
+        jobs = []
+        for p in range(self._n_parts):
+            col_start = p * self._n_cols
+            col_stop = (p+1) * self._n_cols - 1
+
+            gather_fname = gather_file_name.format(col_start=col_start,
+                                                   col_stop=col_stop)
+            gather_fname = os.path.join(gather_dir, gather_fname)
+
+            out_fname = out_file_name.format(col_start=col_start,
+                                             col_stop=col_stop)
+            out_fname = os.path.join(out_dir, out_fname)
+
+            gather_kwargs = dict(
+                input=self._in_base_dir,
+                in_fname=in_fname,
+                output=gather_base_dir,
+                out_fname=gather_fname,
+                meta_fname=meta_fname,
+                run=self._run_id,
+                n_rows=self._n_rows,
+                n_cols=self._n_cols,
+                part=p,
+                method_properties=self._method_properties,
+                storage=self._storage
+            )
+
+            process_kwargs = dict(
+                in_fname=gather_fname,
+                in_dir=self._in_base_dir,
+                out_fname=out_fname,
+                run=self._run_id,
+                method=self._process_method,
+                method_properties=self._process_method_properties,
+                storage=self._storage
+            )
+
+            jobs.append((p,
+                         dict(gather_kwargs=gather_kwargs,
+                              process_kwargs=process_kwargs),
+                         raw_fnames,
+                         out_fname))
+
+        self._run_cached_jobs(call="_call_all", jobs=jobs)
+
+        if self._save_gathered and self._measurement == "adccal":
+            with utils_trace.span("combine"):
+                self._write_gather_master(gather_dir, gather_file_name)
+
+    def _call_all(self, gather_kwargs, process_kwargs):
+        gather_m = self._load_gather_method()
+        process_m = self._load_process_method(self._process_method)
+
+        gather_obj = gather_m(**gather_kwargs)
+        gather_obj.run(write_data=self._save_gathered)
+
+        if self._save_gathered:
+            # the gather method may write the data directly into the file
+            # without keeping it in memory, thus it is read from there
+            in_data = None
+        else:
+            in_data = gather_obj.get_data()
+
+        obj = process_m(in_data=in_data, **process_kwargs)
         obj.run()
 
     def cleanup(self):
@@ -286,7 +665,7 @@ def get_arguments():
     parser.add_argument("-t", "--type",
                         dest="run_type",
                         type=str,
-                        help="Run type: gather, process")
+                        help="Run type: gather, process, all")
     parser.add_argument("--n_cols",
                         help="The number of columns to be used for splitting "
                              "into subsets (to use all, set n_cols to None)")
@@ -298,6 +677,10 @@ def get_arguments():
                         type=str,
                         default="file.dat",
                         help="File name containing metadata info to use.")
+    parser.add_argument("--invalidate_cache",
+                        action="store_true",
+                        help="Recompute the results even if they are found "
+                             "in the cache.")
 
     args = parser.parse_args()
 
@@ -387,15 +770,27 @@ def insert_args_into_config(args, config):
             raise Exception("No output specified. Abort.")
             sys.exit(1)
 
-    try:
-        c_run_type["method"] = args.method or c_run_type["method"]
-    except KeyError:
-        raise Exception("No method type specified. Abort.")
-        sys.exit(1)
+    if run_type == "all":
+        # the methods are taken from the run type specific configs
+        if args.method:
+            raise Exception("For run type all the methods have to be "
+                            "specified in the config. Abort.")
+            sys.exit(1)
+
+        method_configs = [config["gather"], config["process"]]
+    else:
+        method_configs = [c_run_type]
+
+    for c_method in method_configs:
+        try:
+            c_method["method"] = args.method or c_method["method"]
+        except KeyError:
+            raise Exception("No method type specified. Abort.")
+            sys.exit(1)
 
-    # method specific config
-    if c_run_type["method"] not in c_run_type:
-        c_run_type[c_run_type["method"]] = None
+        # method specific config
+        if c_method["method"] not in c_method:
+            c_method[c_method["method"]] = None
 
 
 if __name__ == "__main__":
@@ -421,12 +816,51 @@ if __name__ == "__main__":
 
     out_base_dir = config[run_type]["output"]
     in_base_dir = config[run_type]["input"]
-    method = config[run_type]["method"]
-    method_properties = config[run_type][method]
-    metadata_file = config[run_type]["metadata_fname"]
+
+    process_method = None
+    process_method_properties = None
+    save_gathered = False
+    if run_type == "all":
+        method = config["gather"]["method"]
+        method_properties = config["gather"][method]
+        metadata_file = config["gather"]["metadata_fname"]
+
+        process_method = config["process"]["method"]
+        process_method_properties = config["process"][process_method]
+
+        # writing the gathered data is only needed for debugging
+        save_gathered = config["all"].get("save_gathered", False)
+    else:
+        method = config[run_type]["method"]
+        method_properties = config[run_type][method]
+        metadata_file = config[run_type]["metadata_fname"]
+
+    # optional cache for the results
+    c_cache = config["general"].get("cache", None)
+    if c_cache is None:
+        cache = None
+    else:
+        cache_dir = (c_cache.get("dir", None)
+                     or os.path.join(out_base_dir, "cache"))
+        cache = ResultCache(cache_dir=cache_dir,
+                            budget_gb=c_cache.get("budget_gb", None),
+                            digest=c_cache.get("digest", "stat"))
+
+    # optional chunking and compression of the output files
+    storage = config["general"].get("storage", None)
+
+    # optional json trace with timings, counters and peak memory
+    trace_fname = config["general"].get("trace", None)
+
+    log_level = config["general"].get("log_level", None)
+    if log_level is not None:
+        utils_trace.configure_logging(log_level)
 
     # generate file paths
-    if run_type == "gather":
+    if run_type == "all":
+        out_base_dir = os.path.join(out_base_dir, run_id)
+        create_outdir = True
+    elif run_type == "gather":
         in_base_dir = in_base_dir
         # to allow additional directories for descramble
 #        out_base_dir = os.path.join(out_base_dir, run_id, "{run_dir}")
@@ -447,5 +881,13 @@ if __name__ == "__main__":
                   method=method,
                   method_properties=method_properties,
                   n_processes=n_processes,
-                  metadata_fname=metadata_file)
+                  metadata_fname=metadata_file,
+                  process_method=process_method,
+                  process_method_properties=process_method_properties,
+                  save_gathered=save_gathered,
+                  cache=cache,
+                  invalidate_cache=args.invalidate_cache,
+                  storage=storage,
+                  trace_fname=trace_fname,
+                  log_level=log_level)
     obj.run()
@@ -19,6 +19,7 @@ if GATHER_DIR not in sys.path:
     sys.path.insert(0, GATHER_DIR)
 
 from gather_base import GatherBase
+import utils  # noqa E402
 
 
 class GatherAdcBase(GatherBase):
@@ -52,6 +53,8 @@ class GatherAdcBase(GatherBase):
 
         self._metadata = {
             "n_frames_per_run": self._n_frames_per_run,
+            # runs can have different numbers of frames
+            "frame_offsets": utils.get_frame_offsets(self._n_frames_per_run),
             "n_frames": self._n_frames,
             "n_runs": self._n_runs,
             "n_adc": self. _n_adc,
@@ -63,35 +66,37 @@ class GatherAdcBase(GatherBase):
                                self._n_rows,
                                self._n_cols)
 
+        # the pixel data is allocated by the gather methods (in the layout
+        # they load it in or as datasets in the output file)
         self._data_to_write = {
             "s_coarse": {
                 "path": "sample/coarse",
-                "data": np.zeros(self._raw_tmp_shape, dtype=np.uint8),
+                "data": None,
                 "type": np.uint8
             },
             "s_fine": {
                 "path": "sample/fine",
-                "data": np.zeros(self._raw_tmp_shape, dtype=np.uint8),
+                "data": None,
                 "type": np.uint8
             },
             "s_gain": {
                 "path": "sample/gain",
-                "data": np.zeros(self._raw_tmp_shape, dtype=np.uint8),
+                "data": None,
                 "type": np.uint8
             },
             "r_coarse": {
                 "path": "reset/coarse",
-                "data": np.zeros(self._raw_tmp_shape, dtype=np.uint8),
+                "data": None,
                 "type": np.uint8
             },
             "r_fine": {
                 "path": "reset/fine",
-                "data": np.zeros(self._raw_tmp_shape, dtype=np.uint8),
+                "data": None,
                 "type": np.uint8
             },
             "r_gain": {
                 "path": "reset/gain",
-                "data": np.zeros(self._raw_tmp_shape, dtype=np.uint8),
+                "data": None,
                 "type": np.uint8
             },
             "vin": {
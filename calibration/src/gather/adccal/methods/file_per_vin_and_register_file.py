@@ -2,18 +2,34 @@
 Takes one file per Vin plus an additional register file as input and gathers
 in into the default format.
 """
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import os
+import time
 import h5py
 import numpy as np
 
 import __init__
 from gather_adccal_base import GatherAdcBase
 import utils
+from utils_manifest import get_manifest
+import utils_trace
+
+log = utils_trace.get_logger(__name__)
 
 
 class Gather(GatherAdcBase):
     """Converts the input file(s) into the standard gathered format.
     """
-    def __init__(self, **kwargs):
+    def __init__(self, parts=None, **kwargs):
+        """
+        Args:
+            parts (optional): The column parts to gather at once as list of
+                              (part, out_fname). Each Vin file is then read
+                              only once for all of them. If not set only the
+                              part given by "part" is gathered.
+        """
         super().__init__(**kwargs)
 
         # if this is not set to "gathererd" later processing will not work
@@ -25,6 +41,46 @@ class Gather(GatherAdcBase):
         self._transpose_order = None
         self._register = None
         self._n_frames_per_run = None
+        self._frame_offsets = None
+
+        # how many Vin files are read ahead while the current one is
+        # decoded, at most (prefetch_depth + 1) Vin blocks are held in
+        # memory at once (0 disables prefetching)
+        try:
+            self._prefetch_depth = self._method_properties["prefetch_depth"]
+        except (KeyError, TypeError):
+            self._prefetch_depth = 2
+
+        if parts is None:
+            self._parts = [(self._part, self._out_fname)]
+        else:
+            self._parts = parts
+
+        # data to write and metadata of every part
+        self._part_data = None
+
+        # the datasets which are stored in the processing layout
+        # (n_adc, n_cols, n_frames, n_groups)
+        self._pixel_keys = ["s_coarse", "s_fine", "s_gain",
+                            "r_coarse", "r_fine", "r_gain"]
+
+        # write the data into the output files while loading it instead of
+        # keeping all of it in memory
+        self._write_directly = True
+
+    def run(self, write_data=True):
+        """Run the gather method
+
+        Args:
+            write_data (optional): If the gathered data should be written
+                                   into the output file. If set, every Vin
+                                   block is written directly after
+                                   decoding it.
+        """
+
+        self._write_directly = write_data
+
+        super().run(write_data=write_data)
 
     def initiate(self):
         """Sets up the method attributes.
@@ -45,17 +101,8 @@ class Gather(GatherAdcBase):
 
         self._n_frames = np.sum(self._n_frames_per_run)
 
-        # self._data_to_write is predefined in GatherAdcBase to have one
-        # format to be used in processing
-        # it has the entries:
-        #    "s_coarse" - np.array of shape (n_frames, n_rows, n_cols)
-        #    "s_fine" - np.array of shape (n_frames, n_rows, n_cols)
-        #    "s_gain" - np.array of shape (n_frames, n_rows, n_cols)
-        #    "r_coarse" - np.array of shape (n_frames, n_rows, n_cols)
-        #    "r_fine" - np.array of shape (n_frames, n_rows, n_cols)
-        #    "r_gain" - np.array of shape (n_frames, n_rows, n_cols)
-        #    "vin" - np.array of shape (n_runs)
-        self._set_data_to_write()
+        # where the frames of each Vin start in the gathered data
+        self._frame_offsets = utils.get_frame_offsets(self._n_frames_per_run)
 
         self._raw_shape = (-1,
                            self._n_rows_per_group,
@@ -67,116 +114,310 @@ class Gather(GatherAdcBase):
         # (n_rows, n_cols, n_frames, n_groups)
         self._transpose_order = (2, 3, 0, 1)
 
+        # self._data_to_write is predefined in GatherAdcBase to have one
+        # format to be used in processing
+        # it has the entries:
+        #    "s_coarse" - data of shape (n_adc, n_cols, n_frames, n_groups)
+        #    "s_fine" - data of shape (n_adc, n_cols, n_frames, n_groups)
+        #    "s_gain" - data of shape (n_adc, n_cols, n_frames, n_groups)
+        #    "r_coarse" - data of shape (n_adc, n_cols, n_frames, n_groups)
+        #    "r_fine" - data of shape (n_adc, n_cols, n_frames, n_groups)
+        #    "r_gain" - data of shape (n_adc, n_cols, n_frames, n_groups)
+        #    "vin" - np.array of shape (n_runs)
+        # where the data is either a numpy array or the dataset in the
+        # output file (if written directly)
+        self._set_part_data()
+
     def _read_register(self):
         print("meta_fname", self._meta_fname)
 
-        with open(self._meta_fname, "r") as metafile:
-            file_content = metafile.read().splitlines()
-
         # data looks like this: <V_in>  <file_prefix>
-        file_content = [s.split("\t") for s in file_content]
-        for i, string in enumerate(file_content):
-            try:
-                string[0] = float(string[0])
-            except ValueError:
-                if string == ['']:
-                    # remove empty lines
-                    del file_content[i]
-                else:
-                    raise
-#                print("file_content", file_content)
-
-        self._register = sorted(file_content)
+        manifest = get_manifest(os.path.dirname(self._meta_fname))
+        self._register = manifest.get_register(self._meta_fname)
+        manifest.save()
 
     def _set_n_frames_per_run(self):
         self._n_frames_per_run = []
 
+        # the shapes are taken from the manifest, thus the files are only
+        # opened if they are new or changed
+        manifest = get_manifest(os.path.dirname(self._in_fname))
+
         for i in self._register:
             in_fname = self._in_fname.format(prefix=i[1])
 
             try:
-                with h5py.File(in_fname, "r") as infile:
-                    n_frames = infile[self._paths["sample"]].shape[0]
-                    self._n_frames_per_run.append(n_frames)
+                shape = manifest.get_shape(in_fname, self._paths["sample"])
+                self._n_frames_per_run.append(shape[0])
             except OSError:
                 print("in_fname", in_fname)
                 raise
 
-    def _load_data(self):
-        # for convenience
-        s_coarse = self._data_to_write["s_coarse"]["data"]
-        s_fine = self._data_to_write["s_fine"]["data"]
-        s_gain = self._data_to_write["s_gain"]["data"]
+        manifest.save()
+
+    def _read_vin_file(self, prefix, idx):
+        """Reads the sample and reset slice of one Vin file.
+
+        Args:
+            prefix (str): The file prefix of the Vin.
+            idx (tuple): The slice to read.
+
+        Return:
+            The file name, sample and reset data and the time the reading
+            took.
+        """
+
+        t = time.time()
+
+        in_fname = self._in_fname.format(prefix=prefix)
+        with h5py.File(in_fname, "r") as in_f:
+            in_sample = in_f[self._paths["sample"]][idx]
+            in_reset = in_f[self._paths["reset"]][idx]
+
+        return in_fname, in_sample, in_reset, time.time() - t
+
+    def _iterate_vin_files(self, idx):
+        """Reads the Vin files in register order.
+
+        The next prefetch_depth files are read in background threads while
+        the current one is processed, thus reading and decoding overlap.
+
+        Args:
+            idx (tuple): The slice to read from each file.
+
+        Return:
+            A generator yielding the same as _read_vin_file for each entry
+            of the register.
+        """
+
+        if self._prefetch_depth <= 0:
+            for _, prefix in self._register:
+                yield self._read_vin_file(prefix, idx)
+            return
 
-        r_coarse = self._data_to_write["r_coarse"]["data"]
-        r_fine = self._data_to_write["r_fine"]["data"]
-        r_gain = self._data_to_write["r_gain"]["data"]
+        prefixes = deque(prefix for _, prefix in self._register)
 
-        vin = self._data_to_write["vin"]["data"]
+        with ThreadPoolExecutor(max_workers=self._prefetch_depth) as executor:
+            pending = deque()
+            while prefixes and len(pending) < self._prefetch_depth:
+                pending.append(executor.submit(self._read_vin_file,
+                                               prefixes.popleft(),
+                                               idx))
+
+            while pending:
+                result = pending.popleft().result()
+
+                # keep the queue filled while the current file is processed
+                if prefixes:
+                    pending.append(executor.submit(self._read_vin_file,
+                                                   prefixes.popleft(),
+                                                   idx))
+
+                yield result
+
+    def _set_part_data(self):
+        """Sets up the data to write for every part.
+        """
+
+        self._part_data = []
+        for part, out_fname in self._parts:
+            self._part = part
+            self._set_data_to_write()
+
+            # the blocks are placed in the processing layout when loading
+            for key in self._pixel_keys:
+                # the data is read as time series per pixel, one chunk holds
+                # the frames of one Vin to have them written at once
+                self._data_to_write[key]["access"] = "time_series"
+                self._data_to_write[key]["frame_axis"] = 2
+                self._data_to_write[key]["frames_per_chunk"] = int(
+                    np.max(self._n_frames_per_run)
+                )
+
+                if self._write_directly:
+                    # the datasets are created when opening the output file
+                    self._data_to_write[key]["data"] = None
+                else:
+                    self._data_to_write[key]["data"] = np.zeros(
+                        self._get_layout_shape(),
+                        dtype=self._data_to_write[key]["type"]
+                    )
+
+            self._part_data.append({
+                "part": part,
+                "out_fname": out_fname,
+                "data_to_write": self._data_to_write,
+                "metadata": self._metadata
+            })
+
+        self._select_part(self._part_data[0])
+
+    def _select_part(self, part_data):
+        """Makes a part the current one (e.g. for writing).
+        """
+
+        self._part = part_data["part"]
+        self._out_fname = part_data["out_fname"]
+        self._data_to_write = part_data["data_to_write"]
+        self._metadata = part_data["metadata"]
+
+    def _get_layout_shape(self):
+        return (self._n_adc,
+                self._n_cols,
+                self._n_frames,
+                self._n_rows_per_group)
+
+    def _get_col_slice(self, part):
+        return slice(part * self._n_cols, (part + 1) * self._n_cols)
+
+    def _load_data(self):
+        col_slices = [self._get_col_slice(part_data["part"])
+                      for part_data in self._part_data]
 
         #  split the raw data in slices to handle the size
         load_idx_rows = slice(0, self._n_rows)
-        load_idx_cols = slice(self._part * self._n_cols,
-                              (self._part + 1) * self._n_cols)
+        load_idx_cols = slice(min(c.start for c in col_slices),
+                              max(c.stop for c in col_slices))
         idx = (Ellipsis, load_idx_rows, load_idx_cols)
 
-        for i, (vin_value, prefix) in enumerate(self._register):
-            in_fname = self._in_fname.format(prefix=prefix)
-
-            # read in data for this slice
-            print("in_fname", in_fname)
-            with h5py.File(in_fname, "r") as in_f:
-                in_sample = in_f[self._paths["sample"]][idx]
-                in_reset = in_f[self._paths["reset"]][idx]
-
-            # determine where this data block should go in the result
-            # matrix
-            start = i * self._n_frames_per_run[i]
-            stop = (i + 1) * self._n_frames_per_run[i]
-            t_idx = slice(start, stop)
-            print("Getting frames {} to {} of {}"
-                  .format(start, stop, s_coarse.shape[0]))
-
-            # split the 16 bit into coarse, fine and gain
-            # and set them on the correct position in the result matrix
-            coarse, fine, gain = utils.split(in_sample)
-            s_coarse[t_idx, Ellipsis] = coarse
-            s_fine[t_idx, Ellipsis] = fine
-            s_gain[t_idx, Ellipsis] = gain
-
-            coarse, fine, gain = utils.split(in_reset)
-            r_coarse[t_idx, Ellipsis] = coarse
-            r_fine[t_idx, Ellipsis] = fine
-            r_gain[t_idx, Ellipsis] = gain
-
-            vin[i] = vin_value
-
-        # split the rows into ADC groups
-        print(s_coarse.shape)
-        s_coarse.shape = self._raw_shape
-        s_fine.shape = self._raw_shape
-        s_gain.shape = self._raw_shape
-
-        r_coarse.shape = self._raw_shape
-        r_fine.shape = self._raw_shape
-        r_gain.shape = self._raw_shape
-        print(s_coarse.shape)
-
-        # optimize memory layout for further processing
-        s_coarse = s_coarse.transpose(self._transpose_order)
-        s_fine = s_fine.transpose(self._transpose_order)
-        s_gain = s_gain.transpose(self._transpose_order)
-
-        r_coarse = r_coarse.transpose(self._transpose_order)
-        r_fine = r_fine.transpose(self._transpose_order)
-        r_gain = r_gain.transpose(self._transpose_order)
-        print(s_coarse.shape)
-
-        # the transpose is not done on the original arrays but creates a copy
-        self._data_to_write["s_coarse"]["data"] = s_coarse
-        self._data_to_write["s_fine"]["data"] = s_fine
-        self._data_to_write["s_gain"]["data"] = s_gain
-
-        self._data_to_write["r_coarse"]["data"] = r_coarse
-        self._data_to_write["r_fine"]["data"] = r_fine
-        self._data_to_write["r_gain"]["data"] = r_gain
+        # the columns of each part inside of the loaded data
+        col_slices = [slice(c.start - load_idx_cols.start,
+                            c.stop - load_idx_cols.start)
+                      for c in col_slices]
+
+        with contextlib.ExitStack() as stack:
+            if self._write_directly:
+                for part_data in self._part_data:
+                    self._open_output(part_data, stack)
+
+            vin_files = zip(self._register, self._iterate_vin_files(idx))
+            for i, ((vin_value, _), vin_file) in enumerate(vin_files):
+                # read in data for this slice
+                in_fname, in_sample, in_reset, read_time = vin_file
+                t = time.time()
+
+                utils_trace.add_count("bytes_read",
+                                      in_sample.nbytes + in_reset.nbytes)
+                utils_trace.add_count("frames_gathered", in_sample.shape[0])
+
+                # determine where this data block should go in the result
+                # matrix
+                start = self._frame_offsets[i]
+                stop = self._frame_offsets[i + 1]
+                t_idx = slice(start, stop)
+                log.info("Getting frames %s to %s of %s from %s",
+                         start, stop, self._n_frames, in_fname)
+
+                # split the 16 bit into coarse, fine and gain (once for all
+                # parts)
+                with utils_trace.span("split"):
+                    sample = utils.split(in_sample)
+                    reset = utils.split(in_reset)
+
+                # and set them on the correct position in the result matrix
+                # (if written directly, this includes writing the block)
+                with utils_trace.span("transpose"):
+                    for part_data, col_slice in zip(self._part_data,
+                                                    col_slices):
+                        data_to_write = part_data["data_to_write"]
+                        self._place_vin_block(data_to_write=data_to_write,
+                                              t_idx=t_idx,
+                                              col_slice=col_slice,
+                                              sample=sample,
+                                              reset=reset)
+                        data_to_write["vin"]["data"][i] = vin_value
+
+                log.debug("Read took %.3f s, decode took %.3f s",
+                          read_time, time.time() - t)
+
+            if self._write_directly:
+                for part_data in self._part_data:
+                    self._close_output(part_data)
+
+        if self._write_directly:
+            for part_data in self._part_data:
+                utils_trace.add_file_size("bytes_written",
+                                          part_data["out_fname"])
+
+        self._select_part(self._part_data[0])
+
+    def _open_output(self, part_data, stack):
+        """Opens the output file of a part and creates the datasets to place
+        the Vin blocks in.
+
+        Args:
+            part_data (dict): The part to open the output file for.
+            stack: The ExitStack the file is closed with.
+        """
+
+        print("Output: ", part_data["out_fname"])
+        out_f = stack.enter_context(
+            self._storage_policy.open_file(part_data["out_fname"])
+        )
+        part_data["out_file"] = out_f
+
+        for key in self._pixel_keys:
+            dset = part_data["data_to_write"][key]
+            dset["data"] = self._create_dataset(
+                out_f, dset, shape=self._get_layout_shape()
+            )
+
+    def _close_output(self, part_data):
+        """Adds the remaining datasets and metadata to the output file of a
+        part.
+
+        Args:
+            part_data (dict): The part to finish the output file for.
+        """
+
+        self._select_part(part_data)
+        print("Start saving at {} ... ".format(self._out_fname), end="")
+
+        out_f = part_data.pop("out_file")
+
+        vin = self._data_to_write["vin"]
+        self._create_dataset(out_f, vin, data=vin["data"])
+
+        self._write_metadata(out_f)
+
+        out_f.flush()
+
+        # the datasets are not usable after closing the file
+        for key in self._pixel_keys:
+            self._data_to_write[key]["data"] = None
+
+        print("Done.")
+
+    def _place_vin_block(self, data_to_write, t_idx, col_slice, sample,
+                         reset):
+        """Puts the split data of one Vin into the result matrix.
+
+        The block is converted into the processing layout
+        (n_adc, n_cols, n_frames, n_groups) and placed into its frames.
+
+        Args:
+            data_to_write (dict): The data to write of a part.
+            t_idx (slice): The frames of this Vin.
+            col_slice (slice): The columns of the part in the split data.
+            sample (tuple): The coarse, fine and gain data of the sample.
+            reset (tuple): The coarse, fine and gain data of the reset.
+        """
+
+        for prefix, split_data in [("s", sample), ("r", reset)]:
+            for key, value in zip(["coarse", "fine", "gain"], split_data):
+                # split the rows into ADC groups and optimize memory layout
+                # for further processing
+                block = value[..., col_slice].reshape(self._raw_shape)
+                block = block.transpose(self._transpose_order)
+
+                data = data_to_write["{}_{}".format(prefix, key)]["data"]
+                data[:, :, t_idx, :] = block
+
+    def _write_data(self):
+        if self._write_directly:
+            # already done while loading the data
+            return
+
+        for part_data in self._part_data:
+            self._select_part(part_data)
+            super()._write_data()
@@ -4,6 +4,7 @@ import h5py
 
 import __init__
 from _version import __version__
+import descramble_spec
 
 class DescrambleBase():
     """Descramble base class.
@@ -13,10 +14,17 @@ class DescrambleBase():
         self._input = None
         self._output_fname = None
 
+        # layout of the scrambled data (see descramble_spec)
+        self._scrambling_spec = None
+        self._scrambling_cache_dir = None
+
         # add all entries of the kwargs dictionary into the class namespace
         for key, value in kwargs.items():
             setattr(self, "_" + key, value)
 
+        # files the descrambled images are appended to (see _open_outputs)
+        self._outputs = []
+
         self._data_to_write = {
             "sample": {
                 "path": "data",
@@ -41,6 +49,25 @@ class DescrambleBase():
         """
         pass
 
+    def _get_descrambler(self, image):
+        """Returns the descrambler for the configured scrambling spec.
+
+        Args:
+            image (str): Which image to descramble ("sample" or "reset").
+
+        Return:
+            The descramble_spec.Descrambler object.
+        """
+
+        if self._scrambling_spec is None:
+            raise Exception("No scrambling spec configured.")
+
+        return descramble_spec.get_descrambler(
+            name=self._scrambling_spec,
+            image=image,
+            cache_dir=self._scrambling_cache_dir
+        )
+
     def _write_data(self, output_fname=None):
         """Writes the data into a file.
 
@@ -79,6 +106,100 @@ class DescrambleBase():
 
             out_f.flush()
 
+    def _open_outputs(self, outputs):
+        """Prepares writing the descrambled images chunk by chunk.
+
+        Args:
+            outputs (list): For each output a tuple of the list of files
+                            (absolute path) to write and the number of images
+                            per file, e.g. ([output_fname], n_img) for a
+                            single file.
+        """
+
+        self._outputs = [{
+            "fnames": fnames,
+            "n_img_per_file": n_img_per_file,
+            "i_file": 0,
+            "n_written": 0,
+            "file": None
+        } for fnames, n_img_per_file in outputs]
+
+    def _append_to_outputs(self, sample, reset):
+        """Appends descrambled images to all outputs.
+
+        A chunk of images can span several files of an output.
+
+        Args:
+            sample: The sample images (n_img, n_rows, n_cols).
+            reset: The reset images (n_img, n_rows, n_cols).
+
+        Return:
+            A list of (file name, number of images) of the files completed.
+        """
+
+        completed = []
+        n_chunk = sample.shape[0]
+
+        for output in self._outputs:
+            i_chunk = 0
+            while i_chunk < n_chunk:
+                if output["file"] is None:
+                    fname = output["fnames"][output["i_file"]]
+                    output["file"] = h5py.File(fname, "w", libver='latest')
+                    output["file"].create_dataset("collection/version",
+                                                  data=__version__)
+
+                n_append = min(n_chunk - i_chunk,
+                               output["n_img_per_file"] - output["n_written"])
+                idx = slice(i_chunk, i_chunk + n_append)
+
+                self._append_dataset(output["file"],
+                                     self._data_to_write["sample"]["path"],
+                                     sample[idx])
+                self._append_dataset(output["file"],
+                                     self._data_to_write["reset"]["path"],
+                                     reset[idx])
+                # make the images available to readers early
+                output["file"].flush()
+
+                i_chunk += n_append
+                output["n_written"] += n_append
+
+                if output["n_written"] == output["n_img_per_file"]:
+                    output["file"].close()
+                    output["file"] = None
+
+                    completed.append((output["fnames"][output["i_file"]],
+                                      output["n_written"]))
+                    output["i_file"] += 1
+                    output["n_written"] = 0
+
+        return completed
+
+    def _close_outputs(self):
+        """Closes the files still open (e.g. after an error).
+        """
+
+        for output in self._outputs:
+            if output["file"] is not None:
+                output["file"].close()
+                output["file"] = None
+
+    @staticmethod
+    def _append_dataset(out_f, path, data):
+        # the dataset is extended image by image
+        if path not in out_f:
+            out_f.create_dataset(path,
+                                 shape=(0,) + data.shape[1:],
+                                 maxshape=(None,) + data.shape[1:],
+                                 chunks=(1,) + data.shape[1:],
+                                 dtype=data.dtype)
+
+        dset = out_f[path]
+        n_old = dset.shape[0]
+        dset.resize(n_old + data.shape[0], axis=0)
+        dset[n_old:] = data
+
     def get_data(self):
         """Return the descrambled data.
         """
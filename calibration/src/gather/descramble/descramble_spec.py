@@ -0,0 +1,398 @@
+"""Descrambling described by a layout spec instead of code.
+
+A spec (yaml file in calibration/conf/scrambling) describes how the words of
+one scrambled image have to be reordered to get the bit plane streams, how
+the values are encoded in these streams and how the decoded values have to
+be reordered to get the image:
+
+    input:
+        shape: [1484, 1408]      # shape of one scrambled image
+        byteswap: True           # the bytes of each word are swapped
+        missing_marker: 65535    # first word of a missing row group
+    missing_value: 65535         # value of pixels without data
+    words: [<steps>]             # input words => (n_grp, ..., n_words)
+    bitplanes:                   # see utils.decode_bitplanes
+        n_values: 224
+        n_bits: 15
+        payload_bits: 15
+        invert: True
+    pixels: [<steps>]            # decoded values => image
+    images:                      # additional steps per image (optional)
+        sample: [<steps>]
+        reset: [<steps>]
+
+A spec can extend another one (extends: <name>), overwriting its top level
+entries. The steps are applied to index arrays:
+
+    - reshape: <shape>
+    - transpose: <axes>
+    - flip: <axes>
+    - take: {axis: <axis>, index: <list of ints or [start, stop, step]>}
+    - pad: {axis: <axis>, before: <n>, after: <n>}  (adds missing entries)
+
+The spec is compiled once into flat index arrays (cached on disk), thus
+descrambling an image only takes the words, decodes the bit planes and takes
+the pixels into a preallocated output. Streams which are not used by any
+pixel of the image (e.g. the row groups of the other image if sample and
+reset are sent in one stream) are not decoded at all.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import __init__  # noqa F401
+import utils
+import utils_config
+
+SPEC_DIR = os.path.join(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.dirname(os.path.realpath(__file__))
+            )
+        )
+    ),
+    "conf",
+    "scrambling"
+)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"),
+                                 ".cache",
+                                 "percival",
+                                 "scrambling")
+
+# increase if the compiled format changes to invalidate the cache
+COMPILER_VERSION = 2
+
+IMAGES = ["sample", "reset"]
+
+_descramblers = {}
+
+
+def load_spec(name):
+    """Loads a layout spec including the ones it extends.
+
+    Args:
+        name (str): The name of the spec (file name in SPEC_DIR without
+                    suffix) or the path of a yaml file.
+
+    Return:
+        The spec as dictionary.
+    """
+
+    if os.path.isfile(name):
+        fname = name
+    else:
+        fname = os.path.join(SPEC_DIR, name + ".yaml")
+
+    if not os.path.isfile(fname):
+        raise Exception("Scrambling spec {} not found (looked in {})"
+                        .format(name, SPEC_DIR))
+
+    spec = utils_config.load_config(fname)
+
+    if "extends" in spec:
+        base = load_spec(spec.pop("extends"))
+        base.update(spec)
+        spec = base
+
+    return spec
+
+
+def _get_index(index):
+    result = []
+    for entry in index:
+        if isinstance(entry, list):
+            result += list(range(*entry))
+        else:
+            result.append(entry)
+
+    return np.array(result, dtype=np.intp)
+
+
+def apply_steps(array, steps):
+    """Applies the reorder steps of a spec to an (index) array.
+
+    Args:
+        array: The array to reorder.
+        steps (list): The steps (see module description). Entries added by
+                      pad are set to -1.
+
+    Return:
+        The reordered array.
+    """
+
+    for step in steps:
+        if len(step) != 1:
+            raise Exception("Each step needs exactly one operation (got {})"
+                            .format(step))
+
+        (operation, args), = step.items()
+
+        if operation == "reshape":
+            array = array.reshape(args)
+        elif operation == "transpose":
+            array = np.transpose(array, args)
+        elif operation == "flip":
+            for axis in args:
+                array = np.flip(array, axis)
+        elif operation == "take":
+            array = np.take(array, _get_index(args["index"]),
+                            axis=args["axis"])
+        elif operation == "pad":
+            pad_width = [(0, 0)] * array.ndim
+            pad_width[args["axis"]] = (args.get("before", 0),
+                                       args.get("after", 0))
+            array = np.pad(array, pad_width, mode="constant",
+                           constant_values=-1)
+        else:
+            raise Exception("Unsupported step {}".format(operation))
+
+    return array
+
+
+def compile_spec(spec, image="sample"):
+    """Compiles a spec into the index arrays needed to descramble.
+
+    Args:
+        spec (dict): The spec as returned by load_spec.
+        image (optional, str): For which image to compile (see IMAGES).
+
+    Return:
+        A dictionary with the entries:
+            "word_index": For each bit plane stream used by the image
+                          (n_streams, n_words) the flat index of the words in
+                          the scrambled image.
+            "pixel_index": For each pixel of the descrambled image the flat
+                           index of the decoded value (n_streams * n_values
+                           for pixels without data).
+            "group_check": For each row group the flat index of the word in
+                           the scrambled image marking missing packets.
+            "stream_group": For each stream the row group it belongs to.
+    """
+
+    if image not in IMAGES:
+        raise Exception("Unsupported image {} (supported are {})"
+                        .format(image, IMAGES))
+
+    bitplanes = spec["bitplanes"]
+    n_values = bitplanes["n_values"]
+
+    n_words_total = int(np.prod(spec["input"]["shape"]))
+    words = apply_steps(np.arange(n_words_total).reshape(
+        spec["input"]["shape"]), spec["words"])
+
+    if words.min() < 0:
+        raise Exception("Missing entries are only supported in the pixel "
+                        "steps")
+
+    n_groups = words.shape[0]
+    word_index = words.reshape(-1, words.shape[-1])
+    n_streams = word_index.shape[0]
+
+    # the first word of each row group
+    group_check = words.reshape(n_groups, -1)[:, 0]
+    stream_group = np.repeat(np.arange(n_groups), n_streams // n_groups)
+
+    values = np.arange(n_streams * n_values).reshape(
+        words.shape[:-1] + (n_values,))
+
+    steps = spec["pixels"] + spec.get("images", {}).get(image, [])
+    pixel_index = apply_steps(values, steps)
+
+    # only decode the streams the image is taken from
+    used = np.unique(pixel_index[pixel_index >= 0] // n_values)
+    if len(used) < n_streams:
+        word_index = word_index[used]
+        stream_group = stream_group[used]
+
+        stream = np.searchsorted(used, pixel_index // n_values)
+        pixel_index = np.where(pixel_index < 0,
+                               -1,
+                               stream * n_values + pixel_index % n_values)
+        n_streams = len(used)
+
+    # pixels without data point to the entry behind the decoded values
+    pixel_index = np.where(pixel_index < 0,
+                           n_streams * n_values,
+                           pixel_index)
+
+    return {
+        "word_index": word_index.astype(np.int32),
+        "pixel_index": pixel_index.astype(np.int32),
+        "group_check": group_check.astype(np.int32),
+        "stream_group": stream_group.astype(np.int32)
+    }
+
+
+def _get_spec_hash(spec, image):
+    content = json.dumps({"spec": spec,
+                          "image": image,
+                          "version": COMPILER_VERSION},
+                         sort_keys=True)
+
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def load_compiled(spec, image="sample", cache_dir=None):
+    """Gets the compiled spec from the cache or compiles it.
+
+    If the cache directory is not writable the compiled spec is not cached.
+
+    Args:
+        spec (dict): The spec as returned by load_spec.
+        image (optional, str): For which image to compile (see IMAGES).
+        cache_dir (optional, str): Where the compiled specs are stored
+                                   (default: DEFAULT_CACHE_DIR).
+
+    Return:
+        See compile_spec.
+    """
+
+    if cache_dir is None:
+        cache_dir = DEFAULT_CACHE_DIR
+
+    fname = os.path.join(cache_dir,
+                         "{}.npz".format(_get_spec_hash(spec, image)))
+
+    if os.path.exists(fname):
+        try:
+            with np.load(fname) as f:
+                return {key: f[key] for key in f.files}
+        except (OSError, ValueError):
+            print("Compiled scrambling spec {} is corrupted, recompiling it."
+                  .format(fname))
+
+    compiled = compile_spec(spec, image)
+
+    # several processes might compile the same spec, thus use a unique
+    # temporary file and replace the cached one atomically
+    tmp_fname = "{}.{}.tmp.npz".format(fname[:-len(".npz")], os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(tmp_fname, **compiled)
+        os.replace(tmp_fname, fname)
+    except OSError as e:
+        print("Could not cache compiled scrambling spec {} ({})"
+              .format(fname, e))
+
+    return compiled
+
+
+def get_descrambler(name, image="sample", cache_dir=None):
+    """Returns the descrambler of a spec.
+
+    The descrambler is created only once per process.
+
+    Args:
+        name (str): The name of the spec (see load_spec).
+        image (optional, str): For which image to descramble (see IMAGES).
+        cache_dir (optional, str): Where the compiled specs are stored.
+
+    Return:
+        The Descrambler object.
+    """
+
+    key = (name, image, cache_dir)
+
+    if key not in _descramblers:
+        _descramblers[key] = Descrambler(load_spec(name), image, cache_dir)
+
+    return _descramblers[key]
+
+
+class Descrambler(object):
+    """Descrambles images according to a compiled spec.
+    """
+
+    def __init__(self, spec, image="sample", cache_dir=None):
+        """
+        Args:
+            spec (dict): The spec as returned by load_spec.
+            image (optional, str): For which image to descramble (see
+                                   IMAGES).
+            cache_dir (optional, str): Where the compiled specs are stored.
+        """
+
+        compiled = load_compiled(spec, image, cache_dir)
+
+        self._word_index = compiled["word_index"]
+        self._pixel_index = compiled["pixel_index"]
+        self._group_check = compiled["group_check"]
+        self._stream_group = compiled["stream_group"]
+
+        self._byteswap = spec["input"].get("byteswap", False)
+        self._missing_marker = spec["input"].get("missing_marker", None)
+
+        bitplanes = spec["bitplanes"]
+        self._n_values = bitplanes["n_values"]
+        self._n_bits = bitplanes["n_bits"]
+        self._payload_bits = bitplanes.get("payload_bits", self._n_bits)
+        self._invert = bitplanes.get("invert", False)
+
+        self.input_shape = tuple(spec["input"]["shape"])
+        self.output_shape = self._pixel_index.shape
+
+        n_streams = self._word_index.shape[0]
+
+        # buffers reused for every image
+        self._words = np.empty(self._word_index.shape, dtype=np.uint16)
+        # the entry behind the decoded values is used for missing pixels
+        self._values = np.empty(n_streams * self._n_values + 1,
+                                dtype=np.uint16)
+        self._values[-1] = spec["missing_value"]
+        self._missing_value = spec["missing_value"]
+
+    def descramble(self, image, out=None, missing=None):
+        """Descrambles one image.
+
+        Args:
+            image: The scrambled image (of shape input_shape).
+            out (optional): uint16 array of shape output_shape to write into.
+            missing (optional): For each row group if its data is missing
+                                (e.g. known from lost packets), in addition
+                                to the ones found by the missing_marker.
+
+        Return:
+            The descrambled image as uint16 array.
+        """
+
+        image = np.asarray(image).astype(np.uint16, copy=False)
+        if image.shape != self.input_shape:
+            raise Exception("Image has shape {}, expected {}"
+                            .format(image.shape, self.input_shape))
+
+        if out is None:
+            out = np.empty(self.output_shape, dtype=np.uint16)
+
+        image_flat = image.reshape(-1)
+
+        # the indices are known to be valid, mode "clip" avoids buffering
+        np.take(image_flat, self._word_index, out=self._words, mode="clip")
+        if self._byteswap:
+            self._words.byteswap(inplace=True)
+
+        values = self._values[:-1].reshape(-1, self._n_values)
+        utils.decode_bitplanes(self._words,
+                               self._n_values,
+                               self._n_bits,
+                               payload_bits=self._payload_bits,
+                               invert=self._invert,
+                               out=values)
+
+        if self._missing_marker is not None:
+            marked = image_flat[self._group_check] == self._missing_marker
+            if missing is None:
+                missing = marked
+            else:
+                missing = np.logical_or(missing, marked)
+
+        if missing is not None:
+            missing = np.asarray(missing, dtype=bool)
+            if missing.any():
+                values[missing[self._stream_group]] = self._missing_value
+
+        np.take(self._values, self._pixel_index, out=out, mode="clip")
+
+        return out
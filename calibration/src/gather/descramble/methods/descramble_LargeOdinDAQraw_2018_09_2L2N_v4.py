@@ -38,6 +38,20 @@ class Descramble(DescrambleBase):
         #   clean_memory
         #   verbose
         #   debug
+        # optional:
+        #   scrambling_spec
+        #   scrambling_cache_dir
+        #   n_img_per_chunk
+
+        # the split files (multiple_save_files) do not depend on save_file
+        self._save_file = kwargs.get("save_file", False)
+
+        # images are read pairwise from fl0 and fl1
+        n_img_per_chunk = kwargs.get("n_img_per_chunk", 10)
+        self._n_img_per_chunk = max(2, n_img_per_chunk + n_img_per_chunk % 2)
+
+        if self._scrambling_spec is None:
+            self._scrambling_spec = "OdinDAQ_2018_06_18AY_2L2N"
 
     def run(self):
         """
@@ -94,47 +108,20 @@ class Descramble(DescrambleBase):
         self._report_arguments()
         # - - -
         #
-        # read h5 files
-        printcol("reading files", 'blue',)
-        if (os.path.isfile(self._input_fnames[0])):
-            (data_fl0_smpl, data_fl0_rst) = read_2xh5(self._input_fnames[0],
-                                                      '/data/', '/reset/')
-        else:
-            msg = "unable to find {}".format(self._input_fnames[0])
-            printcol(msg, 'red')
-            return()
-
-        if (os.path.isfile(self._input_fnames[1])):
-            (data_fl1_smpl, data_fl1_rst) = read_2xh5(self._input_fnames[1],
-                                                      '/data/', '/reset/')
-        else:
-            msg = "unable to find {}".format(self._input_fnames[1])
-            printcol(msg, 'red')
-            return()
+        # check h5 files
+        for fname in self._input_fnames:
+            if not os.path.isfile(fname):
+                msg = "unable to find {}".format(fname)
+                printcol(msg, 'red')
+                return()
 
-        (n_img_fl0, aux_nrow, aux_ncol) = data_fl0_smpl.shape
-        (n_img_fl1, aux_nrow, aux_ncol) = data_fl1_smpl.shape
+        with h5py.File(self._input_fnames[0], "r", libver='latest') as f:
+            (n_img_fl0, aux_nrow, aux_ncol) = f['data'].shape
+        with h5py.File(self._input_fnames[1], "r", libver='latest') as f:
+            n_img_fl1 = f['data'].shape[0]
         aux_n_img = n_img_fl0 + n_img_fl0
-        printcol("{0}+{1} Img read from files".format(n_img_fl0,
-                                                      n_img_fl0), 'green')
-        # - - -
-        #
-        # combine in one array: Img0-from-fl0, Img0-from-fl1, Img1-from-fl0...
-        scrmbl_smpl = np.zeros(
-            (aux_n_img, aux_nrow, aux_ncol)).astype('uint16')
-        scrmbl_rst = np.zeros_like(scrmbl_smpl).astype('uint16')
-        for i_img in range(aux_n_img):
-            if((i_img % 2 == 0) & ((i_img // 2) < n_img_fl0)):
-                scrmbl_smpl[i_img, :, :] = data_fl0_smpl[i_img // 2, :, :]
-                scrmbl_rst[i_img, :, :] = data_fl0_rst[i_img // 2, :, :]
-            if((i_img % 2 == 1) & ((i_img // 2) < n_img_fl1)):
-                scrmbl_smpl[i_img, :, :] = data_fl1_smpl[i_img // 2, :, :]
-                scrmbl_rst[i_img, :, :] = data_fl1_rst[i_img // 2, :, :]
-        if self._clean_memory:
-            del data_fl0_smpl
-            del data_fl0_rst
-            del data_fl1_smpl
-            del data_fl1_rst
+        printcol("{0}+{1} Img found in files".format(n_img_fl0,
+                                                     n_img_fl1), 'green')
         # - - -
         #
         # prepare to split data to multiple files
@@ -161,318 +148,66 @@ class Descramble(DescrambleBase):
                 raise Exception(msg)
             #
             n_img_1fl = int(aux_n_img/aux_n_of_files)
-            scrmbl_smpl = scrmbl_smpl.reshape(aux_n_of_files, n_img_1fl,
-                                              aux_nrow, aux_ncol)
-            scrmbl_rst = scrmbl_rst.reshape(aux_n_of_files, n_img_1fl,
-                                            aux_nrow, aux_ncol)
-            # - - -
-            #
-            # operate by split-file
-            for i_file, this_prefix in enumerate(fileprefix_list):
-                scrmbl_smpl_1fl = scrmbl_smpl[i_file, :, :, :]
-                scrmbl_rst_1fl = scrmbl_rst[i_file, :, :, :]
-                #
-                # solving 4a DAQ-scrambling: byte swap in hex
-                # (By0,By1) => (By1,By0)
-                datasmpl_byteswap = np.zeros_like(scrmbl_smpl_1fl).astype(
-                    'uint16')
-                datarst_byteswap = np.zeros_like(scrmbl_rst_1fl).astype(
-                    'uint16')
-
-                for i_img in range(n_img_1fl):
-                    datasmpl_byteswap[i_img, :, :] = convert_hex_byteswap_ar(
-                        scrmbl_smpl_1fl[i_img, :, :])
-                    datarst_byteswap[i_img, :, :] = convert_hex_byteswap_ar(
-                        scrmbl_rst_1fl[i_img, :, :])
-                if self._clean_memory:
-                    del scrmbl_smpl_1fl
-                    del scrmbl_rst_1fl
-                # - - -
-                #
-                # solving DAQ-scrambling: "pixel" reordering
-
-                def convert_odin_daq_2_mezzanine(shot_in):
-                    ''' descrambles the OdinDAQ-scrambling '''
-                    (au2_n_img, aux_nrow, aux_ncol) = shot_in.shape
-                    aux_reord = shot_in.reshape((au2_n_img, n_grp,
-                                                 n_adc, aux_ncol))
-                    aux_reord = aux_reord.reshape(
-                        (au2_n_img, n_grp, n_adc, 2, aux_ncol // 2))
-                    aux_reord = np.transpose(
-                        aux_reord, (0, 1, 3, 2, 4))
-                    # au2_n_img,n_grp, 2left/right,n_adc,aux_ncol//2
-                    aux_reord = aux_reord.reshape(
-                        (au2_n_img, n_grp, 2, n_adc * aux_ncol // 2))
-                    # au2_n_img,n_grp,2left/right,n_adc*aux_ncol//2
-                    aux_reord = aux_reord.reshape(
-                        (au2_n_img, n_grp, 2, 2, n_adc * aux_ncol // 4))
-                    # au2_n_img,n_grp,2left/right,2up/down,n_adc*aux_ncol//4
-                    aux_reordered = np.ones((
-                        au2_n_img, n_grp, 4,
-                        n_adc * aux_ncol // 4)).astype('uint16') * err_dlsraw
-                    aux_reordered[:, :, 0, :] = aux_reord[:, :, 0, 0, :]
-                    aux_reordered[:, :, 1, :] = aux_reord[:, :, 1, 0, :]
-                    aux_reordered[:, :, 2, :] = aux_reord[:, :, 0, 1, :]
-                    aux_reordered[:, :, 3, :] = aux_reord[:, :, 1, 1, :]
-                    aux_reordered = aux_reordered.reshape(
-                        (au2_n_img, n_grp, n_adc * aux_ncol))
-                    aux_reordered = aux_reordered.reshape(
-                        (au2_n_img, n_grp, n_adc, aux_ncol))
-                    aux_reordered = aux_reordered.reshape(
-                        (au2_n_img, n_grp * n_adc, aux_ncol))
-                    return aux_reordered
-                #
-                datasmpl_asmezz = convert_odin_daq_2_mezzanine(
-                    datasmpl_byteswap)
-                datarst_asmezz = convert_odin_daq_2_mezzanine(datarst_byteswap)
-                if self._clean_memory:
-                    del datasmpl_byteswap
-                    del datarst_byteswap
-                # - - -
-                #
-                # solving mezzanine-scrambling
-                datasmpl_2_dscrmbl = datasmpl_asmezz
-                datarst_2_dscrmbl = datarst_asmezz
-                data_2_srcmbl_norefcol = np.ones(
-                    (n_img_1fl, n_smplrst,
-                     aux_nrow, aux_ncol)).astype('uint16') * ((2**16) - 1)
-                data_2_srcmbl_norefcol[:, ismpl, :, :] = datasmpl_2_dscrmbl
-                data_2_srcmbl_norefcol[:, irst, :, :] = datarst_2_dscrmbl
-                data_2_srcmbl_norefcol = data_2_srcmbl_norefcol.reshape(
-                    (n_img_1fl, n_smplrst, n_grp, n_adc, aux_ncol))
-                #
-                # track missing packets: False==RowGrp OK;
-                # True== packet(s) missing makes rowgroup moot
-                # (1111 1111 1111 1111 instead of 0xxx xxxx xxxx xxxx)
-                missing_rowgrp_tracker = np.ones(
-                    (n_img_1fl, n_smplrst, n_grp)).astype(bool)
-                missing_rowgrp_tracker = data_2_srcmbl_norefcol[
-                    :, :, :, 0, 0] == err_dlsraw
-                # - - -
-                #
-                # descramble proper
-                multiimg_aggr_withref = np.zeros(
-                   (n_img_1fl, n_smplrst, n_grp, n_pad,
-                    n_adc * n_col_in_blk, 3)).astype('uint8')
-
-                for i_img in range(n_img_1fl):
-                    auxil_thisimg = data_2_srcmbl_norefcol[
-                        i_img, :, :, :, :].reshape((n_smplrst, n_grp,
-                                                    n_adc*aux_ncol))
-                    # (n_smplrst,NRowGrpInShot,n_adc*aux_ncol)
-
-                    auxil_thisimg = auxil_thisimg.reshape(
-                        (n_smplrst, n_grp,
-                         n_adc * aux_ncol // (n_data_pads * 2),
-                         n_data_pads, 2))
-                    # 32bit=2"pix" from 1st pad, 2"pix" from 2nd pad, ...
-
-                    auxil_thisimg = np.transpose(
-                        auxil_thisimg, (0, 1, 3, 2, 4))
-                    # (n_smplrst,n_grp,n_data_pads,
-                    # n_adc*aux_ncol//(n_data_pads*2),2"pix")
-
-                    auxil_thisimg = auxil_thisimg.reshape(
-                        (n_smplrst, n_grp, n_data_pads,
-                         n_adc*aux_ncol//n_data_pads))
-                    #
-                    # bit, remove head 0, concatenate and reorder
-                    auxil_thisimg_16bitted = convert_uint_2_bits_ar(
-                        auxil_thisimg, 16)[:, :, :, :, ::-1].astype('uint8')
-                    # n_smplrst,n_grp,n_data_pads,
-                    # n_adc*aux_ncol//n_data_pads,15bits
-
-                    auxil_thisimg_bitted = auxil_thisimg_16bitted[
-                        :, :, :, :, 1:]
-                    # n_smplrst,n_grp,n_data_pads,
-                    # n_adc*aux_ncol//n_data_pads,15bits
-
-                    auxil_thisimg_bitted = auxil_thisimg_bitted.reshape(
-                        (n_smplrst, n_grp, n_data_pads,
-                         n_adc * aux_ncol * 15 // n_data_pads))
-                    auxil_thisimg_bitted = auxil_thisimg_bitted.reshape(
-                        (n_smplrst, n_grp, n_data_pads,
-                         15, n_adc * n_col_in_blk))
-
-                    # BBT: 0=>1, 1=>0
-                    auxil_thisimg_bitted = np.transpose(auxil_thisimg_bitted,
-                                                        (0, 1, 2, 4, 3))
-                    # (n_smplrst,n_grp,n_data_pads,NPixsInRowBlk,15)
-                    auxil_thisimg_bitted = convert_britishbits_ar(
-                        auxil_thisimg_bitted)
-                    #
-                    auxil_thisimg_aggr = np.zeros(
-                        (n_smplrst, n_grp, n_data_pads,
-                         n_adc * n_col_in_blk, 3)).astype('uint8')
-                    #
-                    # binary aggregate Gn bit(0,1)
-                    aux_bits2descr = 2
-                    aux_frombit = 0
-                    aux_tobit_puls1 = 1 + 1
-                    power2matrix = (2 ** np.arange(
-                        aux_bits2descr))[::-1].astype(int)
-                    aux_power_matr = power2matrix * np.ones(
-                        (n_smplrst, n_grp, n_data_pads, n_adc * n_col_in_blk,
-                         len(power2matrix))).astype(int)
-                    totalvector_xd_ar = np.sum(auxil_thisimg_bitted[
-                        :, :, :, :,
-                        aux_frombit:aux_tobit_puls1] * aux_power_matr, axis=4)
-                    auxil_thisimg_aggr[
-                        :, :, :, :, ign] = totalvector_xd_ar.astype('uint8')
-                    #
-                    # binary aggregate Crs bit(10,11,12,13,14)
-                    aux_bits2descr = 5
-                    aux_frombit = 10
-                    aux_tobit_puls1 = 14 + 1
-                    power2matrix = (2**np.arange(
-                        aux_bits2descr))[::-1].astype(int)
-                    aux_power_matr = power2matrix * np.ones(
-                        (n_smplrst, n_grp, n_data_pads, n_adc*n_col_in_blk,
-                         len(power2matrix))).astype(int)
-                    totalvector_xd_ar = np.sum(auxil_thisimg_bitted[
-                        :, :, :, :,
-                        aux_frombit:aux_tobit_puls1] * aux_power_matr, axis=4)
-                    auxil_thisimg_aggr[:, :, :, :, icrs] = totalvector_xd_ar
-                    #
-                    # binary aggregate Fn bit(2,3,4,5,6,7,8,9)
-                    aux_bits2descr = 8
-                    aux_frombit = 2
-                    aux_tobit_puls1 = 9 + 1
-                    power2matrix = (2**np.arange(
-                        aux_bits2descr))[::-1].astype(int)
-                    aux_power_matr = power2matrix * np.ones(
-                        (n_smplrst, n_grp, n_data_pads, n_adc*n_col_in_blk,
-                         len(power2matrix))).astype(int)
-                    totalvector_xd_ar = np.sum(auxil_thisimg_bitted[
-                        :, :, :, :,
-                        aux_frombit:aux_tobit_puls1] * aux_power_matr, axis=4)
-                    auxil_thisimg_aggr[:, :, :, :, ifn] = totalvector_xd_ar
-                    #
-                    if self._clean_memory:
-                        del auxil_thisimg_bitted
-                        del power2matrix
-                        del aux_power_matr
-                        del totalvector_xd_ar
-                    #
-                    # including reference column
-                    auxil_thisImg_aggr_withref = np.ones(
-                        (n_smplrst, n_grp, n_pad, n_adc*n_col_in_blk,
-                         3)).astype('uint8') * ((2 ** 8) - 1)
-                    auxil_thisImg_aggr_withref[
-                        :, :, 1:, :,
-                        :] = auxil_thisimg_aggr[:, :, :, :, :]
-                    if self._clean_memory:
-                        del auxil_thisimg_aggr
-                    #
-                    multiimg_aggr_withref[
-                        i_img, :, :, :, :,
-                        :] = auxil_thisImg_aggr_withref[:, :, :, :, :]
-                if self._clean_memory:
-                    del auxil_thisImg_aggr_withref
-                # - - -
-                #
-                # reorder pixels and pads
-
-                multiimg_grpdscrmbld = np.zeros(
-                    (n_img_1fl, n_smplrst, n_grp, n_pad,
-                     n_adc, n_col_in_blk, 3)).astype('uint8')
-                for i_img in range(n_img_1fl):
-                    for i_smplrst in range(n_smplrst):
-                        multiimg_grpdscrmbld[
-                            i_img, i_smplrst, :, :, :, :,
-                            :] = reorder_pixels_gncrsfn(
-                                multiimg_aggr_withref[i_img, i_smplrst,
-                                                      :, :, :,
-                                                      :], n_adc, n_col_in_blk)
-                # - - -
-                #
-                # add error tracking
-                multiimg_grpdscrmbld = multiimg_grpdscrmbld.astype('int16')
-                # -256 upto 255
-
-                for i_img in range(n_img_1fl):
-                    for i_grp in range(n_grp):
-                        for i_smplrst in range(n_smplrst):
-                            if (missing_rowgrp_tracker[i_img,
-                                                       i_smplrst,
-                                                       i_grp]):
-                                multiimg_grpdscrmbld[
-                                    i_img, i_smplrst, i_grp, :, :, :,
-                                    :] = err_gncrsfn
-                multiimg_grpdscrmbld[:, :, :, 0, :, :, :] = err_gncrsfn
-                # also err tracking for ref col
-                # - - -
-                #
-                # reshaping as an Img array
-                dscrmbld_gncrsfn = np.zeros(
-                    (n_img_1fl, n_smplrst, n_grp,
-                     n_pad, n_adc, n_col_in_blk, 3)).astype('int16')
-                dscrmbld_gncrsfn[:, :, :, :, :, :, :] = multiimg_grpdscrmbld[
-                    :, :, :, :, :, :, :]
-                dscrmbld_gncrsfn = np.transpose(
-                    dscrmbld_gncrsfn, (0, 1, 2, 4, 3, 5, 6)).astype('int16')
-                # (NImg,Smpl/Rst,n_grp,n_adc,n_pad,NColInBlk,Gn/Crs/Fn)
-
-                dscrmbld_gncrsfn = dscrmbld_gncrsfn.reshape(
-                    (n_img_1fl, n_smplrst, n_grp * n_adc,
-                     n_pad * n_col_in_blk, 3))
-                # - - -
-                #
-                # convert Gn/Crs/Fn => DLSraw: 16bit (errorbit+15bits)
-                (dscrmbld_smpl_dlsraw,
-                 dscrmbld_rst_dlsraw) = convert_gncrsfn_2_dlsraw(
-                    dscrmbld_gncrsfn, False)
+            filepath_list = [
+                os.path.dirname(self._output_fname) + '/' + this_prefix + ".h5"
+                for this_prefix in fileprefix_list
+            ]
+        elif self._save_file:
+            n_img_1fl = aux_n_img
+            filepath_list = [self._output_fname]
+        else:
+            # only descramble (e.g. to look at the data in debug mode)
+            n_img_1fl = aux_n_img
+            filepath_list = []
+        # - - -
+        #
+        # descramble chunk by chunk: the images are read in interleaved
+        # order (Img0-from-fl0, Img0-from-fl1, Img1-from-fl0...), descrambled
+        # image by image using the layout of the scrambling spec (solves the
+        # DAQ-, mezzanine- and chip-scrambling and marks the reference column
+        # and missing packets as err_dlsraw) and appended to the output
+        # files, thus the memory used does not depend on the number of images
+        smpl_descrambler = self._get_descrambler("sample")
+        rst_descrambler = self._get_descrambler("reset")
+
+        dscrmbld_smpl_dlsraw = np.empty(
+            (self._n_img_per_chunk,) + smpl_descrambler.output_shape).astype(
+                'uint16')
+        dscrmbld_rst_dlsraw = np.empty_like(dscrmbld_smpl_dlsraw)
+
+        if filepath_list:
+            self._open_outputs([(filepath_list, n_img_1fl)])
+        else:
+            self._open_outputs([])
 
+        i_file = 0
+        try:
+            for (first_img, scrmbl_smpl, scrmbl_rst) in read_interleaved_2xh5(
+                    self._input_fnames, 'data', 'reset', aux_n_img,
+                    self._n_img_per_chunk):
                 if self._swap_sample_reset:
-                    (dscrmbld_rst_dlsraw,
-                     dscrmbld_smpl_dlsraw) = convert_gncrsfn_2_dlsraw(
-                        dscrmbld_gncrsfn, False)
-
-                if self._clean_memory:
-                    del dscrmbld_gncrsfn
+                    (scrmbl_smpl, scrmbl_rst) = (scrmbl_rst, scrmbl_smpl)
+
+                n_chunk = scrmbl_smpl.shape[0]
+                for i_img in range(n_chunk):
+                    smpl_descrambler.descramble(
+                        scrmbl_smpl[i_img, :, :],
+                        out=dscrmbld_smpl_dlsraw[i_img, :, :])
+                    rst_descrambler.descramble(
+                        scrmbl_rst[i_img, :, :],
+                        out=dscrmbld_rst_dlsraw[i_img, :, :])
+                dot()
                 # - - -
                 #
-                # save data to one of the split files
-                sample = dscrmbld_smpl_dlsraw
-                reset = dscrmbld_rst_dlsraw
-
-                (_, aux_nrow, aux_ncol_withRef) = sample.shape
-                filepath = os.path.dirname(
-                    self._output_fname) + '/' + this_prefix + ".h5"
-                write_2xh5(filepath, sample[:, :, :], '/data/',
-                           reset[:, :, :], '/reset/')
-                if self._verbose:
-                    msg = "{0} Img saved to file {1}".format(
-                        self._multiple_imgperfile, filepath)
-                    printcol(msg, 'green')
-                if self._clean_memory:
-                    del dscrmbld_smpl_dlsraw
-                    del dscrmbld_rst_dlsraw
-                # - - -
-                #
-                # show saved data
-                if self._debug:
-                    (reread_smpl, reread_rst) = read_2xh5(
-                        filepath, '/data/', '/reset/')
-                    (aux_n_img_1fl, aux_nrow,
-                     aux_ncol_withRef) = reread_smpl.shape
-                    reread_gncrsfn = convert_dlsraw_2_gncrsfn(
-                        reread_smpl, reread_rst, False)
-                    if self._clean_memory:
-                        del reread_smpl
-                        del reread_rst
-                    for aux_thisimg in range(aux_n_img_1fl):
-                        aux_title = "re-read Img " + str(
-                            aux_thisimg) + " of split-file " + str(i_file)
-                        aux_err_below = -0.1
-                        perc_plot_6x2d(
-                            reread_gncrsfn[aux_thisimg, ismpl, :, :, ign],
-                            reread_gncrsfn[aux_thisimg, ismpl, :, :, icrs],
-                            reread_gncrsfn[aux_thisimg, ismpl, :, :, ifn],
-                            reread_gncrsfn[aux_thisimg, irst, :, :, ign],
-                            reread_gncrsfn[aux_thisimg, irst, :, :, icrs],
-                            reread_gncrsfn[aux_thisimg, irst, :, :, ifn],
-                            aux_title, aux_err_below)
+                # append to the (split) files (a chunk can span several)
+                for fname, n_img_saved in self._append_to_outputs(
+                        dscrmbld_smpl_dlsraw[:n_chunk],
+                        dscrmbld_rst_dlsraw[:n_chunk]):
+                    self._show_saved_file(fname, i_file, n_img_saved)
+                    i_file += 1
+        finally:
+            self._close_outputs()
+        print(" ")
         # - - -
         #
         # that's all folks
@@ -482,6 +217,35 @@ class Descramble(DescrambleBase):
         printcol("script ended at {}".format(stop_time), 'blue')
         printcol("------------------------\n" * 3, 'black')
 
+    def _show_saved_file(self, filepath, i_file, n_img):
+        """ report a completed (split-)file and show its data (debug) """
+
+        if self._verbose:
+            msg = "{0} Img saved to file {1}".format(n_img, filepath)
+            printcol(msg, 'green')
+
+        if self._debug:
+            (reread_smpl, reread_rst) = read_2xh5(
+                filepath, '/data/', '/reset/')
+            (aux_n_img_1fl, aux_nrow, aux_ncol_withRef) = reread_smpl.shape
+            reread_gncrsfn = convert_dlsraw_2_gncrsfn(
+                reread_smpl, reread_rst, False)
+            if self._clean_memory:
+                del reread_smpl
+                del reread_rst
+            for aux_thisimg in range(aux_n_img_1fl):
+                aux_title = "re-read Img " + str(
+                    aux_thisimg) + " of split-file " + str(i_file)
+                aux_err_below = -0.1
+                perc_plot_6x2d(
+                    reread_gncrsfn[aux_thisimg, ismpl, :, :, ign],
+                    reread_gncrsfn[aux_thisimg, ismpl, :, :, icrs],
+                    reread_gncrsfn[aux_thisimg, ismpl, :, :, ifn],
+                    reread_gncrsfn[aux_thisimg, irst, :, :, ign],
+                    reread_gncrsfn[aux_thisimg, irst, :, :, icrs],
+                    reread_gncrsfn[aux_thisimg, irst, :, :, ifn],
+                    aux_title, aux_err_below)
+
     def _report_arguments(self):
         """ report arguments form conf file """
 
@@ -498,6 +262,12 @@ class Descramble(DescrambleBase):
                          "{0}".format(self._multiple_metadata_file), 'green')
                 printcol("assuming each file has {0} images".format(
                     self._multiple_imgperfile), 'green')
+            elif self._save_file:
+                printcol("Will save descrambled file: {}".format(
+                    self._output_fname), 'green')
+
+            printcol("will descramble {0} images at a time".format(
+                self._n_img_per_chunk), 'green')
 
             if self._debug:
                 printcol("debug: will show images", 'green')
@@ -16,35 +16,10 @@ import matplotlib
 import matplotlib.pyplot
 
 import __init__  # noqa F401
-import utils
 
 from descramble_base import DescrambleBase
 matplotlib.use('TkAgg')
 
-# from P2M manual : pixel scrambling
-N_xcolArray = 4
-N_ncolArray = 8
-colArray = np.arange(N_xcolArray * N_ncolArray).reshape(
-    (N_xcolArray, N_ncolArray)).transpose()
-colArray = np.fliplr(colArray)  # in the end it is colArray[ix,in]
-#
-# this gives the (iADC,iCol) indices of a pixel in a Rowblk,
-# given its sequence in the streamout
-ADCcolArray_1DA = []
-for i_n in range(N_ncolArray):
-    for i_ADC in range(7)[::-1]:
-        for i_x in range(N_xcolArray):
-            ADCcolArray_1DA += [(i_ADC, colArray[i_n, i_x])]
-ADCcolArray_1DA = np.array(ADCcolArray_1DA)
-# to use this: for ipix in range(32*7): (ord_ADC,ord_col)=ADCcolArray_1DA[ipix]
-
-# from P2M manual : pad order
-iG = 0
-iH0 = np.arange(21+1, 0+1-1, -1)
-iH1 = np.arange(22+21+1, 22+0+1-1, -1)
-iP2M_ColGrp = np.append(np.array(iG), iH0)
-iP2M_ColGrp = np.append(iP2M_ColGrp, iH1)
-
 
 # NOO functions
 def dot():
@@ -72,75 +47,6 @@ def write_2xh5(filenamepath,
         my5hfile.close()
 
 
-def convert_uint_2_bits_Ar(in_intAr, Nbits):
-    ''' convert (numpyarray of uint to array of Nbits bits)
-    for many bits in parallel '''
-    inSize_T = in_intAr.shape
-    in_intAr_flat = in_intAr.flatten()
-    out_NbitAr = np.zeros((len(in_intAr_flat), Nbits))
-    for iBits in range(Nbits):
-        out_NbitAr[:, iBits] = (in_intAr_flat >> iBits) & 1
-    out_NbitAr = out_NbitAr.reshape(inSize_T+(Nbits,))
-    return out_NbitAr
-
-
-def convert_bits_2_int_Ar(in_bitAr):
-    ''' convert (numpyarray of [... , ... , Nbits] to
-    array of [... , ... ](int) for many values in parallel'''
-    inSize_T = in_bitAr.shape
-    Nbits = inSize_T[-1]
-    outSize_T = inSize_T[0:-1]
-    out_intAr = np.zeros(outSize_T)
-    power2Matrix = (2**np.arange(Nbits)).astype(int)
-    aux_powerMatr = power2Matrix * np.ones(inSize_T).astype(int)
-    totalVector_xDAr = np.sum(in_bitAr*aux_powerMatr, axis=len(inSize_T)-1)
-    out_intAr = totalVector_xDAr.astype(int)
-    return out_intAr
-
-
-def convert_hex_byteSwap_Ar(data2convert_Ar):
-    ''' interpret the ints in an array as 16 bits.
-    byte-swap them: (byte0,byte1) => (byte1,byte0) '''
-    aux_bitted = convert_uint_2_bits_Ar(data2convert_Ar, 16).astype('uint8')
-    aux_byteinverted = np.zeros_like(aux_bitted).astype('uint8')
-    #
-    aux_byteinverted[..., 0:8] = aux_bitted[..., 8:16]
-    aux_byteinverted[..., 8:16] = aux_bitted[..., 0:8]
-    data_ByteSwapped_Ar = convert_bits_2_int_Ar(aux_byteinverted)
-    return (data_ByteSwapped_Ar)
-
-
-def convert_britishBits_Ar(BritishBitArray):
-    " 0=>1 , 1=>0 "
-    HumanReadableBitArray = 1 - BritishBitArray
-    return HumanReadableBitArray
-
-
-def reorder_pixels_GnCrsFn(disord_4DAr, NADC, NColInRowBlk):
-    ''' P2M pixel reorder for a image:
-    (NGrp,NDataPads,NADC*NColInRowBlk,3),disordered =>
-    (NGrp,NDataPads,NADC,NColInRowBlk,3),ordered '''
-    (aux_NGrp, aux_NPads, aux_pixInBlk, auxNGnCrsFn) = disord_4DAr.shape
-    ord_5DAr = np.zeros((aux_NGrp, aux_NPads, NADC, NColInRowBlk,
-                         auxNGnCrsFn)).astype('uint8')
-    aux_pixOrd_padDisord_5DAr = np.zeros((aux_NGrp, aux_NPads, NADC,
-                                          NColInRowBlk,
-                                          auxNGnCrsFn)).astype('uint8')
-    # pixel reorder inside each block
-    for ipix in range(NADC * NColInRowBlk):
-        (ord_ADC, ord_Col) = ADCcolArray_1DA[ipix]
-        aux_pixOrd_padDisord_5DAr[
-            :, :, ord_ADC, ord_Col,
-            :] = disord_4DAr[:, :, ipix, :]
-    # ColGrp order from chipscope to P2M
-    for iColGrp in range(aux_NPads):
-        ord_5DAr[
-            :, iColGrp, :, :,
-            :] = aux_pixOrd_padDisord_5DAr[:, iP2M_ColGrp[iColGrp],
-                                           :, :, :]
-    return ord_5DAr
-
-
 def percDebug_plot_6x2D(GnSmpl, CrsSmpl,
                         FnSmpl, GnRst,
                         CrsRst, FnRst,
@@ -235,6 +141,9 @@ class Descramble(DescrambleBase):
         #   clean_memory
         #   verbose
         #   debug
+        # optional:
+        #   scrambling_spec
+        #   scrambling_cache_dir
 
         # useful constants
         # negative value usable to track Gn/Crs/Fn from missing pack
@@ -285,6 +194,9 @@ class Descramble(DescrambleBase):
 
         self._result_data = None
 
+        if self._scrambling_spec is None:
+            self._scrambling_spec = "OdinDAQ_2018_06_18AY_2L2N"
+
     def run(self):
         """
         descrambles h5-odinDAQ(raw) files, save to h5 in standard format
@@ -340,14 +252,6 @@ class Descramble(DescrambleBase):
         iCrs = self._i_crs
         iFn = self._i_fn
 
-        NSmplRst = self._n_smpl_rst
-        NADC = self._n_adc
-        NColInBlock = self._n_col_in_blk
-        NRowInBlock = self._n_row_in_blk
-        NGrp = self._n_grp
-        NPad = self._n_pad
-        NDataPads = NPad - 1
-
         ERRDLSraw = self._err_dlsraw
         ERRint16 = self._err_int16
 
@@ -401,248 +305,36 @@ class Descramble(DescrambleBase):
             del data_fl1_Rst
         # - - -
         #
-        # solving 4a DAQ-scrambling: byte swap in hex (By0,By1) => (By1,By0)
-        msg = "solving DAQ-scrambling: byte-swapping (it might take a while)"
-        print(Fore.BLUE + msg)
-
-        dataSmpl_ByteSwap = np.zeros_like(scrmbl_Smpl).astype('uint16')
-        dataRst_ByteSwap = np.zeros_like(scrmbl_Smpl).astype('uint16')
-        for iImg in range(auxNImg):
-            dataSmpl_ByteSwap[iImg, :, :] = convert_hex_byteSwap_Ar(
-                scrmbl_Smpl[iImg, :, :])
-            dataRst_ByteSwap[iImg, :, :] = convert_hex_byteSwap_Ar(
-                scrmbl_Rst[iImg, :, :])
-            dot()
-        print(" ")
-        if self._clean_memory:
-            del scrmbl_Smpl
-            del scrmbl_Rst
-        # - - -
-        #
-        # solving DAQ-scrambling: "pixel" reordering
-        msg = "solving DAQ-scrambling: reordering subframes"
+        # descramble image by image using the layout of the scrambling spec:
+        # solves the DAQ-, mezzanine- and chip-scrambling and marks the
+        # reference column and missing packets as ERRDLSraw
+        msg = "descrambling using {}".format(self._scrambling_spec)
         print(Fore.BLUE + msg)
 
-        def convert_OdinDAQ_2_Mezzanine(shotIn):
-            (auxNImg, auxNRow, auxNCol) = shotIn.shape
-            aux_reord = shotIn.reshape((auxNImg, NGrp, NADC, auxNCol))
-            aux_reord = aux_reord.reshape(
-                (auxNImg, NGrp, NADC, 2, auxNCol // 2))
-            aux_reord = np.transpose(
-                aux_reord, (0, 1, 3, 2, 4))
-            # auxNImg,NGrp, 2left/right,NADC,auxNCol//2
-            aux_reord = aux_reord.reshape(
-                (auxNImg, NGrp, 2, NADC * auxNCol // 2))
-            # auxNImg,NGrp,2left/right,NADC*auxNCol//2
-            aux_reord = aux_reord.reshape(
-                (auxNImg, NGrp, 2, 2, NADC * auxNCol // 4))
-            # auxNImg,NGrp,2left/right,2up/down,NADC*auxNCol//4
-            aux_reordered = np.ones((
-                auxNImg, NGrp, 4,
-                NADC * auxNCol // 4)).astype('uint16') * ERRDLSraw
-            aux_reordered[:, :, 0, :] = aux_reord[:, :, 0, 0, :]
-            aux_reordered[:, :, 1, :] = aux_reord[:, :, 1, 0, :]
-            aux_reordered[:, :, 2, :] = aux_reord[:, :, 0, 1, :]
-            aux_reordered[:, :, 3, :] = aux_reord[:, :, 1, 1, :]
-            aux_reordered = aux_reordered.reshape(
-                (auxNImg, NGrp, NADC * auxNCol))
-            aux_reordered = aux_reordered.reshape(
-                (auxNImg, NGrp, NADC, auxNCol))
-            aux_reordered = aux_reordered.reshape(
-                (auxNImg, NGrp * NADC, auxNCol))
-            return aux_reordered
-        #
-        dataSmpl_asMezz = convert_OdinDAQ_2_Mezzanine(dataSmpl_ByteSwap)
-        dataRst_asMezz = convert_OdinDAQ_2_Mezzanine(dataRst_ByteSwap)
-        if self._clean_memory:
-            del dataSmpl_ByteSwap
-            del dataRst_ByteSwap
-        # - - -
-        #
-        # solving mezzanine-scrambling
-        msg = "solving mezzanine&chip-scrambling: preparation"
-        print(Fore.BLUE + msg)
+        if self._swap_sample_reset:
+            msg = "swapping Smpl and Rst data"
+            print(Fore.BLUE + msg)
+            (scrmbl_Smpl, scrmbl_Rst) = (scrmbl_Rst, scrmbl_Smpl)
 
-        dataSmpl_2_srcmbl = dataSmpl_asMezz
-        dataRst_2_srcmbl = dataRst_asMezz
-        data_2_srcmbl_norefCol = np.ones(
-            (auxNImg, NSmplRst,
-             auxNRow, auxNCol)).astype('uint16') * ((2**16) - 1)
-        data_2_srcmbl_norefCol[:, iSmpl, :, :] = dataSmpl_2_srcmbl
-        data_2_srcmbl_norefCol[:, iRst, :, :] = dataRst_2_srcmbl
-        data_2_srcmbl_norefCol = data_2_srcmbl_norefCol.reshape(
-            (auxNImg, NSmplRst, NGrp, NADC, auxNCol))
-        #
-        # track missing packets: False==RowGrp OK;
-        # True== packet(s) missing makes rowgroup moot
-        # (1111 1111 1111 1111 instead of 0xxx xxxx xxxx xxxx)
-        MissingRowGrpTracker = np.ones((auxNImg, NSmplRst, NGrp)).astype(bool)
-        MissingRowGrpTracker = data_2_srcmbl_norefCol[
-            :, :, :, 0, 0] == ERRDLSraw
-        # - - -
-        #
-        # descramble proper
-        msg = "solving mezzanine&chip-scrambling: pixel descrambling"
-        print(Fore.BLUE + msg)
-        multiImg_aggr_withRef = np.zeros(
-           (auxNImg, NSmplRst, NGrp, NPad,
-            NADC * NColInBlock, 3)).astype('uint8')
+        smpl_descrambler = self._get_descrambler("sample")
+        rst_descrambler = self._get_descrambler("reset")
 
+        dscrmbld_Smpl_DLSraw = np.empty(
+            (auxNImg,) + smpl_descrambler.output_shape).astype('uint16')
+        dscrmbld_Rst_DLSraw = np.empty_like(dscrmbld_Smpl_DLSraw)
         for iImg in range(auxNImg):
+            smpl_descrambler.descramble(scrmbl_Smpl[iImg, :, :],
+                                        out=dscrmbld_Smpl_DLSraw[iImg, :, :])
+            rst_descrambler.descramble(scrmbl_Rst[iImg, :, :],
+                                       out=dscrmbld_Rst_DLSraw[iImg, :, :])
             dot()
-            auxil_thisImg = data_2_srcmbl_norefCol[
-                iImg, :, :, :, :].reshape((NSmplRst, NGrp, NADC*auxNCol))
-            # (NSmplRst,NRowGrpInShot,NADC*auxNCol)
-
-            auxil_thisImg = auxil_thisImg.reshape(
-                (NSmplRst, NGrp,
-                 NADC * auxNCol // (NDataPads * 2), NDataPads, 2))
-            # 32bit=2"pix" from 1st pad, 2"pix" from 2nd pad, ...
-
-            auxil_thisImg = np.transpose(auxil_thisImg, (0, 1, 3, 2, 4))
-            # NSmplRst,NGrp,NDataPads,NADC*auxNCol//(NDataPads*2),2"pix")
-
-            auxil_thisImg = auxil_thisImg.reshape((NSmplRst, NGrp, NDataPads,
-                                                   NADC*auxNCol//NDataPads))
-            #
-            # bit, remove head 0, concatenate and reorder
-            auxil_thisImg_16bitted = convert_uint_2_bits_Ar(
-                auxil_thisImg, 16)[:, :, :, :, ::-1].astype('uint8')
-            # NSmplRst,NGrp,NDataPads,NADC*auxNCol//NDataPads,15bits
-
-            auxil_thisImg_bitted = auxil_thisImg_16bitted[:, :, :, :, 1:]
-            # NSmplRst,NGrp,NDataPads,NADC*auxNCol//NDataPads,15bits
-
-            auxil_thisImg_bitted = auxil_thisImg_bitted.reshape(
-                (NSmplRst, NGrp, NDataPads, NADC * auxNCol * 15 // NDataPads))
-            auxil_thisImg_bitted = auxil_thisImg_bitted.reshape(
-                (NSmplRst, NGrp, NDataPads, 15, NADC * NColInBlock))
-
-            # BBT: 0=>1, 1=>0
-            auxil_thisImg_bitted = np.transpose(auxil_thisImg_bitted,
-                                                (0, 1, 2, 4, 3))
-            # (NSmplRst,NGrp,NDataPads,NPixsInRowBlk,15)
-            auxil_thisImg_bitted = convert_britishBits_Ar(auxil_thisImg_bitted)
-            #
-            auxil_thisImg_aggr = np.zeros(
-                (NSmplRst, NGrp, NDataPads,
-                 NADC * NColInBlock, 3)).astype('uint8')
-            #
-            # binary aggregate Gn bit(0,1)
-            aux_bits2descr = 2
-            aux_frombit = 0
-            aux_tobit_puls1 = 1 + 1
-            power2Matrix = (2 ** np.arange(aux_bits2descr))[::-1].astype(int)
-            aux_powerMatr = power2Matrix * np.ones(
-                (NSmplRst, NGrp, NDataPads, NADC * NColInBlock,
-                 len(power2Matrix))).astype(int)
-            totalVector_xDAr = np.sum(auxil_thisImg_bitted[
-                :, :, :, :,
-                aux_frombit:aux_tobit_puls1] * aux_powerMatr, axis=4)
-            auxil_thisImg_aggr[
-                :, :, :, :, iGn] = totalVector_xDAr.astype('uint8')
-            #
-            # binary aggregate Crs bit(10,11,12,13,14)
-            aux_bits2descr = 5
-            aux_frombit = 10
-            aux_tobit_puls1 = 14 + 1
-            power2Matrix = (2**np.arange(aux_bits2descr))[::-1].astype(int)
-            aux_powerMatr = power2Matrix * np.ones(
-                (NSmplRst, NGrp, NDataPads, NADC*NColInBlock,
-                 len(power2Matrix))).astype(int)
-            totalVector_xDAr = np.sum(auxil_thisImg_bitted[
-                :, :, :, :,
-                aux_frombit:aux_tobit_puls1] * aux_powerMatr, axis=4)
-            auxil_thisImg_aggr[:, :, :, :, iCrs] = totalVector_xDAr
-            #
-            # binary aggregate Fn bit(2,3,4,5,6,7,8,9)
-            aux_bits2descr = 8
-            aux_frombit = 2
-            aux_tobit_puls1 = 9 + 1
-            power2Matrix = (2**np.arange(aux_bits2descr))[::-1].astype(int)
-            aux_powerMatr = power2Matrix * np.ones(
-                (NSmplRst, NGrp, NDataPads, NADC*NColInBlock,
-                 len(power2Matrix))).astype(int)
-            totalVector_xDAr = np.sum(auxil_thisImg_bitted[
-                :, :, :, :,
-                aux_frombit:aux_tobit_puls1] * aux_powerMatr, axis=4)
-            auxil_thisImg_aggr[:, :, :, :, iFn] = totalVector_xDAr
-            #
-            if self._clean_memory:
-                del auxil_thisImg_bitted
-                del power2Matrix
-                del aux_powerMatr
-                del totalVector_xDAr
-            #
-            # including reference column
-            auxil_thisImg_aggr_withRef = np.ones(
-                (NSmplRst, NGrp, NPad, NADC*NColInBlock,
-                 3)).astype('uint8') * ((2 ** 8) - 1)
-            auxil_thisImg_aggr_withRef[
-                :, :, 1:, :,
-                :] = auxil_thisImg_aggr[:, :, :, :, :]
-            if self._clean_memory:
-                del auxil_thisImg_aggr
-            #
-            multiImg_aggr_withRef[
-                iImg, :, :, :, :,
-                :] = auxil_thisImg_aggr_withRef[:, :, :, :, :]
         print(" ")
         if self._clean_memory:
-            del auxil_thisImg_aggr_withRef
-        # - - -
-        #
-        # reorder pixels and pads
-        msg = "solving chip-scrambling: pixel reordering"
-        print(Fore.BLUE + msg)
-
-        multiImg_GrpDscrmbld = np.zeros(
-            (auxNImg, NSmplRst, NGrp, NPad,
-             NADC, NColInBlock, 3)).astype('uint8')
-        for iImg in range(auxNImg):
-            for iSmplRst in range(NSmplRst):
-                multiImg_GrpDscrmbld[
-                    iImg, iSmplRst, :, :, :, :,
-                    :] = reorder_pixels_GnCrsFn(multiImg_aggr_withRef[
-                        iImg, iSmplRst, :, :, :, :], NADC, NColInBlock)
-        # - - -
-        #
-        # add error tracking
-        msg = "lost packet tracking"
-        print(Fore.BLUE + msg)
-
-        multiImg_GrpDscrmbld = multiImg_GrpDscrmbld.astype('int16')
-        # -256 upto 255
-
-        for iImg in range(auxNImg):
-            for iGrp in range(NGrp):
-                for iSmplRst in range(NSmplRst):
-                    if (MissingRowGrpTracker[iImg, iSmplRst, iGrp]):
-                        multiImg_GrpDscrmbld[
-                            iImg, iSmplRst, iGrp, :, :, :,
-                            :] = ERRint16
-        multiImg_GrpDscrmbld[:, :, :, 0, :, :, :] = ERRint16
-        # also err tracking for ref col
-        # - - -
-        #
-        # reshaping as an Img array
-        dscrmbld_GnCrsFn = np.zeros(
-            (auxNImg, NSmplRst, NGrp,
-             NPad, NADC, NColInBlock, 3)).astype('int16')
-        dscrmbld_GnCrsFn[:, :, :, :, :, :, :] = multiImg_GrpDscrmbld[
-            :, :, :, :, :, :, :]
-        dscrmbld_GnCrsFn = np.transpose(dscrmbld_GnCrsFn,
-                                        (0, 1, 2, 4, 3, 5, 6)).astype('int16')
-        # (NImg,Smpl/Rst,NGrp,NADC,NPad,NColInBlk,Gn/Crs/Fn)
-
-        dscrmbld_GnCrsFn = dscrmbld_GnCrsFn.reshape(
-            (auxNImg, NSmplRst, NGrp * NADC, NPad * NColInBlock, 3))
+            del scrmbl_Smpl
+            del scrmbl_Rst
         # - - -
         #
-        # convert Gn/Crs/Fn => DLSraw: 16bit (errorbit+15bits)
-        msg = "converting to DLSraw format"
-        print(Fore.BLUE + msg)
-
+        # convert DLSraw => Gn/Crs/Fn to show the data
         def convert_DLSraw_2_GnCrsFn(in_Smpl_DLSraw, in_Rst_DLSraw,
                                      inErr, outERR):
             ''' (Nimg,Smpl/Rst,NRow,NCol,Gn/Crs/Fn),int16(err=inErr) <=
@@ -699,58 +391,6 @@ class Descramble(DescrambleBase):
 
             return(out_multiImg_GnCrsFn)
 
-        def convert_GnCrsFn_2_DLSraw(in_GnCrsFn_int16, inErr, outERR):
-            ''' (Nimg,Smpl/Rst,NRow,NCol,Gn/Crs/Fn),int16(err=inErr) =>
-            DLSraw: Smpl&Rst(Nimg,NRow,NCol),uint16(err=outErr):[X,2G,8F,5C]'''
-            multiImg_SmplRstGnGrsFn_u16 = np.clip(
-                in_GnCrsFn_int16, 0, (2**8) - 1)
-            multiImg_SmplRstGnGrsFn_u16 = multiImg_SmplRstGnGrsFn_u16.astype(
-                'uint16')
-            # convert to DLSraw format
-            (NImg, aux_NSmplRst, aux_NRow,
-             aux_NCol, aux_NGnCrsFn) = in_GnCrsFn_int16.shape
-            out_multiImg_Smpl_DLSraw = np.zeros(
-                (NImg, NGrp * NRowInBlock,
-                 NPad * NColInBlock)).astype('uint16')
-            out_multiImg_Rst_DLSraw = np.zeros(
-                (NImg, NGrp * NRowInBlock,
-                 NPad * NColInBlock)).astype('uint16')
-            out_multiImg_Smpl_DLSraw[
-                :, :, :] = ((2**13)*multiImg_SmplRstGnGrsFn_u16[
-                    :, iSmpl, :, :, iGn].astype('uint16')) + (
-                        (2**5) * multiImg_SmplRstGnGrsFn_u16[
-                            :, iSmpl, :, :,
-                            iFn].astype(
-                                'uint16')) + multiImg_SmplRstGnGrsFn_u16[
-                                    :, iSmpl, :, :, iCrs].astype('uint16')
-            out_multiImg_Rst_DLSraw[
-                :, :, :] = ((2**13) * multiImg_SmplRstGnGrsFn_u16[
-                    :, iRst, :, :, iGn].astype('uint16')) + (
-                        (2**5) * multiImg_SmplRstGnGrsFn_u16[
-                            :, iRst, :, :,
-                            iFn].astype(
-                                'uint16')) + multiImg_SmplRstGnGrsFn_u16[
-                                    :, iRst, :, :, iCrs].astype('uint16')
-
-            # track errors in DLSraw mode with the ERRDLSraw (max of uint16)
-            errMask = in_GnCrsFn_int16[:, iSmpl, :, :, iGn] == inErr
-            out_multiImg_Smpl_DLSraw[errMask] = outERR
-            errMask = in_GnCrsFn_int16[:, iRst, :, :, iGn] == inErr
-            out_multiImg_Rst_DLSraw[errMask] = outERR
-            #
-            return (out_multiImg_Smpl_DLSraw, out_multiImg_Rst_DLSraw)
-
-        (dscrmbld_Smpl_DLSraw, dscrmbld_Rst_DLSraw) = convert_GnCrsFn_2_DLSraw(
-            dscrmbld_GnCrsFn, ERRint16, ERRDLSraw)
-
-        if self._swap_sample_reset:
-            msg = "swapping Smpl and Rst data"
-            print(Fore.BLUE + msg)
-            (dscrmbld_Rst_DLSraw, dscrmbld_Smpl_DLSraw) = convert_GnCrsFn_2_DLSraw(
-                dscrmbld_GnCrsFn, ERRint16, ERRDLSraw)       
-
-        if self._clean_memory:
-            del dscrmbld_GnCrsFn
         # - - -
         #
         # show descrambled data
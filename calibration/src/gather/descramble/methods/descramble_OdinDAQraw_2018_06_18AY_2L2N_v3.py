@@ -38,6 +38,12 @@ class Descramble(DescrambleBase):
         #   clean_memory
         #   verbose
         #   debug
+        # optional:
+        #   scrambling_spec
+        #   scrambling_cache_dir
+
+        if self._scrambling_spec is None:
+            self._scrambling_spec = "OdinDAQ_2018_06_18AY_2L2N"
 
     def run(self):
         """
@@ -137,265 +143,33 @@ class Descramble(DescrambleBase):
             del data_fl1_rst
         # - - -
         #
-        # solving 4a DAQ-scrambling: byte swap in hex (By0,By1) => (By1,By0)
-        msg = "solving DAQ-scrambling: byte-swapping (it might take a while)"
+        # descramble image by image using the layout of the scrambling spec:
+        # solves the DAQ-, mezzanine- and chip-scrambling and marks the
+        # reference column and missing packets as err_dlsraw
+        msg = "descrambling using {}".format(self._scrambling_spec)
         printcol(msg, 'blue')
 
-        datasmpl_byteswap = np.zeros_like(scrmbl_smpl).astype('uint16')
-        datarst_byteswap = np.zeros_like(scrmbl_smpl).astype('uint16')
-        for i_img in range(aux_n_img):
-            datasmpl_byteswap[i_img, :, :] = convert_hex_byteswap_ar(
-                scrmbl_smpl[i_img, :, :])
-            datarst_byteswap[i_img, :, :] = convert_hex_byteswap_ar(
-                scrmbl_rst[i_img, :, :])
-            dot()
-        print(" ")
-        if self._clean_memory:
-            del scrmbl_smpl
-            del scrmbl_rst
-        # - - -
-        #
-        # solving DAQ-scrambling: "pixel" reordering
-        msg = "solving DAQ-scrambling: reordering subframes"
-        printcol(msg, 'blue')
-
-        def convert_odin_daq_2_mezzanine(shot_in):
-            ''' descrambles the OdinDAQ-scrambling '''
-            (aux_n_img, aux_nrow, aux_ncol) = shot_in.shape
-            aux_reord = shot_in.reshape((aux_n_img, n_grp, n_adc, aux_ncol))
-            aux_reord = aux_reord.reshape(
-                (aux_n_img, n_grp, n_adc, 2, aux_ncol // 2))
-            aux_reord = np.transpose(
-                aux_reord, (0, 1, 3, 2, 4))
-            # aux_n_img,n_grp, 2left/right,n_adc,aux_ncol//2
-            aux_reord = aux_reord.reshape(
-                (aux_n_img, n_grp, 2, n_adc * aux_ncol // 2))
-            # aux_n_img,n_grp,2left/right,n_adc*aux_ncol//2
-            aux_reord = aux_reord.reshape(
-                (aux_n_img, n_grp, 2, 2, n_adc * aux_ncol // 4))
-            # aux_n_img,n_grp,2left/right,2up/down,n_adc*aux_ncol//4
-            aux_reordered = np.ones((
-                aux_n_img, n_grp, 4,
-                n_adc * aux_ncol // 4)).astype('uint16') * err_dlsraw
-            aux_reordered[:, :, 0, :] = aux_reord[:, :, 0, 0, :]
-            aux_reordered[:, :, 1, :] = aux_reord[:, :, 1, 0, :]
-            aux_reordered[:, :, 2, :] = aux_reord[:, :, 0, 1, :]
-            aux_reordered[:, :, 3, :] = aux_reord[:, :, 1, 1, :]
-            aux_reordered = aux_reordered.reshape(
-                (aux_n_img, n_grp, n_adc * aux_ncol))
-            aux_reordered = aux_reordered.reshape(
-                (aux_n_img, n_grp, n_adc, aux_ncol))
-            aux_reordered = aux_reordered.reshape(
-                (aux_n_img, n_grp * n_adc, aux_ncol))
-            return aux_reordered
-        #
-        datasmpl_asmezz = convert_odin_daq_2_mezzanine(datasmpl_byteswap)
-        datarst_asmezz = convert_odin_daq_2_mezzanine(datarst_byteswap)
-        if self._clean_memory:
-            del datasmpl_byteswap
-            del datarst_byteswap
-        # - - -
-        #
-        # solving mezzanine-scrambling
-        msg = "solving mezzanine&chip-scrambling: preparation"
-        printcol(msg, 'blue')
+        if self._swap_sample_reset:
+            msg = "swapping Smpl and Rst data"
+            printcol(msg, 'blue')
+            (scrmbl_smpl, scrmbl_rst) = (scrmbl_rst, scrmbl_smpl)
 
-        datasmpl_2_dscrmbl = datasmpl_asmezz
-        datarst_2_dscrmbl = datarst_asmezz
-        data_2_srcmbl_norefcol = np.ones(
-            (aux_n_img, n_smplrst,
-             aux_nrow, aux_ncol)).astype('uint16') * ((2**16) - 1)
-        data_2_srcmbl_norefcol[:, ismpl, :, :] = datasmpl_2_dscrmbl
-        data_2_srcmbl_norefcol[:, irst, :, :] = datarst_2_dscrmbl
-        data_2_srcmbl_norefcol = data_2_srcmbl_norefcol.reshape(
-            (aux_n_img, n_smplrst, n_grp, n_adc, aux_ncol))
-        #
-        # track missing packets: False==RowGrp OK;
-        # True== packet(s) missing makes rowgroup moot
-        # (1111 1111 1111 1111 instead of 0xxx xxxx xxxx xxxx)
-        missing_rowgrp_tracker = np.ones(
-            (aux_n_img, n_smplrst, n_grp)).astype(bool)
-        missing_rowgrp_tracker = data_2_srcmbl_norefcol[
-            :, :, :, 0, 0] == err_dlsraw
-        # - - -
-        #
-        # descramble proper
-        msg = "solving mezzanine&chip-scrambling: pixel descrambling"
-        printcol(msg, 'blue')
-        multiimg_aggr_withref = np.zeros(
-           (aux_n_img, n_smplrst, n_grp, n_pad,
-            n_adc * n_col_in_blk, 3)).astype('uint8')
+        smpl_descrambler = self._get_descrambler("sample")
+        rst_descrambler = self._get_descrambler("reset")
 
+        dscrmbld_smpl_dlsraw = np.empty(
+            (aux_n_img,) + smpl_descrambler.output_shape).astype('uint16')
+        dscrmbld_rst_dlsraw = np.empty_like(dscrmbld_smpl_dlsraw)
         for i_img in range(aux_n_img):
+            smpl_descrambler.descramble(scrmbl_smpl[i_img, ...],
+                                        out=dscrmbld_smpl_dlsraw[i_img, ...])
+            rst_descrambler.descramble(scrmbl_rst[i_img, ...],
+                                       out=dscrmbld_rst_dlsraw[i_img, ...])
             dot()
-            auxil_thisimg = data_2_srcmbl_norefcol[
-                i_img, :, :, :, :].reshape((n_smplrst, n_grp, n_adc*aux_ncol))
-            # (n_smplrst,NRowGrpInShot,n_adc*aux_ncol)
-
-            auxil_thisimg = auxil_thisimg.reshape(
-                (n_smplrst, n_grp,
-                 n_adc * aux_ncol // (n_data_pads * 2), n_data_pads, 2))
-            # 32bit=2"pix" from 1st pad, 2"pix" from 2nd pad, ...
-
-            auxil_thisimg = np.transpose(auxil_thisimg, (0, 1, 3, 2, 4))
-            # (n_smplrst,n_grp,n_data_pads,
-            # n_adc*aux_ncol//(n_data_pads*2),2"pix")
-
-            auxil_thisimg = auxil_thisimg.reshape(
-                (n_smplrst, n_grp, n_data_pads, n_adc*aux_ncol//n_data_pads))
-            #
-            # bit, remove head 0, concatenate and reorder
-            auxil_thisimg_16bitted = convert_uint_2_bits_ar(
-                auxil_thisimg, 16)[:, :, :, :, ::-1].astype('uint8')
-            # n_smplrst,n_grp,n_data_pads,n_adc*aux_ncol//n_data_pads,15bits
-
-            auxil_thisimg_bitted = auxil_thisimg_16bitted[:, :, :, :, 1:]
-            # n_smplrst,n_grp,n_data_pads,n_adc*aux_ncol//n_data_pads,15bits
-
-            auxil_thisimg_bitted = auxil_thisimg_bitted.reshape(
-                (n_smplrst, n_grp, n_data_pads,
-                 n_adc * aux_ncol * 15 // n_data_pads))
-            auxil_thisimg_bitted = auxil_thisimg_bitted.reshape(
-                (n_smplrst, n_grp, n_data_pads, 15, n_adc * n_col_in_blk))
-
-            # BBT: 0=>1, 1=>0
-            auxil_thisimg_bitted = np.transpose(auxil_thisimg_bitted,
-                                                (0, 1, 2, 4, 3))
-            # (n_smplrst,n_grp,n_data_pads,NPixsInRowBlk,15)
-            auxil_thisimg_bitted = convert_britishbits_ar(auxil_thisimg_bitted)
-            #
-            auxil_thisimg_aggr = np.zeros(
-                (n_smplrst, n_grp, n_data_pads,
-                 n_adc * n_col_in_blk, 3)).astype('uint8')
-            #
-            # binary aggregate Gn bit(0,1)
-            aux_bits2descr = 2
-            aux_frombit = 0
-            aux_tobit_puls1 = 1 + 1
-            power2matrix = (2 ** np.arange(aux_bits2descr))[::-1].astype(int)
-            aux_power_matr = power2matrix * np.ones(
-                (n_smplrst, n_grp, n_data_pads, n_adc * n_col_in_blk,
-                 len(power2matrix))).astype(int)
-            totalvector_xd_ar = np.sum(auxil_thisimg_bitted[
-                :, :, :, :,
-                aux_frombit:aux_tobit_puls1] * aux_power_matr, axis=4)
-            auxil_thisimg_aggr[
-                :, :, :, :, ign] = totalvector_xd_ar.astype('uint8')
-            #
-            # binary aggregate Crs bit(10,11,12,13,14)
-            aux_bits2descr = 5
-            aux_frombit = 10
-            aux_tobit_puls1 = 14 + 1
-            power2matrix = (2**np.arange(aux_bits2descr))[::-1].astype(int)
-            aux_power_matr = power2matrix * np.ones(
-                (n_smplrst, n_grp, n_data_pads, n_adc*n_col_in_blk,
-                 len(power2matrix))).astype(int)
-            totalvector_xd_ar = np.sum(auxil_thisimg_bitted[
-                :, :, :, :,
-                aux_frombit:aux_tobit_puls1] * aux_power_matr, axis=4)
-            auxil_thisimg_aggr[:, :, :, :, icrs] = totalvector_xd_ar
-            #
-            # binary aggregate Fn bit(2,3,4,5,6,7,8,9)
-            aux_bits2descr = 8
-            aux_frombit = 2
-            aux_tobit_puls1 = 9 + 1
-            power2matrix = (2**np.arange(aux_bits2descr))[::-1].astype(int)
-            aux_power_matr = power2matrix * np.ones(
-                (n_smplrst, n_grp, n_data_pads, n_adc*n_col_in_blk,
-                 len(power2matrix))).astype(int)
-            totalvector_xd_ar = np.sum(auxil_thisimg_bitted[
-                :, :, :, :,
-                aux_frombit:aux_tobit_puls1] * aux_power_matr, axis=4)
-            auxil_thisimg_aggr[:, :, :, :, ifn] = totalvector_xd_ar
-            #
-            if self._clean_memory:
-                del auxil_thisimg_bitted
-                del power2matrix
-                del aux_power_matr
-                del totalvector_xd_ar
-            #
-            # including reference column
-            auxil_thisImg_aggr_withref = np.ones(
-                (n_smplrst, n_grp, n_pad, n_adc*n_col_in_blk,
-                 3)).astype('uint8') * ((2 ** 8) - 1)
-            auxil_thisImg_aggr_withref[
-                :, :, 1:, :,
-                :] = auxil_thisimg_aggr[:, :, :, :, :]
-            if self._clean_memory:
-                del auxil_thisimg_aggr
-            #
-            multiimg_aggr_withref[
-                i_img, :, :, :, :,
-                :] = auxil_thisImg_aggr_withref[:, :, :, :, :]
         print(" ")
         if self._clean_memory:
-            del auxil_thisImg_aggr_withref
-        # - - -
-        #
-        # reorder pixels and pads
-        msg = "solving chip-scrambling: pixel reordering"
-        printcol(msg, 'blue')
-
-        multiimg_grpdscrmbld = np.zeros(
-            (aux_n_img, n_smplrst, n_grp, n_pad,
-             n_adc, n_col_in_blk, 3)).astype('uint8')
-        for i_img in range(aux_n_img):
-            for i_smplrst in range(n_smplrst):
-                multiimg_grpdscrmbld[
-                    i_img, i_smplrst, :, :, :, :,
-                    :] = reorder_pixels_gncrsfn(multiimg_aggr_withref[
-                        i_img, i_smplrst, :, :, :, :], n_adc, n_col_in_blk)
-        # - - -
-        #
-        # add error tracking
-        msg = "lost packet tracking"
-        printcol(msg, 'blue')
-
-        multiimg_grpdscrmbld = multiimg_grpdscrmbld.astype('int16')
-        # -256 upto 255
-
-        for i_img in range(aux_n_img):
-            for i_grp in range(n_grp):
-                for i_smplrst in range(n_smplrst):
-                    if (missing_rowgrp_tracker[i_img, i_smplrst, i_grp]):
-                        multiimg_grpdscrmbld[
-                            i_img, i_smplrst, i_grp, :, :, :,
-                            :] = err_gncrsfn
-        multiimg_grpdscrmbld[:, :, :, 0, :, :, :] = err_gncrsfn
-        # also err tracking for ref col
-        # - - -
-        #
-        # reshaping as an Img array
-        dscrmbld_gncrsfn = np.zeros(
-            (aux_n_img, n_smplrst, n_grp,
-             n_pad, n_adc, n_col_in_blk, 3)).astype('int16')
-        dscrmbld_gncrsfn[:, :, :, :, :, :, :] = multiimg_grpdscrmbld[
-            :, :, :, :, :, :, :]
-        dscrmbld_gncrsfn = np.transpose(dscrmbld_gncrsfn,
-                                        (0, 1, 2, 4, 3, 5, 6)).astype('int16')
-        # (NImg,Smpl/Rst,n_grp,n_adc,n_pad,NColInBlk,Gn/Crs/Fn)
-
-        dscrmbld_gncrsfn = dscrmbld_gncrsfn.reshape(
-            (aux_n_img, n_smplrst, n_grp * n_adc, n_pad * n_col_in_blk, 3))
-        # - - -
-        #
-        # convert Gn/Crs/Fn => DLSraw: 16bit (errorbit+15bits)
-        msg = "converting to DLSraw format"
-        printcol(msg, 'blue')
-
-        (dscrmbld_smpl_dlsraw,
-         dscrmbld_rst_dlsraw) = convert_gncrsfn_2_dlsraw(
-            dscrmbld_gncrsfn, False)
-
-        if self._swap_sample_reset:
-            msg = "swapping Smpl and Rst data"
-            printcol(msg, 'blue')
-            (dscrmbld_rst_dlsraw,
-             dscrmbld_smpl_dlsraw) = convert_gncrsfn_2_dlsraw(
-                dscrmbld_gncrsfn, False)
-
-        if self._clean_memory:
-            del dscrmbld_gncrsfn
+            del scrmbl_smpl
+            del scrmbl_rst
         # - - -
         #
         # show descrambled data
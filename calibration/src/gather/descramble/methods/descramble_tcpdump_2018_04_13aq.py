@@ -6,12 +6,10 @@ meas of independent counters for Smpl/Rst & subFrame)
 """
 import os  # to list files in a directory
 import time  # to have time
-import h5py
 import numpy as np
 from colorama import init, Fore
 
 import __init__  # noqa F401
-import utils
 
 from descramble_base import DescrambleBase
 
@@ -35,6 +33,10 @@ class Descramble(DescrambleBase):
         #   output_fname
         #   clean_memory
         #   verbose
+        # optional:
+        #   n_img_per_chunk
+        #   scrambling_spec
+        #   scrambling_cache_dir
 
         # useful constants
         # negative value usable to track Gn/Crs/Fn from missing pack
@@ -71,6 +73,19 @@ class Descramble(DescrambleBase):
         self._datatype_counter = self._img_counter - 4
         self._subframe_counter = self._img_counter - 3
 
+        # the fields of a packet, to view the file content as array of packets
+        self._packet_dtype = np.dtype({
+            "names": ["datatype", "subframe", "img", "pack",
+                      "header", "data"],
+            "formats": ["u1", "u1", ">u4", ">u2",
+                        ("u1", self._header_size),
+                        ("u1", self._gooddata_size)],
+            "offsets": [self._datatype_counter, self._subframe_counter,
+                        self._img_counter - 2, self._pack_counter,
+                        0, self._header_size],
+            "itemsize": self._fullpack_size
+        })
+
         # 1 RowGrp (7x32x44pixel) in in 4 UDPacket
         self._n_packs_in_rowgrp = 4
         # 1Img (Smpl+Rst)= 1696 UDPacket, id by (datatype,subframe,n_pack)
@@ -79,7 +94,11 @@ class Descramble(DescrambleBase):
         # thus packet count is never > 423
         self._max_n_pack = 423
 
-        self._result_data = None
+        # number of images descrambled at once (bounds the memory used)
+        self._n_img_per_chunk = kwargs.get("n_img_per_chunk", 10)
+
+        if self._scrambling_spec is None:
+            self._scrambling_spec = "tcpdump_2018_04_13AQ"
 
     def run(self):
         """
@@ -137,9 +156,9 @@ class Descramble(DescrambleBase):
         self._report_arguments()
 
         file_content = self._reading_file_content()
+        packets = self._indexing_packets(file_content)
 
-        n_packets = [len(content) // self._fullpack_size
-                     for content in file_content]
+        n_packets = [len(file_packets) for file_packets in packets]
 
         if self._verbose:
             print(Fore.GREEN +
@@ -154,7 +173,7 @@ class Descramble(DescrambleBase):
         if self._verbose:
             print(Fore.BLUE + "scanning files for obvious packet errors")
 
-        first_img, last_img = self._scanning_files(n_packets, file_content)
+        first_img, last_img = self._scanning_files(packets)
 
         # if needed, reduce Img2show to the 1st image
         # (the 1st img in the sequence might have a Img_counter number >0)
@@ -167,120 +186,42 @@ class Descramble(DescrambleBase):
                 "tcpdump-Image {}").format(first_img, last_img))
         print(Fore.GREEN + msg)
 
-        # solving the 2c-part of scrambling
-        # resort data from files (assign pack to its Img,Smpl/Rst)
-        if self._verbose:
-            print(Fore.BLUE + "resorting packages")
+        # the packets of each file ordered by image, to pick the packets of a
+        # chunk of images without searching through all packets
+        packet_order = self._grouping_packets(packets)
 
-        data, _, pack_check = self._resorting_data(n_img,
-                                                   imgs_tcpdump,
-                                                   file_content)
+        outputs = self._preparing_outputs(n_img)
 
+        # the images are descrambled chunk by chunk and appended to the
+        # output files: only the packets of one chunk are read from the
+        # (mapped) files, thus the memory used does not depend on the size
+        # of the files
         if self._verbose:
-            print(Fore.BLUE + " ")
-
-        if self._clean_memory:
-            del file_content
-
-        # missing package detail:
-        # if (Img,datatype,subframe,pack_id) not flagged as good => is missing
-        for i, img in enumerate(imgs_tcpdump):
-            if self._verbose:
-                missing_packages = np.sum(
-                    np.logical_not(pack_check[i, :, :, :]))
-
-                if missing_packages < 1:
-                    print(Fore.GREEN +
-                          "All packets for image {} are there".format(img))
-                else:
-                    print(Fore.MAGENTA +
-                          ("{} packets missing from image {}"
-                           .format(missing_packages, img)))
-
-        # at this point the data from the 2 files is ordered in a array of
-        # dimension (n_img, n_smpl_rst, n_subframe, n_pack=424)
-
-        # 1 rowgrp = 4 packets
-        # when a packet is missing, the whole rowgrp is compromised
-        # if so, flag the 4-tuple of packets (i.e. the rowgrp), as bad
-        rowgrp_check = np.logical_and(pack_check[:, :, 0, 0::2],
-                                      pack_check[:, :, 0, 1::2])
-        rowgrp_check = np.logical_and(rowgrp_check, pack_check[:, :, 1, 0::2])
-        rowgrp_check = np.logical_and(rowgrp_check, pack_check[:, :, 1, 1::2])
-        # - - -
-
-        data_xrowgrp = self._aggregating_rowgroups(n_img, imgs_tcpdump, data)
-        if self._clean_memory:
-            del data
+            print(Fore.BLUE + "descrambling images")
 
-        descrambled_data = self._descrambling_images(n_img,
-                                                     imgs_tcpdump,
-                                                     data_xrowgrp)
+        self._open_outputs(outputs)
+        try:
+            for i in range(0, n_img, self._n_img_per_chunk):
+                imgs_chunk = imgs_tcpdump[i:i + self._n_img_per_chunk]
+
+                chunk_packets = self._getting_chunk_packets(packets,
+                                                            packet_order,
+                                                            imgs_chunk)
+                (sample, reset) = self._descrambling_chunk(imgs_chunk,
+                                                           chunk_packets)
+                if self._clean_memory:
+                    del chunk_packets
+
+                for fname, n_img_saved in self._append_to_outputs(sample,
+                                                                  reset):
+                    if self._verbose:
+                        print(Fore.GREEN + "{0} Img saved to file {1}"
+                              .format(n_img_saved, fname))
+        finally:
+            self._close_outputs()
 
-        # solving the 1b-part of scrambling:
-        # reorder pixels and pads
         if self._verbose:
-            print(Fore.BLUE + "reordering pixels")
-
-        self._result_data = self._reordering_pixels(n_img,
-                                                    imgs_tcpdump,
-                                                    descrambled_data,
-                                                    rowgrp_check)
-
-        # save data to single file
-        if self._save_file:
-            if self._verbose:
-                print(Fore.BLUE + "saving to single file")
-            self._save_data()
-
-        # save data to multiple file
-        if self._multiple_save_files:
-            if self._verbose:
-                print(Fore.BLUE + "saving to multiple files")
-
-            if os.path.isfile(self._multiple_metadata_file) is False:
-                msg = "metafile file does not exist"
-                print(Fore.RED + msg)
-                raise Exception(msg)
-            meta_data = np.genfromtxt(self._multiple_metadata_file,
-                                      delimiter='\t',
-                                      dtype=str)
-            fileprefix_list = meta_data[:, 1]
-
-            aux_n_of_files = len(fileprefix_list)
-            if (aux_n_of_files*self._multiple_imgperfile) != n_img:
-                msg = 'number of images: '+str(n_img)
-                print(Fore.RED + msg)
-                msg = 'number of metafile entries: '+str(aux_n_of_files)
-                print(Fore.RED + msg)
-                msg = 'number of images per file: '+str(self._multiple_imgperfile)
-                print(Fore.RED + msg)
-                msg = ("n of images != metafile enties x Img/file ")
-                print(Fore.RED + msg)
-                raise Exception(msg)
-
-            (sample, reset) = utils.convert_gncrsfn_to_dlsraw(self._result_data,
-                                                              self._err_int16,
-                                                              self._err_dlsraw)
-            (_, aux_nrow, aux_ncol) = sample.shape
-            shape_datamultfiles = (aux_n_of_files,
-                                   self._multiple_imgperfile,
-                                   aux_nrow,
-                                   aux_ncol)
-            sample = sample.reshape(shape_datamultfiles).astype('uint16')
-            reset = reset.reshape(shape_datamultfiles).astype('uint16')
-
-            for i, prefix in enumerate(fileprefix_list):
-
-                filepath = os.path.dirname(self._output_fname) + '/'+ prefix + ".h5"
-
-                with h5py.File(filepath, "w", libver='latest') as my5hfile:
-                    my5hfile.create_dataset('/data/', data=sample[i, :, :, :])
-                    my5hfile.create_dataset('/reset/', data=reset[i, :, :, :])
-
-                if self._verbose:
-                    print(Fore.GREEN + "{0} Img saved to file {1}".format(
-                        self._multiple_imgperfile, filepath))
+            print(Fore.BLUE + " ")
 
         # that's all folks
         print("------------------------")
@@ -334,66 +275,126 @@ class Descramble(DescrambleBase):
             raise Exception(msg)
 
         # solving the 3a-part of scrambling
-        # read the tcpdump binary files, cut excess_bytesinfront
+        # map the tcpdump binary files, skipping excess_bytesinfront:
+        # the data are only read (paged in by the OS) when accessed, thus the
+        # files do not have to fit into memory
         if self._verbose:
-            print(Fore.BLUE + "reading files")
+            print(Fore.BLUE + "mapping files")
 
         file_content = []
         for i, fname in enumerate(self._input_fnames):
-            if file_missing[i]:
+            if (file_missing[i]
+                    or (os.path.getsize(fname)
+                        <= self._excess_bytesinfront)):
+                # an empty file cannot be mapped
                 content = np.array([]).astype('uint8')
 
             else:
-                # read uint8 data from binary file
-                with open(fname) as f:
-                    content = np.fromfile(f, dtype=np.uint8)
-
-                # cut off the excess bytes at the beginning
-                content = content[self._excess_bytesinfront:]
+                content = np.memmap(fname,
+                                    dtype=np.uint8,
+                                    mode="r",
+                                    offset=self._excess_bytesinfront)
 
             file_content.append(content)
 
         return file_content
 
-    def _scanning_files(self, n_packets, file_content):
+    def _indexing_packets(self, file_content):
+        """Views the content of each file as array of packets.
+
+        The header fields of all packets are then accessible at once (e.g.
+        packets["img"]) without copying the data (the views still refer to
+        the mapped files).
+        """
+
+        packets = []
+        for content in file_content:
+            n_packs = len(content) // self._fullpack_size
+            # cut off an incomplete packet at the end
+            content = content[:n_packs * self._fullpack_size]
+
+            packets.append(content.view(self._packet_dtype))
+
+        return packets
+
+    def _grouping_packets(self, packets):
+        """Orders the packets of each file by image.
+
+        Return:
+            For each file the packet indices sorted by image (packets of the
+            same image keep the order of the file) and the sorted image
+            numbers.
+        """
+
+        packet_order = []
+        for file_packets in packets:
+            order = np.argsort(file_packets["img"], kind="stable")
+            packet_order.append((order, file_packets["img"][order]))
+
+        return packet_order
+
+    def _getting_chunk_packets(self, packets, packet_order, imgs_chunk):
+        """Gets the packets of a chunk of images from the files.
+
+        Args:
+            packets: For each file the packets (see _indexing_packets).
+            packet_order: For each file the order of the packets (see
+                          _grouping_packets).
+            imgs_chunk: The (consecutive) image numbers of the chunk.
+
+        Return:
+            For each file the packets of the chunk (copied from the file).
+        """
+
+        chunk_packets = []
+        for file_packets, (order, sorted_img) in zip(packets, packet_order):
+            (start, stop) = np.searchsorted(
+                sorted_img, [imgs_chunk[0], imgs_chunk[-1] + 1])
+
+            chunk_packets.append(file_packets[order[start:stop]])
+
+        return chunk_packets
+
+    def _scanning_files(self, packets):
         """Scanning the files for errors and determining first and last image.
         """
 
         first_img = (2**32) - 1
         last_img = 0
-        for i, n_pack in enumerate(n_packets):
-            # n_pack is 0 for all non existing files
-            for ipack in range(n_pack):
-                start = ipack * self._fullpack_size
-                end = (ipack + 1) * self._fullpack_size
-                file_data = file_content[i][start:end]
-
-                # the frame (Img) number in this pack header (4-Bytes)
-                bytelist = file_data[self._img_counter-2:self._img_counter+2]
-                img = utils.convert_bytelist_to_int(bytelist=bytelist)
-
-                if img <= first_img:
-                    first_img = img
-                if img >= last_img:
-                    last_img = img
-
-                # the packet number in this pack header (2-Bytes)
-                bitlist = file_data[self._pack_counter:self._pack_counter+2]
-                pack_nmbr = utils.convert_bitlist_to_int(bitlist=bitlist)
-
-                if pack_nmbr > self._max_n_pack:  # fatal error in the data
-                    msg = ("Inconsistent packet in {}\n"
-                           "(packet {}-th in the file is identified as "
-                           "pack_nmbr={} > {})").format(self._input_fnames[i],
-                                                        ipack,
-                                                        pack_nmbr,
-                                                        self._max_n_pack)
-                    print(Fore.RED + msg)
-                    raise Exception(msg)
+        for i, file_packets in enumerate(packets):
+            # there are no packets for non existing files
+            if len(file_packets) == 0:
+                continue
+
+            # the frame (Img) number in the pack headers (4-Bytes)
+            img = file_packets["img"]
+            first_img = min(first_img, int(img.min()))
+            last_img = max(last_img, int(img.max()))
+
+            # the packet number in the pack headers (2-Bytes)
+            pack_nmbr = file_packets["pack"]
+            # a packet is identified by (datatype,subframe,pack_nmbr)
+            bad = np.flatnonzero((pack_nmbr > self._max_n_pack)
+                                 | (file_packets["datatype"]
+                                    >= self._n_smpl_rst)
+                                 | (file_packets["subframe"]
+                                    >= self._n_subframe))
+            if bad.size > 0:  # fatal error in the data
+                ipack = bad[0]
+                msg = ("Inconsistent packet in {}\n"
+                       "(packet {}-th in the file is identified as "
+                       "datatype={}, subframe={}, pack_nmbr={})"
+                       .format(self._input_fnames[i],
+                               ipack,
+                               file_packets["datatype"][ipack],
+                               file_packets["subframe"][ipack],
+                               pack_nmbr[ipack]))
+                print(Fore.RED + msg)
+                raise Exception(msg)
 
         return first_img, last_img
 
-    def _resorting_data(self, n_img, imgs_tcpdump, file_content):
+    def _resorting_data(self, n_img, imgs_tcpdump, packets):
         """
         orders packets coming from tcpdump files
         according to (img, datatype, subframe, packetnumber)
@@ -413,315 +414,143 @@ class Descramble(DescrambleBase):
         data = np.zeros(shape_data).astype('uint8')
         header = np.zeros(shape_header).astype('uint8')
 
-        for i, img_dump in enumerate(imgs_tcpdump):
-            if self._verbose:
-                print(".", end="", flush=True)
-
-            for ifile, _ in enumerate(self._input_fnames):
-                n_packs = len(file_content[ifile]) // self._fullpack_size
-
-                for ipack in range(n_packs):
-                    start = ipack * self._fullpack_size
-                    end = (ipack + 1) * self._fullpack_size
-
-                    file_data = file_content[ifile][start:end]
-
-                    # if this pack (header) has a Img (frame) number
-                    bytel = file_data[self._img_counter-2:self._img_counter+2]
-                    conv_bytel = utils.convert_bytelist_to_int(bytelist=bytel)
-
-                    if conv_bytel == img_dump:
-                        idx = slice(self._pack_counter, self._pack_counter+2)
-                        bytel = file_data[idx]
-                        pack_id = utils.convert_bytelist_to_int(bytelist=bytel)
-                        
-                        # datatype_id = file_data[self._datatype_counter]
-                        # this is wrong because on header datatype_id=0 means Reset
-                        # but dat is organized so that data[x, 0, ...] means Sample
-                        # it needs to be changed as:
-                        inverted_datatype_id = file_data[self._datatype_counter]
-                        datatype_id = np.absolute(inverted_datatype_id - 1)
-
-                        subframe_id = file_data[self._subframe_counter]
-
-                        # then save it in the appropriate position
-                        data[i,
-                             datatype_id,
-                             subframe_id,
-                             pack_id,
-                             :] = file_data[self._header_size:]
-                        header[i,
-                               datatype_id,
-                               subframe_id,
-                               pack_id,
-                               :] = file_data[:self._header_size]
-                        # and flag that (Img,datatype,subframe,pack_id) as good
-                        pack_check[i, datatype_id, subframe_id, pack_id] = True
+        for file_packets in packets:
+            if len(file_packets) == 0:
+                continue
+
+            # the Img (frame) each packet belongs to
+            i_img = file_packets["img"].astype(np.intp) - imgs_tcpdump[0]
+            # on header datatype_id=0 means Reset
+            # but data is organized so that data[x, 0, ...] means Sample
+            datatype_id = 1 - file_packets["datatype"].astype(np.intp)
+            subframe_id = file_packets["subframe"].astype(np.intp)
+            pack_id = file_packets["pack"].astype(np.intp)
+
+            # then save each packet in the appropriate position
+            idx = (i_img, datatype_id, subframe_id, pack_id)
+            data[idx] = file_packets["data"]
+            header[idx] = file_packets["header"]
+            # and flag that (Img,datatype,subframe,pack_id) as good
+            pack_check[idx] = True
 
         return data, header, pack_check
 
-    def _aggregating_rowgroups(self, n_img, imgs_tcpdump, data):
-        """
-        aggregate packets to rowgroups
-        """
-        shape_data_out = (n_img,
-                          self._n_smpl_rst,
-                          self._n_grp,
-                          2 * self._n_subframe * self._gooddata_size)
-        data_out = np.zeros(shape_data_out).astype('uint8')
-        shape_rowgrpdata = (self._n_subframe, 2, self._gooddata_size)
-        rowgrpdata = np.zeros(shape_rowgrpdata).astype('uint8')
-        # (2subframe, 2packetN, goodDataSize)
+    def _preparing_outputs(self, n_img):
+        """Determines the files to write the descrambled images to.
 
-        if self._verbose:
-            print(Fore.BLUE + "preparing to descramble")
-        # this also solves the 1a-part of scrambling:
-        # reorder by Smpl,Rst
-        for i, _ in enumerate(imgs_tcpdump):
-            if self._verbose:
-                print(".", end="", flush=True)
-
-            for i_rowgrp in range(self._n_grp):
-                for i_smplrst in range(self._n_smpl_rst):
-                    rowgrpdata = data[i,
-                                      i_smplrst,
-                                      :,
-                                      i_rowgrp*2:(i_rowgrp*2)+1+1,
-                                      :]
-                    # (subFrame0&1,packN0&1,goodDataSize)
-                    rowgrpdata = np.transpose(rowgrpdata, (1, 0, 2))
-                    # (packN0&1,subFrame0&1,goodDataSize)
-                    rowgrpdata = rowgrpdata.reshape(
-                        2 * self._n_subframe * self._gooddata_size)
-                    data_out[i, i_smplrst, i_rowgrp, :] = rowgrpdata
-
-        if self._verbose:
-            print(Fore.BLUE + " ")
-        return data_out
-
-    def _descrambling_images(self, n_img, imgs_tcpdump, data):
-        """
-        bit-descramble data from chip
-        (including mezzanine reorder & bit inversion)
+        Return:
+            A list of outputs as needed by _open_outputs.
         """
 
-        size_descrambled_data = (n_img,
-                                 self._n_smpl_rst,
-                                 self._n_grp,
-                                 self._n_pad,
-                                 self._n_col_in_blk * self._n_row_in_blk,
-                                 self._n_gn_crs_fn)
-        descrambled_data = np.zeros(size_descrambled_data).astype('uint8')
+        outputs = []
 
-        if self._verbose:
-            print(Fore.BLUE + "descrambling images")
+        # save data to single file
+        if self._save_file:
+            outputs.append(([self._output_fname], n_img))
 
-        for i_img, _ in enumerate(imgs_tcpdump):
-            if self._verbose:
-                print(".", end="", flush=True)
+        # save data to multiple file
+        if self._multiple_save_files:
+            if os.path.isfile(self._multiple_metadata_file) is False:
+                msg = "metafile file does not exist"
+                print(Fore.RED + msg)
+                raise Exception(msg)
+            meta_data = np.genfromtxt(self._multiple_metadata_file,
+                                      delimiter='\t',
+                                      dtype=str)
+            fileprefix_list = meta_data[:, 1]
 
-            auxil_img = data[i_img, :, :, :]
-            # (NSmplRst,NRowGrpInShot,NpacksInRowgrp*goodData_Size)
-
-            # solving the 2b-part of the scrambing (mezzanine interleaving
-            # 32bit-sequences from each pad)
-            img_shape_pad = (self._n_smpl_rst,
-                             self._n_grp,
-                             (self._n_packs_in_rowgrp *
-                              self._gooddata_size //
-                              (self._n_data_pads * 32 // 8)),
-                             self._n_data_pads,
-                             32//8)
-            auxil_img = auxil_img.reshape(img_shape_pad)
-            auxil_img = auxil_img.transpose((0, 1, 3, 2, 4))
-            # dimensions of img at this point:
-            # (NSmplRst, NRowGrpInShot, NDataPads,
-            # NpacksInRowgrp*goodData_Size/(NDataPads*32/8), 32/8)
-
-            img_shape_pad2 = (self._n_smpl_rst,
-                              self._n_grp,
-                              self._n_data_pads,
-                              (self._n_packs_in_rowgrp *
-                               self._gooddata_size //
-                               self._n_data_pads))
-            auxil_img = auxil_img.reshape(img_shape_pad2)
-
-            # array of uint8 => array of [x,x,x,x, x,x,x,x] bits
-            bitarray = utils.convert_intarray_to_bitarray(auxil_img, 8)
-            auxil_img_8bitted = bitarray[Ellipsis, ::-1].astype('uint8')
-            shape_8bit = (self._n_smpl_rst,
-                          self._n_grp,
-                          self._n_data_pads,
-                          (self._n_packs_in_rowgrp *
-                           self._gooddata_size //
-                           self._n_data_pads),
-                          8)
-            auxil_img_8bitted = auxil_img_8bitted.reshape(shape_8bit)
+            aux_n_of_files = len(fileprefix_list)
+            if (aux_n_of_files*self._multiple_imgperfile) != n_img:
+                msg = 'number of images: '+str(n_img)
+                print(Fore.RED + msg)
+                msg = 'number of metafile entries: '+str(aux_n_of_files)
+                print(Fore.RED + msg)
+                msg = ('number of images per file: '
+                       + str(self._multiple_imgperfile))
+                print(Fore.RED + msg)
+                msg = ("n of images != metafile enties x Img/file ")
+                print(Fore.RED + msg)
+                raise Exception(msg)
 
-            if self._clean_memory:
-                del auxil_img
-
-            # combine 2x8bit to 16bit
-            shape_16bit = (self._n_smpl_rst,
-                           self._n_grp,
-                           self._n_data_pads,
-                           (self._n_packs_in_rowgrp *
-                            self._gooddata_size //
-                            (self._n_data_pads * 2)),
-                           16)
-            auxil_img_16bitted = np.zeros(shape_16bit).astype('uint8')
-            auxil_img_16bitted[..., 0:8] = auxil_img_8bitted[:, :, :, 0::2, :]
-            auxil_img_16bitted[..., 8:16] = auxil_img_8bitted[:, :, :, 1::2, :]
+            filepaths = [
+                os.path.dirname(self._output_fname) + '/' + prefix + ".h5"
+                for prefix in fileprefix_list
+            ]
+            outputs.append((filepaths, self._multiple_imgperfile))
 
-            if self._clean_memory:
-                del auxil_img_8bitted
+        return outputs
 
-            # solving the 2a-part of scrambling:
-            # remove head 0, concatenate and reorder
-            # we can remove head 0 because the grps//missing packets are
-            # already identified by rowgrp_check
-            auxil_img_15bitted = auxil_img_16bitted[Ellipsis, 1:]
+    def _descrambling_chunk(self, imgs_tcpdump, packets):
+        """Descrambles the images of a chunk.
 
-            if self._clean_memory:
-                del auxil_img_16bitted
-
-            shape_15bit = (self._n_smpl_rst,
-                           self._n_grp,
-                           self._n_data_pads,
-                           (self._n_packs_in_rowgrp *
-                            self._gooddata_size *
-                            15 // (self._n_data_pads * 2)))
-            img_as_from_chip = auxil_img_15bitted.reshape(shape_15bit)
-
-            shape_as_from_chip = (self._n_smpl_rst,
-                                  self._n_grp,
-                                  self._n_data_pads,
-                                  self._n_bits_in_pix,
-                                  self._n_pixs_in_blk)
-            img_as_from_chip = img_as_from_chip.reshape(shape_as_from_chip)
+        Args:
+            imgs_tcpdump: The image numbers of the chunk.
+            packets: For each file the packets belonging to these images.
 
-            if self._clean_memory:
-                del auxil_img_15bitted
-
-            # solving the 1d-part if scrambling
-            # British Bit translation: 0->1, 1->0
-            img_as_from_chip = np.transpose(img_as_from_chip, (0, 1, 2, 4, 3))
-            # img_as_from_chip dimension are now
-            # (self._n_smpl_rst,
-            #  self._n_grp,
-            #  self._n_data_pads,
-            #  n_pixs_in_rowblk,
-            #  self._n_bits_in_pix)
-
-            # 0=>1, 1=>0
-            img_as_from_chip = utils.swap_bits(bitarray=img_as_from_chip)
-
-            shape_img_aggr = (self._n_smpl_rst,
-                              self._n_grp,
-                              self._n_data_pads,
-                              self._n_pixs_in_blk,
-                              self._n_gn_crs_fn)
-            img_aggr = np.zeros(shape_img_aggr).astype('uint8')
-
-            # solving the 1c-part if scrambling:
-            # binary aggregate to gain/coarse/fine
-            bitarray = img_as_from_chip[Ellipsis, ::-1]
-            img_int = utils.convert_bitarray_to_intarray(bitarray)
-
-            (coarse, fine, gain) = utils.split(img_int)
-            img_aggr[Ellipsis, self._i_crs] = coarse
-            img_aggr[Ellipsis, self._i_fn] = fine
-            img_aggr[Ellipsis, self._i_gn] = gain
+        Return:
+            The sample and reset images in DLSraw format, each as
+            (n_img, n_row, n_col) array.
+        """
 
-            if self._clean_memory:
-                del img_as_from_chip
+        n_img = len(imgs_tcpdump)
 
-            shape_ref = (self._n_smpl_rst,
-                         self._n_grp,
-                         self._n_pad,
-                         self._n_pixs_in_blk,
-                         self._n_gn_crs_fn)
-            # add RefCols (that had been ignored by mezzanine in 2a-scramblig)
-            img_aggr_withref = np.zeros(shape_ref).astype('uint8')
-            img_aggr_withref[:, :, 1:, :, :] = img_aggr
+        # solving the 2c-part of scrambling
+        # resort data from files (assign pack to its Img,Smpl/Rst)
+        data, _, pack_check = self._resorting_data(n_img,
+                                                   imgs_tcpdump,
+                                                   packets)
 
-            if self._clean_memory:
-                del img_aggr
+        # missing package detail:
+        # if (Img,datatype,subframe,pack_id) not flagged as good => is missing
+        for i, img in enumerate(imgs_tcpdump):
+            if self._verbose:
+                missing_packages = np.sum(
+                    np.logical_not(pack_check[i, :, :, :]))
 
-            descrambled_data[i_img, Ellipsis] = img_aggr_withref
+                if missing_packages < 1:
+                    print(Fore.GREEN +
+                          "All packets for image {} are there".format(img))
+                else:
+                    print(Fore.MAGENTA +
+                          ("{} packets missing from image {}"
+                           .format(missing_packages, img)))
 
-        if self._verbose:
-            print(Fore.BLUE + " ")
+        # at this point the data from the 2 files is ordered in a array of
+        # dimension (n_img, n_smpl_rst, n_subframe, n_pack=424)
 
-        return descrambled_data
+        # 1 rowgrp = 4 packets
+        # when a packet is missing, the whole rowgrp is compromised
+        # if so, flag the 4-tuple of packets (i.e. the rowgrp), as bad
+        rowgrp_check = np.logical_and(pack_check[:, :, 0, 0::2],
+                                      pack_check[:, :, 0, 1::2])
+        rowgrp_check = np.logical_and(rowgrp_check, pack_check[:, :, 1, 0::2])
+        rowgrp_check = np.logical_and(rowgrp_check, pack_check[:, :, 1, 1::2])
+        # - - -
 
-    def _reordering_pixels(self, n_img, imgs_tcpdump, data, rowgrp_check):
-        """
-        pixel-reorder data from chip
-        """
+        # descramble image by image using the layout of the scrambling spec:
+        # solves the aggregation of the packets to rowgroups, the mezzanine-
+        # and chip-scrambling and marks the reference column and the
+        # rowgroups with missing packets as err_dlsraw
+        smpl_descrambler = self._get_descrambler("sample")
+        rst_descrambler = self._get_descrambler("reset")
 
-        shape_descrambled = (n_img,
-                             self._n_smpl_rst,
-                             self._n_grp,
-                             self._n_pad,
-                             self._n_row_in_blk,
-                             self._n_col_in_blk,
-                             self._n_gn_crs_fn)
-        img = np.zeros(shape_descrambled).astype('uint8')
-
-        for i_img, _ in enumerate(imgs_tcpdump):
-            for i_smplrst in range(self._n_smpl_rst):
-                img[i_img, i_smplrst, Ellipsis] = utils.reorder_pixels_gncrsfn(
-                    data[i_img, i_smplrst, Ellipsis],
-                    self._n_adc, self._n_col_in_blk)
-
-        # add error tracking for data coming from missing packets
-        img = img.astype('int16')  # -256upto255
-        for i, _ in enumerate(imgs_tcpdump):
-            for igrp in range(self._n_grp):
-                for i_smplrst in range(self._n_smpl_rst):
-                    if rowgrp_check[i, i_smplrst, igrp] is False:
-                        img[i, i_smplrst, igrp, Ellipsis] = self._err_int16
-
-        # error tracking for refCol
-        img[:, :, :, 0, :, :, :] = self._err_int16
-
-        # consolidate rows and cols
-        transpose_order = (0, 1, 2, 4, 3, 5, 6)
-        img = np.transpose(img, transpose_order)
-        # new order:
-        # (n_img,
-        #  Smpl/Rst,
-        #  self._n_grp,
-        #  self._n_row_in_blk,
-        #  self._n_pad,
-        #  self._n_col_in_blk,
-        #  Gn/Crs/Fn)
-
-        shape_smplrst_split = (n_img,
-                               self._n_smpl_rst,
-                               self._n_grp * self._n_adc,
-                               self._n_pad * self._n_col_in_blk,
-                               self._n_gn_crs_fn)
-        img_smplrst_split = img.reshape(shape_smplrst_split)
-
-        return img_smplrst_split
-
-    def _save_data(self):
-        """Save descrambled data to h5 file in the standard format.
-        """
-        # convert Gn/Crs/Fn => DLSraw: 16bit (errorbit + 15bits)
-        if self._verbose:
-            msg = ("converting to DLSraw format (uint16-> "
-                   "[X, Gn,Gn, Fn,Fn,Fn,Fn,Fn,Fn,Fn,Fn, Crs,Crs,Crs,Crs,Crs])")
-            print(Fore.GREEN + msg)
+        sample = np.empty((n_img,) + smpl_descrambler.output_shape,
+                          dtype=np.uint16)
+        reset = np.empty_like(sample)
 
-        (sample, reset) = utils.convert_gncrsfn_to_dlsraw(self._result_data,
-                                                          self._err_int16,
-                                                          self._err_dlsraw)
+        # the packets as (big endian) words, the descrambler swaps the bytes
+        words = data.view("<u2")
+        for i in range(n_img):
+            if self._verbose:
+                print(".", end="", flush=True)
 
-        self._data_to_write["sample"]["data"] = sample
-        self._data_to_write["reset"]["data"] = reset
+            smpl_descrambler.descramble(
+                words[i, self._i_smp],
+                out=sample[i],
+                missing=np.logical_not(rowgrp_check[i, self._i_smp]))
+            rst_descrambler.descramble(
+                words[i, self._i_rst],
+                out=reset[i],
+                missing=np.logical_not(rowgrp_check[i, self._i_rst]))
 
-        self._write_data()
-        print(Fore.GREEN + "Data saved to: {}".format(self._output_fname))
+        return sample, reset
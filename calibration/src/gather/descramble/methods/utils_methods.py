@@ -9,6 +9,7 @@ import re
 from scipy import stats  # linear regression
 
 from utils import split as aggregate_crsfngn  # aggregate bits to crs,fn,gn
+from utils import byteswap_uint16
 
 # useful global constants
 n_adc = 7
@@ -182,13 +183,7 @@ def convert_bits_2_int_ar(in_bit_arr):
 def convert_hex_byteswap_ar(data2convert_ar):
     ''' interpret the ints in an array as 16 bits.
     byte-swap them: (byte0,byte1) => (byte1,byte0) '''
-    aux_bitted = convert_uint_2_bits_ar(data2convert_ar, 16).astype('uint8')
-    aux_byteinverted = np.zeros_like(aux_bitted).astype('uint8')
-    #
-    aux_byteinverted[..., 0:8] = aux_bitted[..., 8:16]
-    aux_byteinverted[..., 8:16] = aux_bitted[..., 0:8]
-    data_byteswapped_ar = convert_bits_2_int_ar(aux_byteinverted)
-    return (data_byteswapped_ar)
+    return byteswap_uint16(data2convert_ar)
 
 
 def convert_britishbits_ar(britishbit_array):
@@ -263,6 +258,45 @@ def write_2xh5(filenamepath,
         my5hfile.close()
 
 
+def read_interleaved_2xh5(filenamepaths, path1_2read, path2_2read,
+                          n_img, n_img_per_chunk):
+    ''' read 2xXD from 2 h5 files (e.g. fl0/fl1 from OdinDAQ) in interleaved
+    order: Img0-from-fl0, Img0-from-fl1, Img1-from-fl0, ...
+    n_img images are read, n_img_per_chunk (even) at a time, images missing
+    in a file are set to 0.
+    yields (first_img, data1_chunk, data2_chunk), the chunks are reused for
+    the next images '''
+    if n_img_per_chunk % 2 != 0:
+        raise Exception("Number of images per chunk has to be even.")
+
+    with h5py.File(filenamepaths[0], "r", libver='latest') as my5hfile0, \
+            h5py.File(filenamepaths[1], "r", libver='latest') as my5hfile1:
+        dsets = [(my5hfile0[path1_2read], my5hfile0[path2_2read]),
+                 (my5hfile1[path1_2read], my5hfile1[path2_2read])]
+
+        img_shape = dsets[0][0].shape[1:]
+        data1_chunk = np.empty((n_img_per_chunk,) + img_shape).astype(
+            'uint16')
+        data2_chunk = np.empty_like(data1_chunk)
+
+        for first_img in range(0, n_img, n_img_per_chunk):
+            n_chunk = min(n_img_per_chunk, n_img - first_img)
+
+            # every second image of the chunk comes from the same file
+            for i_fl, (dset1, dset2) in enumerate(dsets):
+                start = first_img // 2
+                n_fl = (n_chunk - i_fl + 1) // 2
+                n_avail = max(0, min(n_fl, dset1.shape[0] - start))
+
+                stop = i_fl + 2 * n_avail
+                data1_chunk[i_fl:stop:2] = dset1[start:start + n_avail]
+                data2_chunk[i_fl:stop:2] = dset2[start:start + n_avail]
+                data1_chunk[stop:n_chunk:2] = 0
+                data2_chunk[stop:n_chunk:2] = 0
+
+            yield (first_img, data1_chunk[:n_chunk], data2_chunk[:n_chunk])
+
+
 # NOO functions: plots
 def plot_multi1d_withmask(array_x, array_y_2d, mask_2d, info_list,
                           label_x, label_y, label_title, showline_flag):
@@ -3,7 +3,7 @@
 import os
 import sys
 import time
-import h5py
+import numpy as np
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -16,6 +16,8 @@ if SHARED_DIR not in sys.path:
 
 from _version import __version__
 import utils
+from utils_storage import get_storage_policy  # noqa E402
+import utils_trace  # noqa E402
 
 
 class GatherBase(object):
@@ -25,11 +27,15 @@ class GatherBase(object):
 
         self._in_fname = None
         self._out_fname = None
+        # options of the StoragePolicy used for the output file
+        self._storage = None
 
         # add all entries of the kwargs dictionary into the class namespace
         for key, value in kwargs.items():
             setattr(self, "_" + key, value)
 
+        self._storage_policy = get_storage_policy(self._storage)
+
 #        print("attributes in  GatherBase", vars(self))
 
         self._data_to_write = {}
@@ -53,16 +59,26 @@ class GatherBase(object):
 
         return output
 
-    def run(self):
+    def run(self, write_data=True):
         """Run the gather method
+
+        Args:
+            write_data (optional): If the gathered data should be written
+                                   into the output file. If not it is only
+                                   kept in memory (see get_data).
         """
         total_time = time.time()
 
-        self.initiate()
+        with utils_trace.span("gather"):
+            with utils_trace.span("initiate"):
+                self.initiate()
 
-        self._load_data()
+            with utils_trace.span("load"):
+                self._load_data()
 
-        self._write_data()
+            if write_data:
+                with utils_trace.span("write"):
+                    self._write_data()
 
         print("Gather took time:", time.time() - total_time, "\n")
 
@@ -74,6 +90,26 @@ class GatherBase(object):
     def _load_data(self):
         pass
 
+    def get_data(self):
+        """Return the gathered data.
+
+        Return:
+            A dictionary in the layout of the gathered file, i.e. the keys
+            are the paths of the datasets in the file (metadata below
+            "collection").
+        """
+
+        data = {}
+        for key, dset in self._data_to_write.items():
+            data[dset["path"]] = dset["data"]
+
+        # convert to arrays as they would be read from file
+        gname = "collection"
+        for key, value in iter(self._metadata.items()):
+            data["{}/{}".format(gname, key)] = np.asarray(value)
+
+        return data
+
     def _write_data(self):
         print("Start saving at {} ... ".format(self._out_fname), end="")
 
@@ -81,26 +117,62 @@ class GatherBase(object):
             raise Exception("Write data: No data found.")
 
         print("Output: ", self._out_fname)
-        with h5py.File(self._out_fname, "w", libver='latest') as out_f:
+        with self._storage_policy.open_file(self._out_fname) as out_f:
 
             for key, dset in self._data_to_write.items():
-                out_f.create_dataset(dset["path"],
-                                     data=dset["data"],
-                                     dtype=dset["type"])
-
-            gname = "collection"
-            # save metadata from original files
-            for key, value in iter(self._metadata.items()):
-                name = "{}/{}".format(gname, key)
-                try:
-                    out_f.create_dataset(name, data=value)
-                except:
-                    print("Error in", name, value.dtype)
-                    raise
-
-            name = "{}/{}".format(gname, "version")
-            out_f.create_dataset(name, data=__version__)
+                self._create_dataset(out_f, dset, data=dset["data"])
+
+            self._write_metadata(out_f)
 
             out_f.flush()
 
+        utils_trace.add_file_size("bytes_written", self._out_fname)
+
         print("Done.")
+
+    def _create_dataset(self, out_f, dset, data=None, shape=None):
+        """Creates a dataset according to the storage policy.
+
+        Args:
+            out_f: The opened h5py file to write into.
+            dset (dict): The entry of the data to write. Besides "path" and
+                         "type" it can define how the data is accessed
+                         afterwards ("access", "frame_axis" and
+                         "frames_per_chunk", see StoragePolicy).
+            data (optional): The data to write.
+            shape (optional): The shape of the dataset if no data is given.
+
+        Return:
+            The created dataset.
+        """
+
+        return self._storage_policy.create_dataset(
+            out_f,
+            dset["path"],
+            data=data,
+            shape=shape,
+            dtype=dset["type"],
+            access=dset.get("access", "tile"),
+            frame_axis=dset.get("frame_axis", None),
+            frames_per_chunk=dset.get("frames_per_chunk", None)
+        )
+
+    def _write_metadata(self, out_f):
+        """Writes the metadata into a file.
+
+        Args:
+            out_f: The opened h5py file to write into.
+        """
+
+        gname = "collection"
+        # save metadata from original files
+        for key, value in iter(self._metadata.items()):
+            name = "{}/{}".format(gname, key)
+            try:
+                out_f.create_dataset(name, data=value)
+            except:
+                print("Error in", name, value.dtype)
+                raise
+
+        name = "{}/{}".format(gname, "version")
+        out_f.create_dataset(name, data=__version__)
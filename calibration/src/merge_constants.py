@@ -19,6 +19,7 @@ if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 
 import utils
+import utils_trace  # noqa E402
 
 
 class MergeConstants(object):
@@ -52,7 +53,9 @@ class MergeConstants(object):
     def get_list_of_files(self):
         """Return a list of files contained inside the input directory.
         """
-        files_list = os.listdir(self._input_dir)
+        # ignore other files, e.g. the manifest
+        files_list = [fname for fname in os.listdir(self._input_dir)
+                      if fname.endswith("_processed.h5")]
         files_list.sort(key=self.alphanum_key)
 
         return files_list
@@ -78,6 +81,7 @@ class MergeConstants(object):
             for fname in file_list:
                 in_fname = os.path.join(self._input_dir, fname)
                 file_content = utils.load_file_content(in_fname)
+                utils_trace.add_file_size("bytes_read", in_fname)
                 for key, value in file_content.items():
                     if (key.startswith("collection") and
                        key not in data_to_concatenate):
@@ -130,21 +134,28 @@ class MergeConstants(object):
 
     def run(self):
 
-        self.set_input_dir(self._input_dir_crs)
-        print("Opening directory: {}".format(self._input_dir))
-        coarse = self.get_list_of_files()
-        files_crs = self.get_files(coarse)
-        data_crs, crs_shape = self.get_file_content(files_crs)
-
-        self.set_input_dir(self._input_dir_fn)
-        print("Opening directory: {}".format(self._input_dir))
-        fine = self.get_list_of_files()
-        files_fn = self.get_files(fine)
-        data_fn, fn_shape = self.get_file_content(files_fn)
-        data = self.merge_constants(data_crs, data_fn)
-        merged_data = self.merge_dictionaries(data,
-                                              crs_shape[0])
-        self.write_hdf5_file(merged_data)
+        with utils_trace.span("merge"):
+            with utils_trace.span("load"):
+                self.set_input_dir(self._input_dir_crs)
+                print("Opening directory: {}".format(self._input_dir))
+                coarse = self.get_list_of_files()
+                files_crs = self.get_files(coarse)
+                data_crs, crs_shape = self.get_file_content(files_crs)
+
+                self.set_input_dir(self._input_dir_fn)
+                print("Opening directory: {}".format(self._input_dir))
+                fine = self.get_list_of_files()
+                files_fn = self.get_files(fine)
+                data_fn, fn_shape = self.get_file_content(files_fn)
+
+            with utils_trace.span("merge_constants"):
+                data = self.merge_constants(data_crs, data_fn)
+                merged_data = self.merge_dictionaries(data,
+                                                      crs_shape[0])
+
+            with utils_trace.span("write"):
+                self.write_hdf5_file(merged_data)
+                utils_trace.add_file_size("bytes_written", self._out_fname)
 
     def write_hdf5_file(self, files_to_merge):
 
@@ -174,6 +185,11 @@ def get_arguments():
                         type=str,
                         required=True,
                         help="Name of the merged output file")
+    parser.add_argument("--trace",
+                        type=str,
+                        default=None,
+                        help="Write timings, counters and peak memory of "
+                             "the run into this json file")
 
     args = parser.parse_args()
 
@@ -196,5 +212,8 @@ if __name__ == '__main__':
     obj = MergeConstants(inputdir_coarse, inputdir_fine, out_fname)
     obj.run()
 
+    if args.trace is not None:
+        utils_trace.get_tracer().write(args.trace)
+
     print("File {} written".format(out_fname))
     print('Merging files took: {:.3f} s \n'.format(time.time() - total_time))
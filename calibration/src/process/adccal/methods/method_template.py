@@ -33,12 +33,18 @@ class Process(ProcessAdccalBase):
         }
         # determined on basis of the data
         _n_adcs: ...
-        _n_cols: ...
+        _n_cols: number of columns in the currently processed column chunk
+        _n_cols_total: ...
         _n_frames: ...
         _n_groups: ...
         _n_total_frames: ...
         _n_frames_per_vin: ...
+        _col_chunk: slice of the columns currently processed
 
+    The data is processed in column chunks fitting into the memory budget
+    (method property memory_budget_mb). _initiate and _calculate are
+    called for every chunk and all result entries need the columns as
+    second dimension.
     """
 
     def _initiate(self):
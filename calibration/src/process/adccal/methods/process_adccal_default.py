@@ -5,6 +5,9 @@ import numpy as np
 
 import __init__  # noqa F401
 from process_adccal_base import ProcessAdccalBase
+import utils_trace
+
+log = utils_trace.get_logger(__name__)
 
 
 class Process(ProcessAdccalBase):
@@ -47,6 +50,13 @@ class Process(ProcessAdccalBase):
                 }
             }
 
+        if self._robust_fit is not None:
+            # number of data points down-weighted by the robust fit
+            adc_part = self._method_properties["fit_adc_part"]
+            self._result["s_" + adc_part + "_n_outliers"] = {
+                "data": np.zeros(shapes["offset"]),
+                "path": "sample/" + adc_part + "/n_outliers"
+            }
 
     def _calculate(self):
         ''' Perform a linear fit on sample ADC coarse and fine.
@@ -72,23 +82,22 @@ class Process(ProcessAdccalBase):
             residuals = self._result["s_coarse_residuals"]["data"]
             residuals[:] = np.NaN
 
-            for adc in range(self._n_adcs):
-                for col in range(self._n_cols):
-                    adu = sample[adc, col, :]
-                    idx_fit = np.where(np.logical_and(adu < fitting_range[1],
-                                                      adu > fitting_range[0]))
-                    if np.any(idx_fit):
-                        fit_result = self._fit_linear(vin[idx_fit],
-                                                      adu[idx_fit])
-                        slope[adc, col], offset[adc, col] = fit_result.solution
-                    else:
-                        slope[adc, col] = np.NaN
-                        offset[adc, col] = np.NaN
+            in_range = np.logical_and(sample < fitting_range[1],
+                                      sample > fitting_range[0])
+            fit = self._fit_ramp(vin,
+                                 sample,
+                                 mask=np.logical_not(in_range))
+            slope[:] = fit.slope
+            offset[:] = fit.offset
+            residuals[:] = fit.residuals
 
             self._result["s_coarse_slope"]["data"] = slope
             self._result["s_coarse_offset"]["data"] = offset
             self._result["s_coarse_residuals"]["data"] = residuals
 
+            if self._robust_fit is not None:
+                self._result["s_coarse_n_outliers"]["data"] = fit.n_outliers
+
         elif self._method_properties["fit_adc_part"] == "fine":
             print("Data loaded, fitting fine data...")
             # convert (n_adcs, n_cols, n_groups, n_frames)
@@ -99,31 +108,25 @@ class Process(ProcessAdccalBase):
             vin = self._fill_up_vin(data["vin"])
             sample = data["s_fine"]
             sample_coarse = data["s_coarse"]
-            print(sample.shape)
-            print(sample_coarse.shape)
+            log.debug("sample shape %s, coarse shape %s",
+                      sample.shape, sample_coarse.shape)
             fitting_range = self._method_properties["fine_fitting_range"]
             offset = self._result["s_fine_offset"]["data"]
             slope = self._result["s_fine_slope"]["data"]
             residuals = self._result["s_fine_residuals"]["data"]
             residuals[:] = np.NaN
 
-            for adc in range(self._n_adcs):
-                for col in range(self._n_cols):
-                    adu = sample[adc, col, :]
-                    print(adu.shape)
-                    idx_fit = np.where(sample_coarse[adc,
-                                                     col,
-                                                     :] == fitting_range)
-                    if np.any(idx_fit):
-                        fit_result = self._fit_linear(vin[idx_fit],
-                                                      adu[idx_fit])
-                        slope[adc, col], offset[adc, col] = fit_result.solution
-#                        offset[adc, col] = slope[adc, col] * vin[idx_fit][0] + offset[adc, col]
-                    else:
-                        slope[adc, col] = np.NaN
-                        offset[adc, col] = np.NaN
+            fit = self._fit_ramp(vin,
+                                 sample,
+                                 mask=sample_coarse != fitting_range)
+            slope[:] = fit.slope
+            offset[:] = fit.offset
+            residuals[:] = fit.residuals
 
             self._result["s_fine_slope"]["data"] = slope
             self._result["s_fine_offset"]["data"] = offset
             self._result["s_fine_residuals"]["data"] = residuals
 
+            if self._robust_fit is not None:
+                self._result["s_fine_n_outliers"]["data"] = fit.n_outliers
+
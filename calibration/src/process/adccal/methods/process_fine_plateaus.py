@@ -0,0 +1,124 @@
+''' Method to calculate the offsets and slopes of the fine part of the ADCs
+    on every coarse plateau by fitting all plateaus in one grouped
+    regression.
+'''
+import numpy as np
+import __init__  # noqa F401
+from process_adccal_base import ProcessAdccalBase
+
+
+class Process(ProcessAdccalBase):
+    """Fits the fine ramp of every pixel separately for each coarse value.
+
+    In addition to the per-(pixel, coarse) tables the fit of the most common
+    coarse value is written in the format of process_pixel_calibration to
+    keep the result usable for merging and correction.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # the grouped fit needs more temporaries than the batched one
+        self._bytes_per_value = 64
+
+    def _initiate(self):
+        if self._method_properties["fit_adc_part"] != "fine":
+            raise Exception("Method {} only supports fit_adc_part fine."
+                            .format(self._method))
+
+        if self._robust_fit is not None:
+            raise Exception("Method {} does not support robust_fit."
+                            .format(self._method))
+
+        shapes = {
+            "offset": (self._n_rows, self._n_cols),
+            "plateau": (self._n_rows, self._n_cols, self._n_coarse_values)
+        }
+
+        self._result = {}
+        for prefix, channel in [("s", "sample"), ("r", "reset")]:
+            for key in ["offset", "slope", "r_squared", "roi"]:
+                self._result["{}_fine_{}".format(prefix, key)] = {
+                    "data": np.NaN * np.zeros(shapes["offset"]),
+                    "path": "{}/fine/{}".format(channel, key)
+                }
+
+            for key in ["offset", "slope", "r_squared", "n_points"]:
+                self._result["{}_fine_plateau_{}".format(prefix, key)] = {
+                    "data": np.NaN * np.zeros(shapes["plateau"]),
+                    "path": "{}/fine/plateau_{}".format(channel, key)
+                }
+
+        self._metadata = {
+            "plateau_coarse_values": np.arange(self._n_coarse_values)
+        }
+
+    def get_plateau_parameters(self, channel, coarse, vin):
+        ''' Return the fit results of fine data on every coarse plateau
+            and of the most common coarse plateau of every pixel.
+        '''
+
+        plateaus = self._fit_linear_grouped(vin,
+                                            channel,
+                                            groups=coarse,
+                                            n_group_values=(
+                                                self._n_coarse_values
+                                            ),
+                                            axis=2)
+
+        dominant, mask = self._get_dominant_coarse(coarse, axis=2)
+
+        # the offset is given at the first Vin inside the region of interest
+        # to be consistent with process_pixel_calibration
+        first_vin = vin[np.argmax(np.logical_not(mask), axis=2)]
+
+        idx = np.expand_dims(dominant.astype(np.intp), -1)
+        slope = np.take_along_axis(plateaus.slope, idx, -1)[..., 0]
+        offset = np.take_along_axis(plateaus.offset, idx, -1)[..., 0]
+        offset = offset + slope * first_vin
+        r_squared = np.take_along_axis(plateaus.r_squared, idx, -1)[..., 0]
+
+        return plateaus, (slope, offset, r_squared, dominant)
+
+    def _adc_ordering(self, adc_to_reorder):
+        ''' Reshuffle adc arrays
+                Input data:
+                    (n_adcs, n_cols, n_groups, ...)
+                Output data:
+                    (n_rows, n_cols, ...)
+        '''
+        # row = (grp * n_adcs) + adc
+        adc_shaped = np.moveaxis(adc_to_reorder, 2, 0)
+        adc_shaped = adc_shaped.reshape((self._n_rows, self._n_cols)
+                                        + adc_to_reorder.shape[3:])
+
+        return adc_shaped
+
+    def _calculate(self):
+        ''' Perform a linear fit of sample and reset ADC fine on all coarse
+            plateaus. The offsets and slopes are stored in a HDF5 file.
+        '''
+
+        print("Start loading data from {} ...".format(self._in_fname), end="")
+        data = self._load_data(self._in_fname)
+        print("Data loaded, fitting fine data on all coarse plateaus...")
+
+        vin = self._fill_vin_total_frames(data["vin"])
+
+        for prefix in ["s", "r"]:
+            plateaus, dominant_fit = self.get_plateau_parameters(
+                data[prefix + "_fine"],
+                data[prefix + "_coarse"],
+                vin
+            )
+
+            for key in ["slope", "offset", "r_squared", "n_points"]:
+                name = "{}_fine_plateau_{}".format(prefix, key)
+                self._result[name]["data"] = (
+                    self._adc_ordering(getattr(plateaus, key))
+                )
+
+            for key, value in zip(["slope", "offset", "r_squared", "roi"],
+                                  dominant_fit):
+                name = "{}_fine_{}".format(prefix, key)
+                self._result[name]["data"] = self._adc_ordering(value)
@@ -23,6 +23,13 @@ class Process(ProcessAdccalBase):
             }
         }
 
+        if self._robust_fit is not None:
+            # number of data points down-weighted by the robust fit
+            self._result["s_coarse_n_outliers"] = {
+                "data": np.zeros(shapes["offset"]),
+                "path": "sample/coarse/n_outliers"
+            }
+
     def _calculate(self):
         print("Start loading data from {} ...".format(self._in_fname), end="")
         data = self._load_data(self._in_fname)
@@ -33,27 +40,19 @@ class Process(ProcessAdccalBase):
         self._merge_groups_with_frames(data["s_coarse"])
 
         # create as many entries for each vin as there were original frames
-        vin = self._fill_up_vin(data["vin"])  # noqa F841
+        vin = self._fill_up_vin(data["vin"])
 
         # for convenience
         offset = self._result["s_coarse_offset"]["data"]
         slope = self._result["s_coarse_slope"]["data"]
 
         print("Start fitting ...")
-        for adc in range(self._n_adcs):
-            print("adc", adc)
-            for col in range(self._n_cols):
-                x = vin
-                y = data["s_coarse"][adc, col, :]
-
-                # returns: Least-squares solution (i.e. slope and offset),
-                #          residuals,
-                #          rank,
-                #          singular values
-                res = self._fit_linear(x, y)
-                # res = self._fit_linear(x, y, enable_r_squared=True)
-
-                slope[adc, col] = res.solution[0]
-                offset[adc, col] = res.solution[1]
+        res = self._fit_ramp(vin, data["s_coarse"])
+
+        slope[:] = res.slope
+        offset[:] = res.offset
+
+        if self._robust_fit is not None:
+            self._result["s_coarse_n_outliers"]["data"] = res.n_outliers
 
         print("Done.")
@@ -3,10 +3,11 @@
     part of ADCs by calling a linear fit from the base class.
 '''
 import numpy as np
-from itertools import product
 import __init__  # noqa F401
 from process_adccal_base import ProcessAdccalBase
-import operator
+import utils_trace
+
+log = utils_trace.get_logger(__name__)
 
 
 class Process(ProcessAdccalBase):
@@ -62,38 +63,59 @@ class Process(ProcessAdccalBase):
             }
         }
 
+        if self._robust_fit is not None:
+            # number of data points down-weighted by the robust fit
+            for prefix, channel in [("s", "sample"), ("r", "reset")]:
+                self._result[prefix + "_" + adc_part + "_n_outliers"] = {
+                    "data": np.zeros(shapes["offset"]),
+                    "path": channel + "/" + adc_part + "/n_outliers"
+                }
+
         self._metadata = {
                 "roi_coarse": self._method_properties["coarse_fitting_range"]
         }
 
+    def _get_outlier_data(self, adc_part):
+        """Returns the arrays to store the number of outliers in (sample and
+        reset) if a robust fit is done, None otherwise.
+        """
+
+        if self._robust_fit is None:
+            return None, None
+
+        return (self._result["s_" + adc_part + "_n_outliers"]["data"],
+                self._result["r_" + adc_part + "_n_outliers"]["data"])
+
     def get_coarse_parameters(self,
                               channel,
                               vin,
                               slope,
                               offset,
                               r_squared,
-                              roi_map):
+                              roi_map,
+                              n_outliers=None):
         ''' Return the offset and slope from fit of coarse data
             according to the channel (sample or reset)
         '''
 
         fit_roi = self._method_properties["coarse_fitting_range"]
-        for adc, col, row in product(range(self._n_adcs),
-                                     range(self._n_cols),
-                                     range(self._n_groups)):
-            adu = channel[adc, col, :, row]
-            roi = np.where(np.logical_and(adu < fit_roi[1],
-                                          adu > fit_roi[0]))
-            roi_map[adc, col, row] = fit_roi[0]
-            if np.any(roi):
-                fit = self._fit_linear(vin[roi],
-                                       adu[roi],
-                                       enable_r_squared=True)
-                slope[adc, col, row] = fit.solution[0]
-                offset[adc, col, row] = slope[adc, col, row] * vin[roi][0]
-                offset[adc, col, row] += fit.solution[1]
-                if fit.r_squared:
-                    r_squared[adc, col, row] = fit.r_squared
+        roi = np.logical_and(channel < fit_roi[1], channel > fit_roi[0])
+        roi_map[...] = fit_roi[0]
+
+        fit = self._fit_ramp(vin,
+                             channel,
+                             mask=np.logical_not(roi),
+                             axis=2)
+
+        # the offset is given at the first Vin inside the region of interest
+        first_vin = vin[np.argmax(roi, axis=2)]
+
+        slope[...] = fit.slope
+        offset[...] = fit.slope * first_vin + fit.offset
+        r_squared[...] = fit.r_squared
+
+        if n_outliers is not None:
+            n_outliers[...] = fit.n_outliers
 
         return slope, offset, r_squared, roi_map
 
@@ -102,7 +124,7 @@ class Process(ProcessAdccalBase):
 
     def get_length_crs_values(self, coarse, coarse_value):
 
-        print(coarse_value)
+        log.debug("coarse value %s", coarse_value)
         length = np.where(coarse == coarse_value)
         return length
 
@@ -113,32 +135,26 @@ class Process(ProcessAdccalBase):
                             slope,
                             offset,
                             r_squared,
-                            roi_map):
+                            roi_map,
+                            n_outliers=None):
         ''' Return the offset and slope from fit of fine data
             according to the channel (sample or reset)
         '''
 
-        for adc, col, row in product(range(self._n_adcs),
-                                     range(self._n_cols),
-                                     range(self._n_groups)):
-            adu = channel[adc, col, :, row]
-            crs = coarse[adc, col, :, row]
-            unique, counts = np.unique(crs, return_counts=True)
-            length_values = dict(zip(unique, counts))
-            better_coarse = max(length_values.items(),
-                                key=operator.itemgetter(1))[0]
-
-            roi = np.where(crs == better_coarse)
-            roi_map[adc, col, row] = better_coarse
-            if np.any(roi):
-                fit = self._fit_linear(vin[roi],
-                                       adu[roi],
-                                       enable_r_squared=True)
-                slope[adc, col, row] = fit.solution[0]
-                offset[adc, col, row] = fit.solution[1]
-                offset[adc, col, row] += slope[adc, col, row] * vin[roi][0]
-                if fit.r_squared:
-                    r_squared[adc, col, row] = fit.r_squared
+        dominant, mask = self._get_dominant_coarse(coarse, axis=2)
+        roi_map[...] = dominant
+
+        fit = self._fit_ramp(vin, channel, mask=mask, axis=2)
+
+        # the offset is given at the first Vin inside the region of interest
+        first_vin = vin[np.argmax(np.logical_not(mask), axis=2)]
+
+        slope[...] = fit.slope
+        offset[...] = fit.slope * first_vin + fit.offset
+        r_squared[...] = fit.r_squared
+
+        if n_outliers is not None:
+            n_outliers[...] = fit.n_outliers
 
         return slope, offset, r_squared, roi_map
 
@@ -169,16 +185,17 @@ class Process(ProcessAdccalBase):
             print("Data loaded, fitting coarse data...")
             sample = data["s_coarse"]
             reset = data["r_coarse"]
-            print(sample.shape)
+            log.debug("sample shape %s", sample.shape)
             vin = self._fill_vin_total_frames(data["vin"])
             s_offset = self._result["s_coarse_offset"]["data"]  # Offset sample
             r_offset = self._result["r_coarse_offset"]["data"]  # Offset reset
             s_slope = self._result["s_coarse_slope"]["data"]  # Slope sample
-            r_slope = self._result["s_coarse_slope"]["data"]  # Slope reset
+            r_slope = self._result["r_coarse_slope"]["data"]  # Slope reset
             s_rsquared = self._result["s_coarse_r_squared"]["data"]
             r_rsquared = self._result["r_coarse_r_squared"]["data"]
             s_roi = self._result["s_coarse_roi"]["data"]
             r_roi = self._result["r_coarse_roi"]["data"]
+            s_outliers, r_outliers = self._get_outlier_data("coarse")
 
             (s_slope,
              s_offset,
@@ -188,7 +205,8 @@ class Process(ProcessAdccalBase):
                                                  s_slope,
                                                  s_offset,
                                                  s_rsquared,
-                                                 s_roi)
+                                                 s_roi,
+                                                 n_outliers=s_outliers)
             (r_slope,
              r_offset,
              r_rsquared,
@@ -197,7 +215,8 @@ class Process(ProcessAdccalBase):
                                                  r_slope,
                                                  r_offset,
                                                  r_rsquared,
-                                                 r_roi)
+                                                 r_roi,
+                                                 n_outliers=r_outliers)
 
             self._result["s_coarse_slope"]["data"] = self._adc_ordering(s_slope)
             self._result["s_coarse_offset"]["data"] = self._adc_ordering(s_offset)
@@ -208,6 +227,12 @@ class Process(ProcessAdccalBase):
             self._result["s_coarse_roi"]["data"] = self._adc_ordering(s_roi)
             self._result["r_coarse_roi"]["data"] = self._adc_ordering(r_roi)
 
+            if self._robust_fit is not None:
+                for key in ["s_coarse_n_outliers", "r_coarse_n_outliers"]:
+                    self._result[key]["data"] = (
+                        self._adc_ordering(self._result[key]["data"])
+                    )
+
         if self._method_properties["fit_adc_part"] == "fine":
             print("Data loaded, fitting coarse data...")
             # convert (n_adcs, n_cols, n_groups, n_frames)
@@ -215,7 +240,7 @@ class Process(ProcessAdccalBase):
             sample_coarse = data["s_coarse"]
             reset_coarse = data["r_coarse"]
             sample = data["s_fine"]
-            print(sample.shape)
+            log.debug("sample shape %s", sample.shape)
             reset = data["r_fine"]
             vin = self._fill_vin_total_frames(data["vin"])
             s_offset = self._result["s_fine_offset"]["data"]
@@ -226,6 +251,7 @@ class Process(ProcessAdccalBase):
             r_rsquared = self._result["r_fine_r_squared"]["data"]
             s_roi = self._result["s_fine_roi"]["data"]
             r_roi = self._result["r_fine_roi"]["data"]
+            s_outliers, r_outliers = self._get_outlier_data("fine")
 
             (s_slope,
              s_offset,
@@ -236,7 +262,8 @@ class Process(ProcessAdccalBase):
                                                s_slope,
                                                s_offset,
                                                s_rsquared,
-                                               s_roi)
+                                               s_roi,
+                                               n_outliers=s_outliers)
             (r_slope,
              r_offset,
              r_rsquared,
@@ -246,7 +273,8 @@ class Process(ProcessAdccalBase):
                                                r_slope,
                                                r_offset,
                                                r_rsquared,
-                                               r_roi)
+                                               r_roi,
+                                               n_outliers=r_outliers)
             self._result["s_fine_slope"]["data"] = self._adc_ordering(s_slope)
             self._result["s_fine_offset"]["data"] = self._adc_ordering(s_offset)
             self._result["r_fine_slope"]["data"] = self._adc_ordering(r_slope)
@@ -255,3 +283,9 @@ class Process(ProcessAdccalBase):
             self._result["r_fine_r_squared"]["data"] = self._adc_ordering(r_rsquared)
             self._result["s_fine_roi"]["data"] = self._adc_ordering(s_roi)
             self._result["r_fine_roi"]["data"] = self._adc_ordering(r_roi)
+
+            if self._robust_fit is not None:
+                for key in ["s_fine_n_outliers", "r_fine_n_outliers"]:
+                    self._result[key]["data"] = (
+                        self._adc_ordering(self._result[key]["data"])
+                    )
@@ -1,10 +1,16 @@
 """Base class for ADC calibration processing
 """
+import time
 import h5py
 import numpy as np
 
 import __init__
 from process_base import ProcessBase
+import utils  # noqa E402
+from utils_storage import open_memmap  # noqa E402
+import utils_trace  # noqa E402
+
+log = utils_trace.get_logger(__name__)
 
 
 class ProcessAdccalBase(ProcessBase):
@@ -21,61 +27,349 @@ class ProcessAdccalBase(ProcessBase):
             "r_fine": "reset/fine",
             "r_gain": "reset/gain",
             "vin": "vin",
-            "n_frames_per_run": "collection/n_frames_per_run"
+            "n_frames_per_run": "collection/n_frames_per_run",
+            "frame_offsets": "collection/frame_offsets"
+        }
+
+        # the datasets which have the dimension
+        # (n_adcs, n_cols, n_frames, n_groups)
+        self._pixel_paths = ["s_coarse", "s_fine", "s_gain",
+                             "r_coarse", "r_fine", "r_gain"]
+
+        # which datasets are needed to fit the different parts of the ADC
+        self._required_paths = {
+            "coarse": ["s_coarse", "r_coarse"],
+            "fine": ["s_coarse", "r_coarse", "s_fine", "r_fine"]
         }
 
         self._n_adcs = None
         self._n_cols = None
+        self._n_cols_total = None
         self._n_groups = None
         self._n_frames = None
         self._n_rows = None
 
         self._n_total_frames = None
 
+        # the coarse part of the ADC is 5 bit
+        self._n_coarse_values = 32
+
+        # the column chunk currently processed
+        self._col_chunk = None
+
+        # maximum memory (in MB) to be used for the data of one column chunk
+        # if not set all columns are processed at once
+        try:
+            self._memory_budget = self._method_properties["memory_budget_mb"]
+        except KeyError:
+            self._memory_budget = None
+
+        # optional robust fitting of the ADC ramps (estimator name)
+        self._robust_fit = self._method_properties.get("robust_fit", None)
+        self._robust_iterations = (
+            self._method_properties.get("robust_iterations", 5)
+        )
+        self._robust_threshold = (
+            self._method_properties.get("robust_threshold", None)
+        )
+
+        # approximate memory in bytes needed per loaded uint8 data point,
+        # i.e. the data point itself plus the temporaries during fitting
+        if self._robust_fit is None:
+            self._bytes_per_value = 32
+        else:
+            # residuals and weights have to be kept as well
+            self._bytes_per_value = 56
+
         self._set_dimensions()
 
     def _set_dimensions(self):
 
-        with h5py.File(self._in_fname, "r") as f:
-            s_coarse = f[self._paths["s_coarse"]][()]
-            n_frames_per_vin = f[self._paths["n_frames_per_run"]][()]
+        # only the shape is needed, the data itself is read chunk-wise later
+        if self._in_data is None:
+            with h5py.File(self._in_fname, "r") as f:
+                shape = f[self._paths["s_coarse"]].shape
+                n_frames_per_vin = f[self._paths["n_frames_per_run"]][()]
 
-        self._n_adcs = s_coarse.shape[0]
-        self._n_cols = s_coarse.shape[1]
-        self._n_frames = s_coarse.shape[2]
-        self._n_groups = s_coarse.shape[3]
+                if self._paths["frame_offsets"] in f:
+                    frame_offsets = f[self._paths["frame_offsets"]][()]
+                else:
+                    frame_offsets = None
+        else:
+            shape = np.shape(self._in_data[self._paths["s_coarse"]])
+            n_frames_per_vin = np.asarray(
+                self._in_data[self._paths["n_frames_per_run"]]
+            )
+            frame_offsets = self._in_data.get(self._paths["frame_offsets"],
+                                              None)
+
+        if frame_offsets is None:
+            # gathered before the offsets were stored
+            frame_offsets = utils.get_frame_offsets(n_frames_per_vin)
+
+        self._n_adcs = shape[0]
+        self._n_cols_total = shape[1]
+        self._n_cols = self._n_cols_total
+        self._n_frames = shape[2]
+        self._n_groups = shape[3]
         self._n_rows = self._n_adcs * self._n_groups
 
         self._n_total_frames = self._n_groups * self._n_frames
 
         self._n_frames_per_vin = n_frames_per_vin
+        self._frame_offsets = np.asarray(frame_offsets)
+
+        self._col_chunk = slice(0, self._n_cols_total)
+
+    def _get_column_chunks(self):
+        """Splits the columns into chunks fitting into the memory budget.
+
+        Return:
+            A list of slices, one per column chunk.
+        """
+
+        if self._memory_budget is None:
+            n_cols_chunk = self._n_cols_total
+        else:
+            n_values_per_col = (self._n_adcs
+                                * self._n_frames
+                                * self._n_groups
+                                * len(self._required_paths[self._adc_part]))
+            bytes_per_col = n_values_per_col * self._bytes_per_value
+
+            n_cols_chunk = int(self._memory_budget * 1024**2 // bytes_per_col)
+            n_cols_chunk = min(max(n_cols_chunk, 1), self._n_cols_total)
+
+        return [slice(start, min(start + n_cols_chunk, self._n_cols_total))
+                for start in range(0, self._n_cols_total, n_cols_chunk)]
+
+    def _set_column_chunk(self, col_chunk):
+        """Sets the columns to be loaded and processed.
+
+        Args:
+            col_chunk (slice): The columns of the input file to process.
+        """
+
+        self._col_chunk = col_chunk
+        self._n_cols = col_chunk.stop - col_chunk.start
 
     def _load_data(self, in_fname):
+        """Loads the data required for the configured fit of the current
+        column chunk.
+
+        Args:
+            in_fname: The gathered file to load the data from. Not used if
+                      the gathered data was handed over in memory.
+
+        Return:
+            A dictionary with the loaded data.
+        """
+
+        keys = self._required_paths[self._adc_part] + ["vin",
+                                                       "n_frames_per_run"]
+
+        with utils_trace.span("load"):
+            if self._in_data is None:
+                with h5py.File(in_fname, "r") as f:
+                    data = self._select_data(self._map_datasets(f, keys),
+                                             keys)
+
+                utils_trace.add_count("bytes_read",
+                                      sum(v.nbytes for v in data.values()))
+            else:
+                data = self._select_data(self._in_data, keys)
+
+        return data
+
+    def _map_datasets(self, f, keys):
+        """Maps the pixel datasets into memory where possible.
+
+        Contiguous uncompressed datasets are read with np.memmap, thus only
+        the pages of the current column chunk are read, without going
+        through the HDF5 library. The others are read with h5py.
+
+        Args:
+            f: The opened h5py file.
+            keys (list): The entries of self._paths to map.
+
+        Return:
+            A dictionary with the same layout as the file.
+        """
+
+        source = {}
+        for key in keys:
+            dset = f[self._paths[key]]
+
+            mapped = None
+            if key in self._pixel_paths:
+                mapped = open_memmap(dset)
+
+            source[self._paths[key]] = dset if mapped is None else mapped
+
+        return source
+
+    def _select_data(self, source, keys):
+        """Selects the data of the current column chunk.
+
+        Args:
+            source: An opened h5py file or a dictionary with the same
+                    layout.
+            keys (list): The entries of self._paths to select.
+
+        Return:
+            A dictionary with one contiguous numpy array per key.
+        """
 
         data = {}
-        with h5py.File(self._in_fname, "r") as f:
-            for key in self._paths:
-                data[key] = f[self._paths[key]][()]
+        for key in keys:
+            if key in self._pixel_paths:
+                # only read the hyperslab of the current columns
+                idx = (slice(None), self._col_chunk)
+            else:
+                idx = ()
+
+            data[key] = np.ascontiguousarray(source[self._paths[key]][idx])
 
         return data
 
-    def _fill_up_vin(self, vin):
-        # create as many entries for each vin as there were original frames
-        x = [np.full(self._n_frames_per_vin[i] * self._n_groups, v)
-             for i, v in enumerate(vin)]
+    def run(self):
+        """Run the processing column chunk by column chunk.
+        """
+        total_time = time.time()
+
+        col_chunks = self._get_column_chunks()
+
+        with utils_trace.span("process"):
+            with self._storage_policy.open_file(self._out_fname) as out_f:
+                for col_chunk in col_chunks:
+                    log.info("Process columns %s to %s of %s",
+                             col_chunk.start,
+                             col_chunk.stop,
+                             self._n_cols_total)
+
+                    self._set_column_chunk(col_chunk)
+
+                    with utils_trace.span("initiate"):
+                        self._initiate()
+
+                    with utils_trace.span("calculate"):
+                        self._calculate()
+
+                    utils_trace.add_count("pixels_fitted",
+                                          self._n_rows * self._n_cols)
+
+                    with utils_trace.span("write"):
+                        self._write_result_chunk(out_f)
+
+                print("Start saving metadata at {} ... "
+                      .format(self._out_fname), end='')
+                self._write_metadata(out_f)
+                out_f.flush()
+                print("Done.")
+
+            utils_trace.add_file_size("bytes_written", self._out_fname)
+
+        print("Process took time: {}\n".format(time.time() - total_time))
+
+    def _write_result_chunk(self, out_f):
+        """Writes the result of the current column chunk into a file.
+
+        The result datasets are created with the size of all columns when
+        writing the first chunk. All result entries are expected to have the
+        columns as second dimension.
+
+        Args:
+            out_f: The opened h5py file to write into.
+        """
 
-        x = np.hstack(x)
+        for key, entry in self._result.items():
+            data = np.asarray(entry["data"])
 
-        return x
+            if entry["path"] not in out_f:
+                shape = list(data.shape)
+                shape[1] = self._n_cols_total
+                self._storage_policy.create_dataset(
+                    out_f,
+                    entry["path"],
+                    shape=tuple(shape),
+                    dtype=entry.get("type", data.dtype),
+                    access=entry.get("access", "tile")
+                )
+
+            out_f[entry["path"]][:, self._col_chunk, ...] = data
+
+    def _fill_up_vin(self, vin):
+        # create as many entries for each vin as there were original frames
+        # (and groups)
+        return utils.expand_vin(vin, self._frame_offsets, self._n_groups)
 
     def _fill_vin_total_frames(self, vin):
         # create as many entries for each vin as there were original frames
-        x = [np.full(self._n_frames_per_vin[i], v)
-             for i, v in enumerate(vin)]
+        return utils.expand_vin(vin, self._frame_offsets)
+
+    def _fit_ramp(self, x, y, mask=None, axis=-1):
+        """Fits the ADC ramp with the fitting mode configured.
+
+        Uses least squares or, if robust_fit is set in the method
+        properties, a robust fit with the estimator given.
+
+        Args:
+            x (numpy array): The x values corresponding to the data points
+                             along the fitting axis, e.g. the Vin per frame.
+            y (numpy array): The data points to fit.
+            mask (optional): A boolean array of the same shape as y marking
+                             the entries to not consider for the fitting.
+            axis (optional): The axis of y along which to fit.
+
+        Return:
+            A named tuple as returned by _fit_linear_batched or
+            _fit_linear_robust.
+        """
+
+        with utils_trace.span("fit"):
+            if self._robust_fit is None:
+                return self._fit_linear_batched(x, y, mask=mask, axis=axis)
+
+            return self._fit_linear_robust(
+                x,
+                y,
+                mask=mask,
+                axis=axis,
+                estimator=self._robust_fit,
+                n_iterations=self._robust_iterations,
+                threshold=self._robust_threshold
+            )
+
+    def _get_dominant_coarse(self, coarse, axis=2):
+        """Determines for every pixel the coarse value seen most often.
+
+        The occurrences of all coarse values are counted along the frame axis
+        for the whole data cube together. If multiple values occur equally
+        often the smallest one is taken.
+
+        Args:
+            coarse (numpy array): The coarse data, e.g. of shape
+                                  (n_adcs, n_cols, n_frames, n_groups).
+            axis (optional): The frame axis of the coarse data.
+
+        Return:
+            The most common coarse value per pixel (shape of the coarse data
+            without the frame axis) and a mask of the shape of the coarse
+            data marking all frames not on this coarse value.
+        """
+
+        counts_shape = coarse.shape[:axis] + coarse.shape[axis + 1:]
+        counts = np.zeros((self._n_coarse_values,) + counts_shape,
+                          dtype=np.int32)
+
+        for value in range(self._n_coarse_values):
+            np.sum(coarse == value, axis=axis, out=counts[value])
+
+        dominant = np.argmax(counts, axis=0).astype(coarse.dtype)
 
-        x = np.hstack(x)
+        mask = coarse != np.expand_dims(dominant, axis)
 
-        return x
+        return dominant, mask
 
     def _merge_groups_with_frames(self, data):
         # data has the dimension (n_adcs, n_cols, n_groups, n_frames)
@@ -90,7 +384,7 @@ class ProcessAdccalBase(ProcessBase):
             It should be transformed into (n_rows, n_cols, n_frames)
         '''
 
-        print(data.shape)
+        log.debug("data shape %s", data.shape)
 #        print(data[0, 100, 0, 3])
 #        data = np.rollaxis(data, 3)
 #        print(data[0, 0, 100, 3])
@@ -98,5 +392,5 @@ class ProcessAdccalBase(ProcessBase):
         data = data.reshape(self._n_rows, self._n_cols, self._n_frames)
 #        print(data.shape)
 #        data = data.reshape(self._n_rows, self._n_cols, self._n_frames)
-        print(data.shape)
+        log.debug("data shape %s", data.shape)
         return data
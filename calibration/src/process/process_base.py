@@ -4,8 +4,8 @@ from collections import namedtuple
 import os
 import sys
 import time
+import warnings
 from datetime import date
-import h5py
 import numpy as np
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -18,6 +18,8 @@ if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 
 from _version import __version__
+from utils_storage import get_storage_policy  # noqa E402
+import utils_trace  # noqa E402
 
 
 class ProcessBase(object):
@@ -29,17 +31,46 @@ class ProcessBase(object):
                                                        "singular_values",
                                                        "r_squared"])
 
+    BatchedLinearFitResult = namedtuple("batched_linear_fit_result",
+                                        ["slope",
+                                         "offset",
+                                         "residuals",
+                                         "r_squared",
+                                         "n_points"])
+
+    RobustLinearFitResult = namedtuple("robust_linear_fit_result",
+                                       ["slope",
+                                        "offset",
+                                        "residuals",
+                                        "r_squared",
+                                        "n_points",
+                                        "weights",
+                                        "n_outliers"])
+
+    # tuning constants of the robust estimators (in units of the residual
+    # scale), giving 95% efficiency for normal distributed data (huber)
+    ROBUST_THRESHOLDS = {
+        "huber": 1.345,
+        "trimmed": 3.
+    }
+
     def __init__(self, **kwargs):
 
         self._in_fname = None
+        # gathered data handed over in memory instead of reading in_fname
+        self._in_data = None
         self._in_dir = None
         self._out_fname = None
         self._method = None
+        # options of the StoragePolicy used for the output file
+        self._storage = None
 
         # add all entries of the kwargs dictionary into the class namespace
         for key, value in kwargs.items():
             setattr(self, "_" + key, value)
 
+        self._storage_policy = get_storage_policy(self._storage)
+
         self._adc_part = self._method_properties["fit_adc_part"]
         self._result = {}
         self._metadata = {}
@@ -58,14 +89,19 @@ class ProcessBase(object):
         """
         total_time = time.time()
 
-        self._initiate()
+        with utils_trace.span("process"):
+            with utils_trace.span("initiate"):
+                self._initiate()
 
-        self._calculate()
+            with utils_trace.span("calculate"):
+                self._calculate()
 
-        print("Start saving results at {} ... ".format(self._out_fname),
-              end='')
-        self._write_data()
-        print("Done.")
+            print("Start saving results at {} ... ".format(self._out_fname),
+                  end='')
+            with utils_trace.span("write"):
+                self._write_data()
+                utils_trace.add_file_size("bytes_written", self._out_fname)
+            print("Done.")
 
         print("Process took time: {}\n".format(time.time() - total_time))
 
@@ -171,51 +207,343 @@ class ProcessBase(object):
 
         return new_res
 
+    def _fit_linear_batched(self, x, y, mask=None, axis=-1, weights=None):
+        """Solves y = mx + b for all pixels of a data cube at once.
+
+        Instead of calling lstsq for every pixel, the per-pixel sums
+        (n, sum x, sum y, sum xy, sum x^2, sum y^2) are accumulated along the
+        fitting axis and the closed-form least squares solution is computed
+        for all pixels together.
+
+        Args:
+            x (numpy array): The x values corresponding to the data points
+                             along the fitting axis, e.g. the Vin per frame.
+            y (numpy array): The data points to fit, e.g. of shape
+                             (n_adcs, n_cols, n_frames, n_groups).
+            mask (optional): A boolean array of the same shape as y marking
+                             the entries to not consider for the fitting.
+            axis (optional): The axis of y along which to fit.
+            weights (optional): An array of the same shape as y with the
+                                weight of every data point (weighted least
+                                squares).
+
+        Return:
+            A named tuple with the slope, offset, residuals (sum of squared
+            residuals), r_squared and number of points used. Each entry has
+            the shape of y without the fitting axis. Pixels without any
+            point to fit are set to NaN. As in _fit_linear constant y values
+            result in slope 0 and r_squared 1.
+        """
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.moveaxis(y, axis, -1)
+
+        # center x to keep the sums numerically stable
+        x_ref = x.mean()
+        x = x - x_ref
+
+        if mask is None and weights is None:
+            y_masked = y.astype(np.float64)
+
+            n = np.full(y.shape[:-1], y.shape[-1], dtype=np.float64)
+            sum_x = np.full(y.shape[:-1], x.sum())
+            sum_xx = np.full(y.shape[:-1], np.dot(x, x))
+        else:
+            if weights is None:
+                weights = np.ones(y.shape, dtype=np.float64)
+            else:
+                weights = np.moveaxis(weights, axis, -1).astype(np.float64)
+
+            if mask is not None:
+                weights = weights * np.logical_not(np.moveaxis(mask, axis, -1))
+
+            y_masked = weights * y
+
+            n = weights.sum(axis=-1)
+            sum_x = np.dot(weights, x)
+            sum_xx = np.dot(weights, x * x)
+
+        sum_y = y_masked.sum(axis=-1)
+        sum_xy = np.dot(y_masked, x)
+        sum_yy = np.einsum("...i,...i->...", y_masked, y)
+
+        return self._solve_linear_sums(n=n,
+                                       sum_x=sum_x,
+                                       sum_y=sum_y,
+                                       sum_xx=sum_xx,
+                                       sum_xy=sum_xy,
+                                       sum_yy=sum_yy,
+                                       x_ref=x_ref)
+
+    def _fit_linear_robust(self, x, y, mask=None, axis=-1,
+                           estimator="huber", n_iterations=5,
+                           threshold=None, min_scale=0.5):
+        """Solves y = mx + b for all pixels at once, down-weighting outliers.
+
+        Runs iteratively reweighted least squares: starting from the least
+        squares solution, the residuals of each pixel are scaled by their
+        median absolute deviation and the points are reweighted according to
+        the estimator before fitting again. Every iteration works on the
+        whole data cube.
+
+        Args:
+            x (numpy array): The x values corresponding to the data points
+                             along the fitting axis, e.g. the Vin per frame.
+            y (numpy array): The data points to fit, e.g. of shape
+                             (n_adcs, n_cols, n_frames, n_groups).
+            mask (optional): A boolean array of the same shape as y marking
+                             the entries to not consider for the fitting.
+            axis (optional): The axis of y along which to fit.
+            estimator (optional): How to weight the points:
+                "huber": Points beyond the threshold get the weight
+                         threshold / |residual|.
+                "trimmed": Points beyond the threshold are not used.
+            n_iterations (optional): The number of reweighting steps.
+            threshold (optional): Where the outliers start (in units of the
+                                  residual scale). Defaults to
+                                  ROBUST_THRESHOLDS of the estimator.
+            min_scale (optional): Lower limit of the residual scale. As the
+                                  ADC values are integers the scale of good
+                                  pixels can be 0 which would make every
+                                  deviation an outlier.
+
+        Return:
+            A named tuple as returned by _fit_linear_batched with the
+            additional entries weights (final weight of every data point,
+            same shape as y) and n_outliers (number of down-weighted points
+            per pixel).
+        """
+
+        if estimator not in self.ROBUST_THRESHOLDS:
+            raise Exception("Unsupported robust estimator {}. Use one of {}"
+                            .format(estimator,
+                                    list(self.ROBUST_THRESHOLDS.keys())))
+
+        if threshold is None:
+            threshold = self.ROBUST_THRESHOLDS[estimator]
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.moveaxis(y, axis, -1)
+        if mask is None:
+            valid = np.ones(y.shape, dtype=np.bool_)
+        else:
+            valid = np.logical_not(np.moveaxis(mask, axis, -1))
+
+        weights = valid.astype(np.float64)
+        fit = self._fit_linear_batched(x, y, weights=weights)
+
+        for _ in range(n_iterations):
+            residuals = (y
+                         - fit.slope[..., np.newaxis] * x
+                         - fit.offset[..., np.newaxis])
+            residuals = np.abs(residuals)
+
+            # robust estimation of the residual scale per pixel
+            residuals[~valid] = np.nan
+            with np.errstate(divide="ignore", invalid="ignore"):
+                with warnings.catch_warnings():
+                    # pixels without any valid point
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    scale = 1.4826 * np.nanmedian(residuals, axis=-1)
+                scale = np.fmax(scale, min_scale)
+
+                u = residuals / scale[..., np.newaxis]
+
+                if estimator == "huber":
+                    weights = np.minimum(1, threshold / u)
+                else:
+                    weights = (u <= threshold).astype(np.float64)
+
+            # masked points and pixels which could not be fitted
+            weights[np.isnan(weights)] = 0
+            weights[valid & np.isnan(u)] = 1
+
+            fit = self._fit_linear_batched(x, y, weights=weights)
+
+        n_outliers = np.sum(valid & (weights < 1), axis=-1)
+
+        return ProcessBase.RobustLinearFitResult(
+            slope=fit.slope,
+            offset=fit.offset,
+            residuals=fit.residuals,
+            r_squared=fit.r_squared,
+            n_points=fit.n_points,
+            weights=np.moveaxis(weights, -1, axis),
+            n_outliers=n_outliers
+        )
+
+    def _fit_linear_grouped(self, x, y, groups, n_group_values, mask=None,
+                            axis=-1):
+        """Solves y = mx + b separately for every group of every pixel.
+
+        The data points of each pixel are segmented by a group label (e.g.
+        the coarse value of the frame) and the sums needed for the fit are
+        accumulated for all (pixel, group) segments in one pass with
+        np.bincount.
+
+        Args:
+            x (numpy array): The x values corresponding to the data points
+                             along the fitting axis, e.g. the Vin per frame.
+            y (numpy array): The data points to fit, e.g. of shape
+                             (n_adcs, n_cols, n_frames, n_groups).
+            groups (numpy array): Integer array of the same shape as y
+                                  containing the group label of every data
+                                  point.
+            n_group_values (int): The number of possible group labels, i.e.
+                                  labels are in [0, n_group_values).
+            mask (optional): A boolean array of the same shape as y marking
+                             the entries to not consider for the fitting.
+            axis (optional): The axis of y along which to fit.
+
+        Return:
+            A named tuple as returned by _fit_linear_batched where every
+            entry has an additional last dimension of size n_group_values.
+        """
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.moveaxis(y, axis, -1)
+        groups = np.moveaxis(groups, axis, -1)
+
+        # center x to keep the sums numerically stable
+        x_ref = x.mean()
+        x = x - x_ref
+
+        pixel_shape = y.shape[:-1]
+        n_pixels = int(np.prod(pixel_shape))
+        n_segments = n_pixels * n_group_values
+
+        # label every data point with the segment (pixel, group) it belongs to
+        segment = np.arange(n_pixels).reshape(pixel_shape + (1,))
+        segment = segment * n_group_values + groups
+        segment = segment.ravel()
+
+        x = np.broadcast_to(x, y.shape).ravel()
+        y = y.ravel().astype(np.float64)
+
+        if mask is not None:
+            keep = np.logical_not(np.moveaxis(mask, axis, -1)).ravel()
+            segment = segment[keep]
+            x = x[keep]
+            y = y[keep]
+
+        def sum_segments(weights=None):
+            return np.bincount(segment, weights=weights, minlength=n_segments)
+
+        sums = dict(n=sum_segments(),
+                    sum_x=sum_segments(x),
+                    sum_y=sum_segments(y),
+                    sum_xx=sum_segments(x * x),
+                    sum_xy=sum_segments(x * y),
+                    sum_yy=sum_segments(y * y))
+
+        result_shape = pixel_shape + (n_group_values,)
+        for key, value in sums.items():
+            sums[key] = value.astype(np.float64).reshape(result_shape)
+
+        return self._solve_linear_sums(x_ref=x_ref, **sums)
+
+    def _solve_linear_sums(self, n, sum_x, sum_y, sum_xx, sum_xy, sum_yy,
+                           x_ref=0):
+        """Computes the least squares solution of y = mx + b from its sums.
+
+        Args:
+            n (numpy array): The number of data points.
+            sum_x (numpy array): The sum of the x values.
+            sum_y (numpy array): The sum of the y values.
+            sum_xx (numpy array): The sum of the squared x values.
+            sum_xy (numpy array): The sum of the products of x and y.
+            sum_yy (numpy array): The sum of the squared y values.
+            x_ref (optional): The value the x values were shifted by before
+                              summing up. Is used to return the offset for
+                              the unshifted x.
+
+        Return:
+            A named tuple as returned by _fit_linear_batched.
+        """
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_x = sum_x / n
+            mean_y = sum_y / n
+
+            ss_xx = sum_xx - sum_x * mean_x
+            ss_xy = sum_xy - sum_x * mean_y
+            ss_yy = sum_yy - sum_y * mean_y
+
+            slope = ss_xy / ss_xx
+            # all points at the same x: no unique solution
+            slope[ss_xx <= 0] = np.nan
+
+            # the y values are constant
+            all_zero = np.logical_and(n > 0, ss_yy <= 0)
+            slope[all_zero] = 0
+
+            offset = mean_y - slope * mean_x - slope * x_ref
+
+            residuals = np.clip(ss_yy - slope * ss_xy, 0, None)
+            residuals[all_zero] = 0
+
+            r_squared = 1 - residuals / ss_yy
+            r_squared[all_zero] = 1
+
+        return ProcessBase.BatchedLinearFitResult(slope=slope,
+                                                  offset=offset,
+                                                  residuals=residuals,
+                                                  r_squared=r_squared,
+                                                  n_points=n)
+
     def _write_data(self):
         """Writes the result dictionary and additional metadata into a file.
         """
 
-        with h5py.File(self._out_fname, "w", libver='latest') as out_f:
+        with self._storage_policy.open_file(self._out_fname) as out_f:
 
             # write data
 
+            # the constants are read per pixel or region (no frame axis)
             for key in self._result:
-                if "type" in self._result[key]:
-                    out_f.create_dataset(self._result[key]['path'],
-                                         data=self._result[key]['data'],
-                                         dtype=self._result[key]['type'])
-                else:
-                    out_f.create_dataset(self._result[key]['path'],
-                                         data=self._result[key]['data'])
+                self._storage_policy.create_dataset(
+                    out_f,
+                    self._result[key]['path'],
+                    data=self._result[key]['data'],
+                    dtype=self._result[key].get('type', None),
+                    access=self._result[key].get('access', "tile")
+                )
 
-            # write metadata
+            self._write_metadata(out_f)
 
-            metadata_base_path = "collection"
+            out_f.flush()
 
-            today = str(date.today())
-            out_f.create_dataset("{}/creation_date".format(metadata_base_path),
-                                 data=today)
+    def _write_metadata(self, out_f):
+        """Writes the metadata into a file.
 
-            name = "{}/{}".format(metadata_base_path, "version")
-            out_f.create_dataset(name, data=__version__)
+        Args:
+            out_f: The opened h5py file to write into.
+        """
 
-            name = "{}/{}".format(metadata_base_path, "method")
-            out_f.create_dataset(name, data=self._method)
+        metadata_base_path = "collection"
 
-            name = "{}/{}".format(metadata_base_path,
-                                  "gathered_directory_"+self._adc_part)
-            out_f.create_dataset(name, data=self._in_dir)
+        today = str(date.today())
+        out_f.create_dataset("{}/creation_date".format(metadata_base_path),
+                             data=today)
 
-#            name = "{}/{}".format(metadata_base_path, "adc_part")
-#            out_f.create_dataset(name, data=self._adc_part)
+        name = "{}/{}".format(metadata_base_path, "version")
+        out_f.create_dataset(name, data=__version__)
 
-            gname = "collection"
-            for key, value in iter(self._metadata.items()):
-                name = "{}/{}".format(gname, key)
-                try:
-                    out_f.create_dataset(name, data=value)
-                except:
-                    print("Error in", name, value.dtype)
-                    raise
+        name = "{}/{}".format(metadata_base_path, "method")
+        out_f.create_dataset(name, data=self._method)
 
-            out_f.flush()
+        name = "{}/{}".format(metadata_base_path,
+                              "gathered_directory_"+self._adc_part)
+        out_f.create_dataset(name, data=self._in_dir)
+
+#        name = "{}/{}".format(metadata_base_path, "adc_part")
+#        out_f.create_dataset(name, data=self._adc_part)
+
+        gname = "collection"
+        for key, value in iter(self._metadata.items()):
+            name = "{}/{}".format(gname, key)
+            try:
+                out_f.create_dataset(name, data=value)
+            except:
+                print("Error in", name, value.dtype)
+                raise
@@ -1,6 +1,7 @@
 import numpy as np
 
-from process_base import ProcessPtcBase
+import __init__  # noqa F401
+from process_ptc_base import ProcessPtcBase, RunningStatistics
 
 
 class ProcessPtcMethod(ProcessPtcBase):
@@ -36,16 +37,13 @@ class ProcessPtcMethod(ProcessPtcBase):
         for i, run_number in enumerate(self.runs):
             in_fname = self.in_fname.format(run_number=run_number)
 
-            print("Start loading data from {} ...".format(in_fname), end="")
-            analog, digital = self.load_data(in_fname)
-            print("Done.")
-
-            print("Start computing means and standard deviations ...", end="")
-            offset = np.mean(analog, axis=0).astype(np.int)
-
-            self.result["offset"]["data"][i, ...] = offset
+            print("Start computing means and standard deviations of {} ..."
+                  .format(in_fname), end="")
+            # the frames are read in chunks to keep the memory constant
+            stats = RunningStatistics()
+            for analog in self.load_data_chunks(in_fname):
+                stats.update(analog, axis=0)
 
-            s = self.result["stddev"]["data"][i, ...]
-            for cell in np.arange(self.n_memcells):
-                s[cell, ...] = analog[:, cell, :, :].std(axis=0)
+            self.result["offset"]["data"][i, ...] = stats.mean.astype(np.int64)
+            self.result["stddev"]["data"][i, ...] = stats.get_std()
             print("Done.")
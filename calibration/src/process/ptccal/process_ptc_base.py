@@ -1,11 +1,109 @@
 """Base class for PTC calibration processing
 """
 import h5py
+import numpy as np
 import time
 
 
+class RunningStatistics(object):
+    """Single-pass mean and variance per element.
+
+    The data is added chunk-wise: the mean and sum of squared deviations of
+    each chunk are merged into the running ones (Chan et al.), which is
+    numerically stable and only needs memory for one chunk. Partial
+    statistics (e.g. of other runs or worker processes) can be merged the
+    same way.
+    """
+
+    def __init__(self, count=0, mean=None, m2=None):
+        """
+        Args:
+            count (optional, int): The number of entries already added.
+            mean (optional, numpy array): The mean of these entries.
+            m2 (optional, numpy array): Their sum of squared deviations from
+                                        the mean.
+        """
+
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, data, axis=0):
+        """Adds a chunk of data.
+
+        Args:
+            data (numpy array): The data to add, e.g. of shape
+                                (n_frames, n_memcells, n_rows, n_cols).
+            axis (optional): The axis to accumulate over.
+        """
+
+        count = data.shape[axis]
+        if count == 0:
+            return
+
+        data = np.asarray(data, dtype=np.float64)
+        mean = data.mean(axis=axis)
+        m2 = np.square(data - np.expand_dims(mean, axis)).sum(axis=axis)
+
+        self._merge(count, mean, m2)
+
+    def merge(self, other):
+        """Adds the entries described by other statistics.
+
+        Args:
+            other (RunningStatistics): The statistics to merge.
+        """
+
+        if other.count == 0:
+            return
+
+        self._merge(other.count, other.mean, other.m2)
+
+    def _merge(self, count, mean, m2):
+        if self.count == 0:
+            self.count = count
+            self.mean = np.array(mean, dtype=np.float64)
+            self.m2 = np.array(m2, dtype=np.float64)
+            return
+
+        total = self.count + count
+        delta = mean - self.mean
+
+        self.mean += delta * (count / total)
+        self.m2 += m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    def get_variance(self, ddof=0):
+        """The variance of all entries added.
+
+        Args:
+            ddof (optional): Delta degrees of freedom (as for np.var).
+        """
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.m2 / (self.count - ddof)
+
+    def get_std(self, ddof=0):
+        """The standard deviation of all entries added.
+
+        Args:
+            ddof (optional): Delta degrees of freedom (as for np.std).
+        """
+
+        return np.sqrt(self.get_variance(ddof=ddof))
+
+    def get_state(self):
+        """The state to store or send to another process.
+
+        Return:
+            A dictionary which can be passed to the constructor.
+        """
+
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+
 class ProcessPtcBase(object):
-    def __init__(self, in_fname, out_fname, runs):
+    def __init__(self, in_fname, out_fname, runs, frames_per_chunk=100):
 
         self._out_fname = out_fname
 
@@ -14,17 +112,21 @@ class ProcessPtcBase(object):
 
         self.runs = runs
 
-        # TODO extract n_cols and n_rows from raw_shape
-        self.n_rows = 128
-        self.n_cols = 512
+        # how many frames are read at once
+        self.frames_per_chunk = frames_per_chunk
 
         in_fname = self.in_fname.format(run_number=self.runs[0])
 
+        # the data is stored as (analog/digital, n_frames, n_memcells,
+        # n_rows, n_cols)
+        data_shape = self.get_data_shape(in_fname)
+        self.n_memcells = data_shape[-3]
+        self.n_rows = data_shape[-2]
+        self.n_cols = data_shape[-1]
+
         self.shapes = {}
         self.result = {}
 
-        in_fname = self.in_fname.format(run_number=self.runs[0])
-
         print("\n\n\nStart process")
         print("in_fname:", self.in_fname)
         print("out_fname:", self._out_fname)
@@ -32,12 +134,39 @@ class ProcessPtcBase(object):
 
         self.run()
 
+    def get_data_shape(self, in_fname):
+        with h5py.File(in_fname, "r") as f:
+            shape = f['data'].shape
+
+        return shape
+
     def load_data(self, in_fname):
         with h5py.File(in_fname, "r") as f:
             data = f['data'][()]
 
         return data
 
+    def load_data_chunks(self, in_fname):
+        """Reads the analog data frame chunk by frame chunk.
+
+        Args:
+            in_fname: The file to read from.
+
+        Return:
+            A generator of arrays of shape
+            (n_frames_in_chunk, n_memcells, n_rows, n_cols).
+        """
+
+        with h5py.File(in_fname, "r") as f:
+            dset = f['data']
+            n_frames = dset.shape[1]
+
+            for start in range(0, n_frames, self.frames_per_chunk):
+                stop = min(start + self.frames_per_chunk, n_frames)
+
+                # the first entry contains the analog data
+                yield dset[0, start:stop, ...]
+
     def initiate(self):
         pass
 
@@ -58,3 +187,19 @@ class ProcessPtcBase(object):
 
     def calculate(self):
         pass
+
+    def _write_data(self):
+        """Writes the result dictionary into a file.
+        """
+
+        with h5py.File(self._out_fname, "w", libver='latest') as out_f:
+            for key in self.result:
+                if "type" in self.result[key]:
+                    out_f.create_dataset(self.result[key]['path'],
+                                         data=self.result[key]['data'],
+                                         dtype=self.result[key]['type'])
+                else:
+                    out_f.create_dataset(self.result[key]['path'],
+                                         data=self.result[key]['data'])
+
+            out_f.flush()
@@ -1,7 +1,8 @@
-import glob
 import h5py
 import os
 
+from utils_manifest import get_manifest
+
 
 class LoadCorrected():
     def __init__(self, input_fname_templ,
@@ -55,14 +56,17 @@ class LoadCorrected():
                                                col_start="*",
                                                col_stop="*")
 
-        return len(glob.glob(input_fname))
+        manifest = get_manifest(os.path.dirname(input_fname))
+
+        return len(manifest.refresh(os.path.basename(input_fname)))
 
     def _get_input_fname(self, input_fname_templ):
         input_fname = input_fname_templ.format(data_type=self._data_type,
                                                col_start="*",
                                                col_stop="*")
 
-        file = glob.glob(input_fname)
+        manifest = get_manifest(os.path.dirname(input_fname))
+        file = manifest.refresh(os.path.basename(input_fname))
 
         return file[0]
 
@@ -1,8 +1,11 @@
-import glob
 import h5py
 import numpy as np
 import os
 
+import utils
+from utils_manifest import get_manifest
+from utils_storage import get_master_fname, open_memmap
+
 
 class LoadGathered():
     def __init__(self, input_fname_templ, output_dir, adc, frame, row, col):
@@ -32,10 +35,12 @@ class LoadGathered():
 
         self._metadata_paths = {
             "vin": "vin",
-            "n_frames_per_run": "collection/n_frames_per_run"
+            "n_frames_per_run": "collection/n_frames_per_run",
+            "frame_offsets": "collection/frame_offsets"
         }
 
         self._n_frames_per_vin = None
+        self._frame_offsets = None
 
         self._n_frames = None
         self._n_groups = None
@@ -43,14 +48,38 @@ class LoadGathered():
 
     def _get_input_fname(self, input_fname_templ, col):
 
+        # the file combining all parts (written by gather) contains every
+        # column, the columns covered are stored in the file
+        combined_fname = get_master_fname(
+            input_fname_templ.format(data_type=self._data_type,
+                                     col_start=0,
+                                     col_stop="*")
+        )
+        manifest = get_manifest(os.path.dirname(combined_fname))
+
+        searched_file, col_offset = manifest.find_column(
+            col,
+            pattern=os.path.basename(combined_fname)
+        )
+        if searched_file is not None:
+            return searched_file, col_offset
+
         input_fname = input_fname_templ.format(data_type=self._data_type,
                                                col_start="*",
                                                col_stop="*")
         print(input_fname_templ)
-        files = glob.glob(input_fname)
 
-        # TODO do not use file name but "collections/columns_used" entry in
-        # files
+        # the columns contained are stored in the files (and in the manifest)
+        searched_file, col_offset = manifest.find_column(
+            col,
+            pattern=os.path.basename(input_fname)
+        )
+        if searched_file is not None:
+            return searched_file, col_offset
+
+        # files without column information: use the file name
+        files = manifest.refresh(os.path.basename(input_fname))
+
         prefix, middle = input_fname_templ.split("{col_start}")
         middle, suffix = middle.split("{col_stop}")
 
@@ -90,10 +119,24 @@ class LoadGathered():
             n_frames_per_run = self._metadata_paths["n_frames_per_run"]
             self._n_frames_per_vin = f[n_frames_per_run][()]
 
+            frame_offsets = self._metadata_paths["frame_offsets"]
+            if frame_offsets in f:
+                self._frame_offsets = f[frame_offsets][()]
+            else:
+                # gathered before the offsets were stored
+                self._frame_offsets = utils.get_frame_offsets(
+                    self._n_frames_per_vin
+                )
+
             data = {}
             for key, path in self._paths.items():
                 idx = (self._adc, col, slice(None), self._row)
-                d = f[path][idx].astype(np.float)
+
+                # only read the pages containing the pixel if possible
+                dset = open_memmap(f[path])
+                if dset is None:
+                    dset = f[path]
+                d = np.asarray(dset[idx]).astype(np.float64)
 
                 # determine number of frames
                 # should be the same for all -> only once
@@ -117,12 +160,7 @@ class LoadGathered():
 
     def _fill_up_vin(self, vin, n_groups):
         # create as many entries for each vin as there were original frames
-        x = [np.full(self._n_frames_per_vin[i] * n_groups, v)
-             for i, v in enumerate(vin)]
-
-        x = np.hstack(x)
-
-        return x
+        return utils.expand_vin(vin, self._frame_offsets, n_groups)
 
     def _merge_groups_with_frames(self, data):
         if len(data.shape) == 1:
@@ -1,7 +1,8 @@
-import glob
 import h5py
 import os
 
+from utils_manifest import get_manifest
+
 
 class LoadProcessed():
     def __init__(self, input_fname_templ, output_dir, adc, row, col):
@@ -57,7 +58,8 @@ class LoadProcessed():
                                                col_start="*",
                                                col_stop="*")
 
-        file = glob.glob(input_fname)
+        manifest = get_manifest(os.path.dirname(input_fname))
+        file = manifest.refresh(os.path.basename(input_fname))
 
         return file[0]
 
@@ -2,6 +2,7 @@ import h5py
 import os
 
 import utils
+from utils_manifest import get_manifest
 
 
 class LoadRaw():
@@ -94,22 +95,10 @@ class LoadRaw():
         if self._metadata_fname is None:
             return None
         else:
-            print("Opening metadata file {}".format(self._metadata_fname))
-            with open(self._metadata_fname, "r") as f:
-                file_content = f.read().splitlines()
-
             # data looks like this: <V_in>  <file_prefix>
-            file_content = [s.split("\t") for s in file_content]
-            for i, s in enumerate(file_content):
-                try:
-                    s[0] = float(s[0])
-                except:
-                    if s == ['']:
-                        # remove empty lines
-                        del file_content[i]
-                    else:
-                        raise
-    #                print("file_content", file_content)
+            manifest = get_manifest(os.path.dirname(self._metadata_fname))
+            file_content = manifest.get_register(self._metadata_fname)
+            manifest.save()
 
             filename = os.path.split(self._input_fname)[-1]
             vin = [content for content in file_content
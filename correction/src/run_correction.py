@@ -21,6 +21,8 @@ if SHARED_DIR not in sys.path:
 
 from _version import __version__
 import utils  # noqa E402
+from utils_storage import get_storage_policy  # noqa E402
+import utils_trace  # noqa E402
 
 
 class CorrectionBase():
@@ -29,7 +31,8 @@ class CorrectionBase():
                  dark_fname,
                  constants_fname,
                  output_fname,
-                 method):
+                 method,
+                 storage=None):
 
         self._data_fname = data_fname
         self._dark_fname = dark_fname
@@ -37,6 +40,9 @@ class CorrectionBase():
         self._out_fname = output_fname
         self._method = method
 
+        # how the output file is stored (see StoragePolicy)
+        self._storage_policy = get_storage_policy(storage)
+
         self._data_path = 'data'
         self._reset_path = 'reset'
         self._n_rows = None
@@ -188,24 +194,31 @@ class CorrectionBase():
 
         total_time = time.time()
 
-        self.load_data()
+        with utils_trace.span("correction"):
+            with utils_trace.span("load"):
+                self.load_data()
+
+                self.load_constants()
 
-        self.load_constants()
+            self.get_dims()
 
-        self.get_dims()
+            self._initiate()
 
-        self._initiate()
+            self.save_gain_info()
 
-        self.save_gain_info()
+            with utils_trace.span("correct"):
+                self._calculate()
 
-        self._calculate()
+                self._calculate_cds()
 
-        self._calculate_cds()
+            utils_trace.add_count("frames_corrected", self._n_frames)
 
-        print('Start saving results as {} ...'.format(self._out_fname),
-              end='')
-        self._write_data()
-        print('Done.')
+            print('Start saving results as {} ...'.format(self._out_fname),
+                  end='')
+            with utils_trace.span("write"):
+                self._write_data()
+                utils_trace.add_file_size("bytes_written", self._out_fname)
+            print('Done.')
 
         print('Process took time: {}\n'.format(time.time() - total_time))
 
@@ -237,13 +250,18 @@ class CorrectionBase():
 
         self._raw_data = self._raw_data_content[self._data_path]
         self._raw_reset = self._raw_data_content[self._reset_path]
+        utils_trace.add_count("bytes_read",
+                              self._raw_data.nbytes + self._raw_reset.nbytes)
 
         self._n_frames = self._raw_data.shape[0]
 
         # Splitting adc output (sample and reset) into coarse/fine/gain values
         print("Convert adc output into coarse/fine/gain values...")
-        self._s_crs, self._s_fn, self._s_gn = utils.split(self._raw_data)
-        self._r_crs, self._r_fn, self._r_gn = utils.split(self._raw_reset)
+        with utils_trace.span("split"):
+            self._s_crs, self._s_fn, self._s_gn = utils.split(self._raw_data)
+            self._r_crs, self._r_fn, self._r_gn = utils.split(
+                self._raw_reset
+            )
         print("Done.")
 
     def load_constants(self):
@@ -263,17 +281,20 @@ class CorrectionBase():
         """Writes the result dictionary and additional metadata into a file.
         """
 
-        with h5py.File(self._out_fname, "w", libver='latest') as out_f:
+        with self._storage_policy.open_file(self._out_fname) as out_f:
 
             # write data
+            # the corrected data is read frame by frame, thus each chunk
+            # holds a (tile of a) frame
             for key in self._result:
-                if "type" in self._result[key]:
-                    out_f.create_dataset(self._result[key]['path'],
-                                         data=self._result[key]['data'],
-                                         dtype=self._result[key]['type'])
-                else:
-                    out_f.create_dataset(self._result[key]['path'],
-                                         data=self._result[key]['data'])
+                self._storage_policy.create_dataset(
+                    out_f,
+                    self._result[key]['path'],
+                    data=self._result[key]['data'],
+                    dtype=self._result[key].get('type', None),
+                    access="frame",
+                    frame_axis=0
+                )
 
             # write metadata
 
@@ -307,6 +328,23 @@ def get_arguments():
                         dest='output',
                         type=str,
                         help=("Path of output directory for storing files"))
+    parser.add_argument('--compression',
+                        dest='compression',
+                        type=str,
+                        choices=["lzf", "gzip"],
+                        default=None,
+                        help=("Compress the corrected data"))
+    parser.add_argument('--chunk_cache_mb',
+                        dest='chunk_cache_mb',
+                        type=float,
+                        default=None,
+                        help=("Size of the HDF5 chunk cache"))
+    parser.add_argument('--trace',
+                        dest='trace',
+                        type=str,
+                        default=None,
+                        help=("Write timings, counters and peak memory of "
+                              "the run into this json file"))
 
     args = parser.parse_args()
 
@@ -322,10 +360,20 @@ if __name__ == '__main__':
     output_dir = args.output
     constants_dir = args.constants
     method = 'correction_adc_default'
+    # without any storage option the output is stored contiguous
+    if args.compression is None and args.chunk_cache_mb is None:
+        storage = None
+    else:
+        storage = dict(compression=args.compression,
+                       chunk_cache_mb=args.chunk_cache_mb)
 
     obj = CorrectionBase(data_fname,
                          dark_fname,
                          constants_dir,
                          output_dir,
-                         method)
+                         method,
+                         storage=storage)
     obj.run()
+
+    if args.trace is not None:
+        utils_trace.get_tracer().write(args.trace)
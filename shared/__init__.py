@@ -5,17 +5,43 @@ from .utils import (create_dir,
                     check_file_exists,
                     load_file_content,
                     IndexTracker)
+from .utils_cache import (get_file_fingerprint,
+                          ResultCache)
 from .utils_config import (load_config,
                            update_dict)
+from .utils_manifest import (get_manifest,
+                             read_register,
+                             Manifest)
+from .utils_storage import (create_virtual_file,
+                            get_master_fname,
+                            get_storage_policy,
+                            open_memmap,
+                            StoragePolicy)
+from .utils_trace import (configure_logging,
+                          get_logger,
+                          get_peak_rss_mb,
+                          start_trace,
+                          get_tracer,
+                          span,
+                          add_count,
+                          add_file_size,
+                          Tracer)
 from .utils_data import (decode_dataset_8bit,
                          convert_bitlist_to_int,
                          convert_bytelist_to_int,
                          convert_intarray_to_bitarray,
                          convert_bitarray_to_intarray,
                          swap_bits,
+                         byteswap_uint16,
+                         convert_bytes_to_uint16,
+                         get_bitplane_tables,
+                         decode_bitplanes,
+                         split_chunked,
                          split_alessandro,
                          split_ulrik,
                          split,
+                         get_frame_offsets,
+                         expand_vin,
                          get_adc_col_array,
                          get_col_grp,
                          reorder_pixels_gncrsfn,
@@ -26,9 +52,32 @@ _all_ = [
     "check_file_exists",
     "load_file_content",
     "IndexTracker",
+    # from utils_cache
+    "get_file_fingerprint",
+    "ResultCache",
     # from utils_config
     "load_config",
     "update_dict",
+    # from utils_manifest
+    "get_manifest",
+    "read_register",
+    "Manifest",
+    # from utils_storage
+    "create_virtual_file",
+    "get_master_fname",
+    "get_storage_policy",
+    "open_memmap",
+    "StoragePolicy",
+    # from utils_trace
+    "configure_logging",
+    "get_logger",
+    "get_peak_rss_mb",
+    "start_trace",
+    "get_tracer",
+    "span",
+    "add_count",
+    "add_file_size",
+    "Tracer",
     # from utils_data
     "decode_dataset_8bit",
     "convert_bitlist_to_int",
@@ -36,9 +85,16 @@ _all_ = [
     "convert_intarray_to_bitarray",
     "convert_bitarray_to_intarray",
     "swap_bits",
+    "byteswap_uint16",
+    "convert_bytes_to_uint16",
+    "get_bitplane_tables",
+    "decode_bitplanes",
+    "split_chunked",
     "split_alessandro",
     "split_ulrik",
     "split",
+    "get_frame_offsets",
+    "expand_vin",
     "get_adc_col_array",
     "get_col_grp",
     "reorder_pixels_gncrsfn",
@@ -14,10 +14,16 @@ from utils_data import (decode_dataset_8bit,
                         convert_intarray_to_bitarray,
                         convert_bitarray_to_intarray,
                         convert_slice_to_tuple,
+                        byteswap_uint16,
+                        convert_bytes_to_uint16,
+                        get_bitplane_tables,
+                        decode_bitplanes,
                         swap_bits,
                         split_alessandro,
                         split_ulrik,
                         split,
+                        get_frame_offsets,
+                        expand_vin,
                         get_adc_col_array,
                         get_col_grp,
                         reorder_pixels_gncrsfn,
@@ -0,0 +1,286 @@
+"""Content-addressed cache for the results of the analysis stages.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from _version import __version__
+
+
+def get_file_fingerprint(fname, digest="stat"):
+    """Describes the state of a file.
+
+    Args:
+        fname (str): The file to describe.
+        digest (optional, str): How to identify the file content:
+            "stat": Use size and modification time (cheap).
+            "content": Use the sha256 checksum of the file content (reads the
+                       whole file).
+
+    Return:
+        A list which changes if the file changes.
+    """
+
+    if not os.path.exists(fname):
+        return [fname, None]
+
+    stat = os.stat(fname)
+
+    if digest == "stat":
+        return [fname, stat.st_size, stat.st_mtime_ns]
+    elif digest == "content":
+        checksum = hashlib.sha256()
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                checksum.update(block)
+
+        return [fname, stat.st_size, checksum.hexdigest()]
+    else:
+        raise Exception("Unsupported digest {}".format(digest))
+
+
+class ResultCache(object):
+    """Keeps track of result files addressed by a hash of everything they
+    depend on (input files, method, method properties and version).
+
+    The results are not copied: an entry refers to the result file and its
+    fingerprint, which is re-validated before the result is reused. Where
+    possible the cache directory holds a hard link to the result, so it
+    survives the output being removed without using additional disk space.
+    The index file stores source, fingerprint, size and last usage of each
+    entry. If the total size exceeds the budget the least recently used
+    entries are removed.
+    """
+
+    def __init__(self, cache_dir, budget_gb=None, digest="stat"):
+        """
+        Args:
+            cache_dir (str): The directory to store the cached results in.
+            budget_gb (optional, float): The disk space the cache is allowed
+                                         to use. If not set the cache is not
+                                         limited.
+            digest (optional, str): How to identify the input files (see
+                                    get_file_fingerprint).
+        """
+
+        self._cache_dir = cache_dir
+        self._digest = digest
+
+        if budget_gb is None:
+            self._budget = None
+        else:
+            self._budget = int(budget_gb * 1024**3)
+
+        self._index_fname = os.path.join(self._cache_dir, "index.json")
+
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+        self._index = self._read_index()
+
+    def _read_index(self):
+        if not os.path.exists(self._index_fname):
+            return {}
+
+        try:
+            with open(self._index_fname) as f:
+                index = json.load(f)
+        except ValueError:
+            print("Cache index {} is corrupted, starting with an empty "
+                  "cache.".format(self._index_fname))
+            index = {}
+
+        return index
+
+    def _write_index(self):
+        # write to a temporary file first to not leave a broken index behind
+        tmp_fname = self._index_fname + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(self._index, f, sort_keys=True, indent=4)
+        os.replace(tmp_fname, self._index_fname)
+
+    def _get_entry_fname(self, key):
+        return os.path.join(self._cache_dir, "{}.h5".format(key))
+
+    def get_key(self, stage, method, method_properties, in_fnames,
+                parameters=None):
+        """Computes the cache key of a result.
+
+        Args:
+            stage (str): The analysis stage, e.g. "gather".
+            method (str): The name of the method used.
+            method_properties (dict): The configuration of the method.
+            in_fnames (list): The input files the result depends on.
+            parameters (optional, dict): Further parameters the result
+                                         depends on (e.g. the column part).
+
+        Return:
+            The key as hex string.
+        """
+
+        description = {
+            "stage": stage,
+            "method": method,
+            "method_properties": method_properties,
+            "version": __version__,
+            "inputs": [get_file_fingerprint(fname, self._digest)
+                       for fname in sorted(in_fnames)],
+            "parameters": parameters
+        }
+
+        description = json.dumps(description, sort_keys=True, default=str)
+
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _get_fingerprint(self, fname):
+        # the name is not part of it, the same content can be linked to
+        # several locations
+        return get_file_fingerprint(fname, self._digest)[1:]
+
+    def _find_valid_file(self, key):
+        """Looks up the file holding the cached result.
+
+        Args:
+            key (str): The cache key of the result.
+
+        Return:
+            The name of a file which still matches the fingerprint stored
+            with the entry or None if there is none.
+        """
+
+        entry = self._index[key]
+        # entries of older versions have no fingerprint and are not reused
+        fingerprint = entry.get("fingerprint", None)
+
+        for fname in [self._get_entry_fname(key), entry["source"]]:
+            if (os.path.exists(fname)
+                    and self._get_fingerprint(fname) == fingerprint):
+                return fname
+
+        return None
+
+    def restore(self, key, out_fname):
+        """Provides the cached result at the output location.
+
+        Args:
+            key (str): The cache key of the result.
+            out_fname (str): Where the result is expected.
+
+        Return:
+            True if the result was found in the cache, False otherwise.
+        """
+
+        if key not in self._index:
+            return False
+
+        entry = self._index[key]
+
+        # nothing to do if the output is the cached result already
+        if (os.path.exists(out_fname)
+                and self._get_fingerprint(out_fname)
+                == entry.get("fingerprint", None)):
+            entry["last_used"] = time.time()
+            self._write_index()
+            return True
+
+        cached_fname = self._find_valid_file(key)
+        if cached_fname is None:
+            # the result was removed or overwritten
+            self._remove_entry(key)
+            self._write_index()
+            return False
+
+        out_dir = os.path.dirname(out_fname)
+        if out_dir and not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        if os.path.exists(out_fname):
+            os.remove(out_fname)
+
+        # hard links and copy2 keep the modification time, thus later stages
+        # still find their results
+        try:
+            os.link(cached_fname, out_fname)
+        except OSError:
+            shutil.copy2(cached_fname, out_fname)
+
+        entry["last_used"] = time.time()
+        self._write_index()
+
+        return True
+
+    def store(self, key, out_fname):
+        """Adds a result to the cache.
+
+        Args:
+            key (str): The cache key of the result.
+            out_fname (str): The result file.
+        """
+
+        entry_fname = self._get_entry_fname(key)
+        if os.path.exists(entry_fname):
+            os.remove(entry_fname)
+
+        try:
+            os.link(out_fname, entry_fname)
+        except OSError:
+            # e.g. the cache is on another file system, only refer to the
+            # result
+            pass
+
+        self._index[key] = {
+            "source": out_fname,
+            "size": os.stat(out_fname).st_size,
+            "fingerprint": self._get_fingerprint(out_fname),
+            "last_used": time.time()
+        }
+
+        self.evict()
+
+    def invalidate(self, key=None):
+        """Removes entries from the cache.
+
+        Args:
+            key (optional, str): The key of the entry to remove. If not set,
+                                 all entries are removed.
+        """
+
+        if key is None:
+            keys = list(self._index.keys())
+        else:
+            keys = [key] if key in self._index else []
+
+        for k in keys:
+            self._remove_entry(k)
+
+        self._write_index()
+
+    def _remove_entry(self, key):
+        entry_fname = self._get_entry_fname(key)
+        if os.path.exists(entry_fname):
+            os.remove(entry_fname)
+
+        del self._index[key]
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits into
+        the budget.
+        """
+
+        if self._budget is not None:
+            total_size = sum(entry["size"] for entry in self._index.values())
+
+            by_usage = sorted(self._index.items(),
+                              key=lambda item: item[1]["last_used"])
+
+            for key, entry in by_usage:
+                if total_size <= self._budget:
+                    break
+
+                print("Cache exceeds budget, remove entry of {}"
+                      .format(entry["source"]))
+                total_size -= entry["size"]
+                self._remove_entry(key)
+
+        self._write_index()
@@ -133,7 +133,210 @@ def convert_slice_to_tuple(item):
     return new_item
 
 
-def split_alessandro(raw_dset):
+def byteswap_uint16(in_array):
+    """Swaps the two bytes of every 16 bit entry: (By0, By1) => (By1, By0)
+
+    Args:
+        in_array: Array of which only the lower 16 bit of each entry are
+                  used.
+
+    Return:
+        A uint16 array of the same shape.
+    """
+
+    return np.asarray(in_array).astype(np.uint16).byteswap()
+
+
+def convert_bytes_to_uint16(in_array):
+    """Combines every two bytes into a 16 bit word (big endian).
+
+    Args:
+        in_array: Array of uint8 where the last dimension contains the bytes
+                  (of even length).
+
+    Return:
+        A uint16 array with half of the entries in the last dimension.
+    """
+
+    in_array = np.asarray(in_array)
+
+    words = in_array[..., 0::2].astype(np.uint16)
+    words <<= 8
+    words |= in_array[..., 1::2]
+
+    return words
+
+
+_bitplane_tables = {}
+
+
+def get_bitplane_tables(n_values, n_bits, payload_bits):
+    """Locates each bit of a bit plane stream inside of packed words.
+
+    Args:
+        n_values (int): The number of values in the stream.
+        n_bits (int): The number of bits per value (i.e. of bit planes).
+        payload_bits (int): The number of stream bits each word carries in
+                            its lowest bits (most significant first).
+
+    Return:
+        The index of the word and the shift inside of the word for each bit
+        as arrays of shape (n_bits, n_values).
+    """
+
+    key = (n_values, n_bits, payload_bits)
+
+    if key not in _bitplane_tables:
+        position = np.arange(n_bits * n_values).reshape(n_bits, n_values)
+
+        word_idx = position // payload_bits
+        shift = (payload_bits - 1 - position % payload_bits).astype(np.uint16)
+
+        word_idx.setflags(write=False)
+        shift.setflags(write=False)
+        _bitplane_tables[key] = (word_idx, shift)
+
+    return _bitplane_tables[key]
+
+
+def decode_bitplanes(words, n_values, n_bits=15, payload_bits=15,
+                     invert=True, out=None):
+    """Assembles values sent out bit plane by bit plane.
+
+    The stream contains the most significant bit of all values, then the
+    next bit of all values and so on. It is packed into words carrying
+    payload_bits each (the remaining head bits are ignored). Each bit is
+    picked from its word with precomputed shift tables, thus the data is
+    never expanded into single bits.
+
+    Args:
+        words: Array (..., n_words) of 16 bit words.
+        n_values (int): The number of values per stream.
+        n_bits (optional, int): The number of bits per value.
+        payload_bits (optional, int): The number of stream bits per word.
+        invert (optional, bool): Invert the bits (0=>1, 1=>0).
+        out (optional): C-contiguous uint16 array of shape (..., n_values)
+                        to write into.
+
+    Return:
+        The values as uint16 array of shape (..., n_values).
+    """
+
+    words = np.asarray(words)
+    if words.dtype != np.uint16:
+        words = words.astype(np.uint16)
+
+    if n_bits * n_values > payload_bits * words.shape[-1]:
+        raise Exception("{} words of {} bits cannot hold {} values of {} "
+                        "bits".format(words.shape[-1], payload_bits,
+                                      n_values, n_bits))
+
+    word_idx, shift = get_bitplane_tables(n_values, n_bits, payload_bits)
+
+    shape = words.shape[:-1] + (n_values,)
+    if out is None:
+        out = np.empty(shape, dtype=np.uint16)
+
+    # work on rows of a 2d view and decode them in chunks which stay in the
+    # CPU cache (fancy indexing is much faster than np.take along an axis)
+    words_2d = words.reshape(-1, words.shape[-1])
+    out_2d = out.reshape(-1, n_values)
+    n_rows = max(1, SPLIT_CHUNK_SIZE // n_values)
+
+    for start in range(0, words_2d.shape[0], n_rows):
+        w = words_2d[start:start + n_rows]
+        o = out_2d[start:start + n_rows]
+        o[...] = 0
+
+        for i in range(n_bits):
+            plane = w[:, word_idx[i]]
+            plane >>= shift[i]
+            plane &= 1
+            plane <<= n_bits - 1 - i
+            o |= plane
+
+    if invert:
+        out ^= (1 << n_bits) - 1
+
+    return out
+
+
+# bit mask and shift of coarse, fine and gain for each readout bit layout
+SPLIT_LAYOUTS = {
+    # see split
+    "dlsraw": [(0x1F, 0), (0x1FE0, 5), (0x6000, 5+8)],
+    # see split_alessandro
+    "alessandro": [(0xF800, 1+2+8), (0x07F8, 1+2), (0x0006, 1)],
+    # see split_ulrik
+    "ulrik": [(0x7C00, 2+8), (0x03FC, 2), (0x0003, 0)]
+}
+
+# number of entries decoded at once (the chunk stays in the CPU cache)
+SPLIT_CHUNK_SIZE = 1 << 16
+
+
+def split_chunked(raw_dset, layout="dlsraw", out=None,
+                  chunk_size=SPLIT_CHUNK_SIZE):
+    """Extracts the coarse, fine and gain bits in one pass over the data.
+
+    The data is decoded chunk by chunk: coarse, fine and gain of a chunk are
+    extracted directly after each other using one small scratch buffer and
+    written into the output arrays, thus no temporary full size arrays are
+    created.
+
+    Args:
+        raw_dset: Array containing 16 bit entries.
+        layout (optional, str): The readout bit layout (see SPLIT_LAYOUTS).
+        out (optional): Tuple of coarse, fine and gain arrays to write into
+                        (uint8, C-contiguous, same shape as raw_dset).
+        chunk_size (optional, int): Number of entries decoded at once.
+
+    Return:
+        Each a coarse, fine and gain bit array.
+    """
+
+    try:
+        bit_layout = SPLIT_LAYOUTS[layout]
+    except KeyError:
+        raise Exception("Unsupported layout {} (supported are {})"
+                        .format(layout, list(SPLIT_LAYOUTS.keys())))
+
+    raw = np.asarray(raw_dset)
+    if not raw.flags.c_contiguous:
+        raw = np.ascontiguousarray(raw)
+    # only the lower 16 bit are used by all layouts
+    if raw.dtype != np.uint16:
+        raw = raw.astype(np.uint16)
+
+    if out is None:
+        out = tuple(np.empty(raw.shape, dtype=np.uint8) for _ in range(3))
+    else:
+        for arr in out:
+            if (arr.shape != raw.shape
+                    or arr.dtype != np.uint8
+                    or not arr.flags.c_contiguous):
+                raise Exception("Output arrays have to be C-contiguous uint8 "
+                                "arrays of shape {}".format(raw.shape))
+
+    raw_flat = raw.reshape(-1)
+    out_flat = [arr.reshape(-1) for arr in out]
+
+    scratch = np.empty(min(chunk_size, raw_flat.size), dtype=np.uint16)
+
+    for start in range(0, raw_flat.size, chunk_size):
+        stop = min(start + chunk_size, raw_flat.size)
+        chunk = raw_flat[start:stop]
+        tmp = scratch[:stop - start]
+
+        for (bit_mask, bit_shift), arr in zip(bit_layout, out_flat):
+            np.bitwise_and(chunk, bit_mask, out=tmp)
+            np.right_shift(tmp, bit_shift, out=tmp)
+            arr[start:stop] = tmp
+
+    return tuple(out)
+
+
+def split_alessandro(raw_dset, out=None):
     """Extracts the coarse, fine and gain bits.
 
     Readout bit number
@@ -147,31 +350,17 @@ def split_alessandro(raw_dset):
 
     Args:
         raw_dset: Array containing 16 bit entries.
+        out (optional): Tuple of coarse, fine and gain arrays to write into.
 
     Return:
         Each a coarse, fine and gain bit array.
 
     """
 
-    # 0xF800 -> 1111100000000000
-    coarse_adc = decode_dataset_8bit(arr_in=raw_dset,
-                                     bit_mask=0xF800,
-                                     bit_shift=1+2+8)
-
-    # 0x07F8 -> 0000011111111000
-    fine_adc = decode_dataset_8bit(arr_in=raw_dset,
-                                   bit_mask=0x07F8,
-                                   bit_shift=1+2)
+    return split_chunked(raw_dset, layout="alessandro", out=out)
 
-    # 0x0006 -> 0000000000000110
-    gain_bits = decode_dataset_8bit(arr_in=raw_dset,
-                                    bit_mask=0x0006,
-                                    bit_shift=1)
 
-    return coarse_adc, fine_adc, gain_bits
-
-
-def split_ulrik(raw_dset):
+def split_ulrik(raw_dset, out=None):
     """Extracts the coarse, fine and gain bits.
 
     Readout bit number
@@ -185,31 +374,17 @@ def split_ulrik(raw_dset):
 
     Args:
         raw_dset: Array containing 16 bit entries.
+        out (optional): Tuple of coarse, fine and gain arrays to write into.
 
     Return:
         Each a coarse, fine and gain bit array.
 
     """
 
-    # 0x7C00 -> 0111110000000000
-    coarse_adc = decode_dataset_8bit(arr_in=raw_dset,
-                                     bit_mask=0x7C00,
-                                     bit_shift=2+8)
-
-    # 0x03FC -> 0000001111111100
-    fine_adc = decode_dataset_8bit(arr_in=raw_dset,
-                                   bit_mask=0x03FC,
-                                   bit_shift=2)
+    return split_chunked(raw_dset, layout="ulrik", out=out)
 
-    # 0x0003 -> 0000000000000011
-    gain_bits = decode_dataset_8bit(arr_in=raw_dset,
-                                    bit_mask=0x0003,
-                                    bit_shift=0)
 
-    return coarse_adc, fine_adc, gain_bits
-
-
-def split(raw_dset):
+def split(raw_dset, out=None):
     """Extracts the coarse, fine and gain bits.
 
     Readout bit number
@@ -223,28 +398,47 @@ def split(raw_dset):
 
     Args:
         raw_dset: Array containing 16 bit entries.
+        out (optional): Tuple of coarse, fine and gain arrays to write into.
 
     Return:
         Each a coarse, fine and gain bit array.
 
     """
 
-    # 0x1F   -> 0000000000011111
-    coarse_adc = decode_dataset_8bit(arr_in=raw_dset,
-                                     bit_mask=0x1F,
-                                     bit_shift=0)
+    return split_chunked(raw_dset, layout="dlsraw", out=out)
+
+
+def get_frame_offsets(n_frames_per_run):
+    """Determines where the frames of each run start.
+
+    Args:
+        n_frames_per_run: The number of frames of each run (may differ, e.g.
+                          if frames were dropped).
+
+    Return:
+        An int array of length n_runs + 1. The frames of run i are
+        frame_offsets[i] to frame_offsets[i + 1].
+    """
+
+    n_frames_per_run = np.asarray(n_frames_per_run, dtype=np.int64)
+
+    return np.concatenate(([0], np.cumsum(n_frames_per_run)))
 
-    # 0x1FE0 -> 0001111111100000
-    fine_adc = decode_dataset_8bit(arr_in=raw_dset,
-                                   bit_mask=0x1FE0,
-                                   bit_shift=5)
 
-    # 0x6000 -> 0110000000000000
-    gain_bits = decode_dataset_8bit(arr_in=raw_dset,
-                                    bit_mask=0x6000,
-                                    bit_shift=5+8)
+def expand_vin(vin, frame_offsets, n_groups=1):
+    """Creates one Vin entry for each frame (and group) of its run.
+
+    Args:
+        vin: The Vin value of each run.
+        frame_offsets: The start frame of each run plus the total number of
+                       frames (see get_frame_offsets).
+        n_groups (optional, int): How many entries each frame has.
+
+    Return:
+        An array of length frame_offsets[-1] * n_groups.
+    """
 
-    return coarse_adc, fine_adc, gain_bits
+    return np.repeat(np.asarray(vin), np.diff(frame_offsets) * n_groups)
 
 
 def get_adc_col_array(n_adc=7, n_xcols=4, n_ncols=8):
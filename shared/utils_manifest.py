@@ -0,0 +1,345 @@
+"""Index of the data files of a directory.
+
+The index (manifest) is stored as json file next to the data and records for
+each HDF5 file the shapes and dtypes of its datasets and the columns it
+contains, and for each register file its entries (Vin and file prefix).
+Entries are only (re-)read if size or modification time of a file changed.
+Several processes can update the manifest of the same directory: on saving,
+the changes of a process are merged into the manifest on disk while holding a
+lock on the manifest file.
+"""
+import fcntl
+import glob
+import json
+import os
+import h5py
+
+MANIFEST_FNAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# where the files store which columns they contain
+COLUMNS_PATH = "collection/colums_used"
+
+_manifests = {}
+
+
+def get_manifest(directory):
+    """Returns the manifest of a directory.
+
+    The manifest is loaded only once per process.
+
+    Args:
+        directory (str): The directory containing the data.
+
+    Return:
+        The Manifest object.
+    """
+
+    directory = os.path.abspath(directory)
+
+    if directory not in _manifests:
+        _manifests[directory] = Manifest(directory)
+
+    return _manifests[directory]
+
+
+def read_register(fname):
+    """Parses a register file.
+
+    Args:
+        fname (str): The register file, each line looking like
+                     <V_in>\t<file_prefix>
+
+    Return:
+        A list of [vin, prefix] sorted by vin.
+    """
+
+    with open(fname, "r") as f:
+        file_content = f.read().splitlines()
+
+    register = []
+    for line in file_content:
+        if line == "":
+            # remove empty lines
+            continue
+
+        entry = line.split("\t")
+        entry[0] = float(entry[0])
+        register.append(entry)
+
+    return sorted(register)
+
+
+class Manifest(object):
+    """Keeps the metadata of the files of one directory.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): The directory containing the data.
+        """
+
+        self._directory = directory
+        self._fname = os.path.join(directory, MANIFEST_FNAME)
+
+        self._content = self._read()
+
+        # the entries changed by this process since the last save, they are
+        # merged into the manifest on disk (None marks a removed entry)
+        self._changes = {"files": {}, "registers": {}}
+
+    def _read(self):
+        empty = {"version": MANIFEST_VERSION, "files": {}, "registers": {}}
+
+        if not os.path.exists(self._fname):
+            return empty
+
+        try:
+            with open(self._fname) as f:
+                text = f.read()
+            if not text:
+                # just created by another process to lock it
+                return empty
+            content = json.loads(text)
+        except ValueError:
+            print("Manifest {} is corrupted, rebuilding it."
+                  .format(self._fname))
+            return empty
+
+        if content.get("version", None) != MANIFEST_VERSION:
+            return empty
+
+        return content
+
+    def _set_entry(self, section, key, entry):
+        if entry is None:
+            del self._content[section][key]
+        else:
+            self._content[section][key] = entry
+
+        self._changes[section][key] = entry
+
+    def _merge_changes(self, content):
+        for section, changes in self._changes.items():
+            for key, entry in changes.items():
+                if entry is None:
+                    content[section].pop(key, None)
+                else:
+                    content[section][key] = entry
+
+        return content
+
+    def _lock(self):
+        """Opens the manifest file (creating it if needed) and locks it.
+
+        The manifest is replaced when writing it, thus the lock is only
+        valid if the locked file is still the manifest, otherwise locking is
+        repeated on the new one.
+
+        Return:
+            The opened file, the lock is released when closing it.
+        """
+
+        while True:
+            lock = open(self._fname, "a")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                if (os.fstat(lock.fileno()).st_ino
+                        == os.stat(self._fname).st_ino):
+                    return lock
+            except FileNotFoundError:
+                pass
+
+            lock.close()
+
+    def save(self):
+        """Writes the manifest if it changed.
+
+        Other processes might have updated the manifest in the meantime,
+        thus the changes are merged into the manifest on disk while holding
+        a lock on it. If the directory is not writable the manifest is only
+        kept in memory.
+        """
+
+        if not any(self._changes.values()):
+            return
+
+        # use a unique temporary file and replace the manifest atomically,
+        # thus readers not taking the lock always see a complete manifest
+        tmp_fname = "{}.{}.tmp".format(self._fname, os.getpid())
+        try:
+            with self._lock():
+                content = self._merge_changes(self._read())
+                with open(tmp_fname, "w") as f:
+                    json.dump(content, f, sort_keys=True, indent=4)
+                os.replace(tmp_fname, self._fname)
+                # the lock is released when closing the file
+        except OSError as e:
+            print("Could not write manifest {} ({})".format(self._fname, e))
+            return
+
+        # take over the entries written by other processes
+        self._content = content
+        self._changes = {"files": {}, "registers": {}}
+
+    def _get_key(self, fname):
+        fname = os.path.abspath(fname)
+
+        if os.path.dirname(fname) != self._directory:
+            raise Exception("File {} is not in the directory {} of the "
+                            "manifest".format(fname, self._directory))
+
+        return os.path.basename(fname)
+
+    @staticmethod
+    def _is_current(entry, stat):
+        return (entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns)
+
+    def get_file_info(self, fname):
+        """Gets the metadata of a HDF5 file.
+
+        The file is only opened if it is not indexed yet or changed.
+
+        Args:
+            fname (str): The file to get the metadata of.
+
+        Return:
+            A dictionary with the entries:
+                "datasets": For each dataset path a dictionary with "shape"
+                            and "dtype".
+                "columns": The columns [start, stop) contained in the file or
+                           None if not stored in the file.
+        """
+
+        key = self._get_key(fname)
+        stat = os.stat(fname)
+
+        entry = self._content["files"].get(key, None)
+        if self._is_current(entry, stat):
+            return entry
+
+        datasets = {}
+
+        def add_dataset(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                datasets[name] = {
+                    "shape": None if obj.shape is None else list(obj.shape),
+                    "dtype": obj.dtype.str
+                }
+
+        with h5py.File(fname, "r") as f:
+            f.visititems(add_dataset)
+
+            if COLUMNS_PATH in f:
+                columns = [int(c) for c in f[COLUMNS_PATH][()]]
+            else:
+                columns = None
+
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "datasets": datasets,
+            "columns": columns
+        }
+        self._set_entry("files", key, entry)
+
+        return entry
+
+    def get_shape(self, fname, path):
+        """Gets the shape of a dataset without opening the file.
+
+        Args:
+            fname (str): The HDF5 file.
+            path (str): The path of the dataset inside the file.
+
+        Return:
+            The shape as tuple.
+        """
+
+        datasets = self.get_file_info(fname)["datasets"]
+
+        if path not in datasets:
+            raise Exception("Dataset {} not found in {}".format(path, fname))
+
+        return tuple(datasets[path]["shape"])
+
+    def get_register(self, fname):
+        """Gets the content of a register file.
+
+        Args:
+            fname (str): The register file.
+
+        Return:
+            A list of [vin, prefix] sorted by vin.
+        """
+
+        key = self._get_key(fname)
+        stat = os.stat(fname)
+
+        entry = self._content["registers"].get(key, None)
+        if self._is_current(entry, stat):
+            return [list(e) for e in entry["entries"]]
+
+        register = read_register(fname)
+
+        self._set_entry("registers", key, {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "entries": register
+        })
+
+        return [list(e) for e in register]
+
+    def refresh(self, pattern="*.h5"):
+        """Indexes all files matching the pattern.
+
+        Only new or changed files are opened, entries of removed files are
+        dropped.
+
+        Args:
+            pattern (optional, str): The file name pattern to index.
+
+        Return:
+            The sorted list of matching files.
+        """
+
+        if not os.path.isdir(self._directory):
+            return []
+
+        fnames = sorted(glob.glob(os.path.join(self._directory, pattern)))
+
+        for fname in fnames:
+            self.get_file_info(fname)
+
+        existing = set(os.listdir(self._directory))
+        for key in list(self._content["files"].keys()):
+            if key not in existing:
+                self._set_entry("files", key, None)
+
+        self.save()
+
+        return fnames
+
+    def find_column(self, col, pattern="*.h5"):
+        """Finds the file containing a column.
+
+        Args:
+            col (int): The column to search for.
+            pattern (optional, str): The file name pattern to search in.
+
+        Return:
+            The file name and the first column of this file or (None, None)
+            if no file contains the column.
+        """
+
+        for fname in self.refresh(pattern):
+            columns = self.get_file_info(fname)["columns"]
+
+            if columns is not None and columns[0] <= col < columns[1]:
+                return fname, columns[0]
+
+        return None, None
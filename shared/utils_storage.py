@@ -0,0 +1,411 @@
+"""Storage policy for the HDF5 files written by the analysis stages.
+
+The chunk shapes are chosen to match how the data is read afterwards:
+    "time_series": The values of single pixels over all frames are read
+                   (e.g. the gathered data).
+    "frame": Single frames are read (e.g. the corrected data).
+    "tile": Spatial regions are read, no frame axis involved (e.g. the
+            constants).
+
+Alternatively the datasets can be stored contiguous, uncompressed and page
+aligned such that readers can map them into memory (see open_memmap).
+"""
+import os
+import h5py
+import numpy as np
+
+ACCESS_PATTERNS = ["time_series", "frame", "tile"]
+COMPRESSIONS = [None, "lzf", "gzip"]
+
+# alignment of the datasets in files to be memory-mapped (page size)
+MEMMAP_ALIGNMENT = 4096
+
+
+def open_memmap(dset):
+    """Maps a dataset into memory without reading it.
+
+    Only the pages of the file which are accessed are read, bypassing the
+    HDF5 library.
+
+    Args:
+        dset: The h5py dataset to map.
+
+    Return:
+        A read-only np.memmap or None if the dataset cannot be mapped
+        (chunked, compressed, not allocated or not numeric).
+    """
+
+    if (dset.chunks is not None
+            or dset.shape is None
+            or dset.dtype.kind not in ["b", "i", "u", "f"]):
+        return None
+
+    try:
+        offset = dset.id.get_offset()
+    except Exception:
+        # e.g. virtual datasets
+        return None
+
+    if offset is None:
+        return None
+
+    return np.memmap(dset.file.filename,
+                     dtype=dset.dtype,
+                     mode="r",
+                     offset=offset,
+                     shape=dset.shape)
+
+
+def get_master_fname(fname):
+    """Names the file combining the parts (see create_virtual_file).
+
+    Args:
+        fname (str): The name a part covering all the data would have.
+
+    Return:
+        The name with the suffix "_master" added before the extension.
+    """
+
+    root, ext = os.path.splitext(fname)
+
+    return "{}_master{}".format(root, ext)
+
+
+def create_virtual_file(out_fname, part_fnames, offsets, widths, axis=1,
+                        metadata=None):
+    """Combines files holding parts of the data into one logical file.
+
+    All datasets which are split along the axis are mapped into virtual
+    datasets covering all parts, i.e. no data is copied. The remaining
+    datasets are copied from the first part. The parts are referenced
+    relative to the location of the output file.
+
+    Args:
+        out_fname (str): The file to create.
+        part_fnames (list): The files containing the parts.
+        offsets (list): The start index of each part along the axis.
+        widths (list): The size of each part along the axis. Only datasets
+                       having this size in all parts are combined.
+        axis (optional, int): The axis along which the data was split.
+        metadata (optional, dict): Datasets to write additionally (or
+                                   instead of the ones of the first part).
+                                   The keys are the paths in the file.
+    """
+
+    if metadata is None:
+        metadata = {}
+
+    out_dir = os.path.dirname(os.path.abspath(out_fname))
+
+    # determine which datasets are split along the axis
+    part_shapes = []
+    for fname in part_fnames:
+        shapes = {}
+        with h5py.File(fname, "r") as f:
+            def add_shape(name, obj):
+                if isinstance(obj, h5py.Dataset):
+                    shapes[name] = (obj.shape, obj.dtype)
+
+            f.visititems(add_shape)
+        part_shapes.append(shapes)
+
+    first = part_shapes[0]
+    virtual_paths = []
+    for name, (shape, dtype) in first.items():
+        if name in metadata or shape is None or len(shape) <= axis:
+            continue
+
+        if all(name in s and s[name][0][axis] == w
+               for s, w in zip(part_shapes, widths)):
+            virtual_paths.append(name)
+
+    with h5py.File(out_fname, "w", libver="latest") as out_f:
+        for name in virtual_paths:
+            shape, dtype = first[name]
+
+            total_shape = list(shape)
+            total_shape[axis] = max(offset + w
+                                    for offset, w in zip(offsets, widths))
+
+            layout = h5py.VirtualLayout(shape=tuple(total_shape),
+                                        dtype=dtype)
+
+            for fname, offset, shapes in zip(part_fnames, offsets,
+                                             part_shapes):
+                part_shape = shapes[name][0]
+
+                source = h5py.VirtualSource(os.path.relpath(fname, out_dir),
+                                            name,
+                                            shape=part_shape)
+
+                idx = [slice(None)] * len(part_shape)
+                idx[axis] = slice(offset, offset + part_shape[axis])
+                layout[tuple(idx)] = source
+
+            out_f.create_virtual_dataset(name, layout, fillvalue=0)
+
+        # copy everything else from the first part
+        with h5py.File(part_fnames[0], "r") as f:
+            for name in first:
+                if name in virtual_paths or name in metadata:
+                    continue
+                out_f.create_dataset(name, data=f[name][()])
+
+        for name, value in metadata.items():
+            out_f.create_dataset(name, data=value)
+
+        out_f.flush()
+
+
+class StoragePolicy(object):
+    """Decides about chunking, filters and chunk cache of the output files.
+
+    Datasets smaller than one chunk are written contiguous and without
+    filters. If memmap is set or chunk_kb is None, all datasets are written
+    like this.
+    """
+
+    def __init__(self,
+                 chunk_kb=1024,
+                 compression=None,
+                 compression_opts=None,
+                 shuffle=False,
+                 chunk_cache_mb=None,
+                 frames_per_chunk=None,
+                 memmap=False):
+        """
+        Args:
+            chunk_kb (optional, float): The targeted size of one chunk. If
+                                        None, the datasets are not chunked.
+            compression (optional, str): The compression filter to use
+                                         (None, "lzf" or "gzip").
+            compression_opts (optional, int): The compression level for
+                                              gzip.
+            shuffle (optional, bool): Apply the shuffle filter before
+                                      compressing.
+            chunk_cache_mb (optional, float): The size of the chunk cache
+                                              when opening a file. If not
+                                              set the HDF5 default is used.
+            frames_per_chunk (optional, int): How many frames one chunk
+                                              spans. Overwrites the default
+                                              of the access pattern.
+            memmap (optional, bool): Store the datasets contiguous,
+                                     uncompressed and page aligned such
+                                     that readers can map them into memory.
+        """
+
+        if compression not in COMPRESSIONS:
+            raise Exception("Unsupported compression {} (supported are {})"
+                            .format(compression, COMPRESSIONS))
+
+        if memmap and compression is not None:
+            raise Exception("Memory-mapped files cannot be compressed.")
+
+        if chunk_kb is None and compression is not None:
+            raise Exception("Compressed datasets have to be chunked "
+                            "(chunk_kb is None).")
+
+        if chunk_kb is None:
+            self._chunk_bytes = None
+        else:
+            self._chunk_bytes = int(chunk_kb * 1024)
+        self._compression = compression
+        self._compression_opts = compression_opts
+        self._shuffle = shuffle
+        self._frames_per_chunk = frames_per_chunk
+        self._memmap = memmap
+
+        if chunk_cache_mb is None:
+            self._chunk_cache_bytes = None
+        else:
+            self._chunk_cache_bytes = int(chunk_cache_mb * 1024**2)
+
+    def open_file(self, fname, mode="w"):
+        """Opens a HDF5 file with the configured chunk cache.
+
+        Args:
+            fname (str): The file to open.
+            mode (optional, str): The mode to open the file in.
+
+        Return:
+            The h5py file object.
+        """
+
+        kwargs = {}
+        if self._chunk_cache_bytes is not None:
+            kwargs["rdcc_nbytes"] = self._chunk_cache_bytes
+
+        if self._memmap:
+            kwargs["alignment_threshold"] = MEMMAP_ALIGNMENT
+            kwargs["alignment_interval"] = MEMMAP_ALIGNMENT
+
+        return h5py.File(fname, mode, libver="latest", **kwargs)
+
+    def get_chunk_shape(self,
+                        shape,
+                        dtype,
+                        access="tile",
+                        frame_axis=None,
+                        frames_per_chunk=None):
+        """Determines the chunk shape matching the access pattern.
+
+        The outermost axes are shrunk first so that the innermost ones stay
+        contiguous inside of a chunk.
+
+        Args:
+            shape (tuple): The shape of the dataset.
+            dtype: The data type of the dataset.
+            access (optional, str): How the data is read afterwards (see
+                                    ACCESS_PATTERNS).
+            frame_axis (optional, int): The axis containing the frames.
+            frames_per_chunk (optional, int): How many frames one chunk
+                                              should span, e.g. the frames
+                                              written at once. Only used if
+                                              not configured in the policy.
+
+        Return:
+            The chunk shape as tuple.
+        """
+
+        if access not in ACCESS_PATTERNS:
+            raise Exception("Unsupported access pattern {} (supported are "
+                            "{})".format(access, ACCESS_PATTERNS))
+
+        # zero sized axes cannot be chunked with extent zero
+        chunk = [max(1, n) for n in shape]
+        target = max(1, self._chunk_bytes // np.dtype(dtype).itemsize)
+
+        if frame_axis is None or access == "tile":
+            axes = list(range(len(shape)))
+            n_frames = None
+        else:
+            axes = [axis for axis in range(len(shape)) if axis != frame_axis]
+
+            n_frames = (self._frames_per_chunk
+                        or frames_per_chunk
+                        or (shape[frame_axis] if access == "time_series"
+                            else 1))
+            n_frames = max(1, min(n_frames, shape[frame_axis]))
+
+            if access == "frame":
+                chunk[frame_axis] = n_frames
+            # for time series the spatial extent is chosen such that the
+            # complete time series of the chunk pixels fits into the target
+            # size, independent of how many frames a single chunk spans
+
+        for axis in axes:
+            rest = int(np.prod(chunk)) // chunk[axis]
+            chunk[axis] = max(1, min(chunk[axis], target // rest))
+
+        if n_frames is not None:
+            chunk[frame_axis] = n_frames
+
+        return tuple(chunk)
+
+    def get_dataset_options(self,
+                            shape,
+                            dtype,
+                            access="tile",
+                            frame_axis=None,
+                            frames_per_chunk=None):
+        """The keyword arguments to pass to create_dataset.
+
+        Args:
+            See get_chunk_shape.
+
+        Return:
+            A dictionary with the entries for chunks and filters (empty for
+            datasets stored contiguous).
+        """
+
+        dtype = np.dtype(dtype)
+        if (self._memmap
+                or self._chunk_bytes is None
+                or len(shape) == 0
+                or dtype.kind in ["O", "S", "U"]
+                or int(np.prod(shape)) * dtype.itemsize <= self._chunk_bytes):
+            return {}
+
+        options = {
+            "chunks": self.get_chunk_shape(shape=shape,
+                                           dtype=dtype,
+                                           access=access,
+                                           frame_axis=frame_axis,
+                                           frames_per_chunk=frames_per_chunk)
+        }
+
+        if self._compression is not None:
+            options["compression"] = self._compression
+            if (self._compression == "gzip"
+                    and self._compression_opts is not None):
+                options["compression_opts"] = self._compression_opts
+
+        if self._shuffle:
+            options["shuffle"] = True
+
+        return options
+
+    def create_dataset(self,
+                       out_f,
+                       path,
+                       data=None,
+                       shape=None,
+                       dtype=None,
+                       access="tile",
+                       frame_axis=None,
+                       frames_per_chunk=None):
+        """Creates a dataset using the storage options.
+
+        Args:
+            out_f: The opened h5py file to write into.
+            path (str): The path of the dataset inside of the file.
+            data (optional): The data to write.
+            shape (optional, tuple): The shape of the dataset (if no data is
+                                     given).
+            dtype (optional): The data type of the dataset.
+            access, frame_axis, frames_per_chunk (optional): See
+                get_chunk_shape.
+
+        Return:
+            The created dataset.
+        """
+
+        if data is None:
+            data_dtype = dtype
+        else:
+            array = np.asarray(data)
+            shape = array.shape
+            data_dtype = array.dtype if dtype is None else dtype
+
+        options = self.get_dataset_options(shape=shape,
+                                           dtype=data_dtype,
+                                           access=access,
+                                           frame_axis=frame_axis,
+                                           frames_per_chunk=frames_per_chunk)
+
+        if data is None:
+            return out_f.create_dataset(path,
+                                        shape=shape,
+                                        dtype=dtype,
+                                        **options)
+
+        return out_f.create_dataset(path, data=data, dtype=dtype, **options)
+
+
+def get_storage_policy(storage):
+    """Creates the storage policy for the storage section of the config.
+
+    Args:
+        storage (dict): The options of the StoragePolicy or None if no
+                        storage section is configured.
+
+    Return:
+        A StoragePolicy. Without a storage section the datasets are stored
+        contiguous and without filters (the HDF5 default), thus readers can
+        map them into memory as well.
+    """
+
+    if storage is None:
+        return StoragePolicy(chunk_kb=None)
+
+    return StoragePolicy(**storage)
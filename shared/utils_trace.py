@@ -0,0 +1,306 @@
+"""Instrumentation of the analysis stages.
+
+The stages record nested timing spans (e.g. load, split, fit, write),
+counters (e.g. bytes read, pixels fitted) and the peak memory into the
+trace of the current run, which can be written as json file:
+
+    import utils_trace
+
+    with utils_trace.span("load"):
+        data = ...
+        utils_trace.add_count("bytes_read", data.nbytes)
+
+    utils_trace.get_tracer().write("trace.json")
+
+Spans with the same name and parent (e.g. one per Vin) are accumulated into
+one entry, thus the size of the trace does not depend on the amount of data.
+
+Messages only of interest when debugging, in particular the ones inside of
+loops, go through the logger (see get_logger) instead of print.
+"""
+from contextlib import contextmanager
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+TRACE_VERSION = 1
+LOGGER_NAME = "percival"
+
+_tracer = None
+
+
+def configure_logging(level="INFO"):
+    """Sets up the output of the log messages.
+
+    The messages are written to stdout, like the prints of the stages.
+
+    Args:
+        level (optional, str or int): The minimum level of the messages to
+                                      show, e.g. "DEBUG" to see the
+                                      messages inside of loops.
+    """
+
+    logger = logging.getLogger(LOGGER_NAME)
+
+    if isinstance(level, str):
+        level = level.upper()
+    logger.setLevel(level)
+
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def get_logger(name=None):
+    """Returns the logger to use in a module.
+
+    Args:
+        name (optional, str): The name of the module. The logger is a child
+                              of the framework logger.
+
+    Return:
+        The logging.Logger object.
+    """
+
+    if not logging.getLogger(LOGGER_NAME).handlers:
+        configure_logging()
+
+    if name is None:
+        return logging.getLogger(LOGGER_NAME)
+
+    return logging.getLogger("{}.{}".format(LOGGER_NAME, name))
+
+
+def get_peak_rss_mb():
+    """The peak resident memory of the process so far.
+
+    Return:
+        The memory in MB or None if it cannot be determined.
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # given in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / 1024**2
+
+    return peak / 1024
+
+
+def start_trace(name):
+    """Starts a new trace for the current process.
+
+    Args:
+        name (str): The name of the run, e.g. the stage.
+
+    Return:
+        The Tracer object.
+    """
+
+    global _tracer
+
+    _tracer = Tracer(name)
+
+    return _tracer
+
+
+def get_tracer():
+    """Returns the trace of the current process.
+
+    If no trace was started yet, one named after the executed script is.
+    """
+
+    if _tracer is None:
+        start_trace(os.path.basename(sys.argv[0]) or "python")
+
+    return _tracer
+
+
+def span(name):
+    """Records a timing span in the trace of the current process.
+
+    Args:
+        name (str): The name of the span.
+
+    Return:
+        A context manager yielding the span entry.
+    """
+
+    return get_tracer().span(name)
+
+
+def add_count(name, value=1):
+    """Adds to a counter of the current span.
+
+    Args:
+        name (str): The name of the counter, e.g. "bytes_read".
+        value (optional): The value to add.
+    """
+
+    get_tracer().add_count(name, value)
+
+
+def add_file_size(name, fname):
+    """Adds the size of a file to a counter of the current span.
+
+    Args:
+        name (str): The name of the counter, e.g. "bytes_written".
+        fname (str): The file (which is not counted if it does not exist).
+    """
+
+    if os.path.exists(fname):
+        add_count(name, os.path.getsize(fname))
+
+
+def _sum_counters(entry, totals=None):
+    if totals is None:
+        totals = {}
+
+    for key, value in entry["counters"].items():
+        totals[key] = totals.get(key, 0) + value
+
+    for child in entry["spans"]:
+        _sum_counters(child, totals)
+
+    return totals
+
+
+class Tracer(object):
+    """Collects the spans and counters of one run.
+
+    Spans are expected to be opened by the main thread only.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): The name of the run.
+        """
+
+        self._root = self._new_span(name)
+        self._root["start"] = time.time()
+
+        self._stack = [self._root]
+
+    @staticmethod
+    def _new_span(name):
+        return {
+            "name": name,
+            "start": None,
+            "calls": 0,
+            "duration_s": 0.0,
+            "peak_rss_mb": None,
+            "counters": {},
+            "spans": []
+        }
+
+    @contextmanager
+    def span(self, name):
+        """Records a timing span nested into the currently open one.
+
+        Args:
+            name (str): The name of the span.
+
+        Return:
+            A context manager yielding the span entry.
+        """
+
+        parent = self._stack[-1]
+
+        for entry in parent["spans"]:
+            if entry["name"] == name:
+                break
+        else:
+            entry = self._new_span(name)
+            parent["spans"].append(entry)
+
+        start = time.time()
+        if entry["start"] is None:
+            entry["start"] = start
+
+        self._stack.append(entry)
+        try:
+            yield entry
+        except BaseException as e:
+            entry["error"] = type(e).__name__
+            raise
+        finally:
+            self._stack.pop()
+
+            entry["calls"] += 1
+            entry["duration_s"] += time.time() - start
+            entry["peak_rss_mb"] = get_peak_rss_mb()
+
+    def add_count(self, name, value=1):
+        """Adds to a counter of the currently open span.
+
+        Args:
+            name (str): The name of the counter.
+            value (optional): The value to add.
+        """
+
+        counters = self._stack[-1]["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+    def attach(self, trace, name=None):
+        """Adds the trace of another process (e.g. a worker) as span of the
+        currently open one.
+
+        Args:
+            trace (dict): The trace as returned by to_dict.
+            name (optional, str): The name of the span (default: the name of
+                                  the other trace).
+        """
+
+        entry = dict(trace["trace"])
+        entry["pid"] = trace["pid"]
+        if name is not None:
+            entry["name"] = name
+
+        self._stack[-1]["spans"].append(entry)
+
+    def to_dict(self):
+        """The trace including the totals of all counters.
+
+        Return:
+            A json serializable dictionary.
+        """
+
+        root = dict(self._root)
+        root["calls"] = 1
+        root["duration_s"] = time.time() - root["start"]
+        root["peak_rss_mb"] = get_peak_rss_mb()
+
+        return {
+            "version": TRACE_VERSION,
+            "host": platform.node(),
+            "pid": os.getpid(),
+            "counters": _sum_counters(root),
+            "trace": root
+        }
+
+    def write(self, fname):
+        """Writes the trace into a json file.
+
+        Args:
+            fname (str): The file to write.
+        """
+
+        with open(fname, "w") as f:
+            json.dump(self.to_dict(), f, sort_keys=True, indent=4)
+
+        print("Trace written to {}".format(fname))
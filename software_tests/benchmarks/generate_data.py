@@ -0,0 +1,272 @@
+"""Generates synthetic P2M ADC ramp data.
+
+One raw file per Vin in the DLSraw layout (datasets "data" and "reset") is
+written plus the register file used by the gather method
+file_per_vin_and_register_file.
+"""
+import argparse
+import os
+import sys
+import h5py
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+BASE_DIR = os.path.dirname(os.path.dirname(CURRENT_DIR))
+SHARED_DIR = os.path.join(BASE_DIR, "shared")
+
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+import utils  # noqa E402
+
+N_ADC = 7
+N_COARSE = 32
+N_FINE = 256
+
+
+def encode_dlsraw(coarse, fine, gain):
+    """Combines coarse, fine and gain into the 16 bit DLSraw format.
+
+    This is the inverse of utils.split.
+
+    Args:
+        coarse: The coarse values (5 bit).
+        fine: The fine values (8 bit).
+        gain: The gain bits (2 bit).
+
+    Return:
+        A uint16 array.
+    """
+
+    return ((gain.astype(np.uint16) << 13)
+            | (fine.astype(np.uint16) << 5)
+            | coarse.astype(np.uint16))
+
+
+class Generator(object):
+    """Simulates the ADC ramps of every pixel.
+
+    Each pixel gets its own coarse offset and step width (in Vin) as well as
+    a fine gain and offset. The sample follows the Vin ramp while the reset
+    stays at a pixel specific level. Both are smeared by gaussian noise.
+    """
+
+    def __init__(self,
+                 output_dir,
+                 n_rows=1484,
+                 n_cols=1440,
+                 n_frames_per_vin=10,
+                 vin_values=None,
+                 n_coarse_steps=N_COARSE - 4,
+                 run_id="DLSraw",
+                 metadata_fname="meta.dat",
+                 noise=2.,
+                 seed=0):
+        """
+        Args:
+            output_dir (str): Where to write the files to.
+            n_rows (optional, int): Number of sensor rows (multiple of 7).
+            n_cols (optional, int): Number of sensor columns.
+            n_frames_per_vin (optional, int): Frames recorded per Vin.
+            vin_values (optional, list): The Vin steps. Default is 30 steps
+                                         from 20000 to 43000.
+            n_coarse_steps (optional, int): How many coarse steps the Vin
+                                            range spans. Use less steps to
+                                            get more Vin values per coarse
+                                            plateau (for the fine fit).
+            run_id (optional, str): The non-changing part of the file name.
+            metadata_fname (optional, str): The name of the register file.
+            noise (optional, float): The noise (in Vin units).
+            seed (optional, int): The seed of the random number generator.
+        """
+
+        if n_rows % N_ADC != 0:
+            raise Exception("n_rows has to be a multiple of {}"
+                            .format(N_ADC))
+
+        self._output_dir = output_dir
+        self._n_rows = n_rows
+        self._n_cols = n_cols
+        self._n_frames_per_vin = n_frames_per_vin
+        self._run_id = run_id
+        self._metadata_fname = metadata_fname
+        self._noise = noise
+
+        if vin_values is None:
+            self._vin_values = np.linspace(20000, 43000, 30)
+        else:
+            self._vin_values = np.asarray(vin_values, dtype=np.float64)
+
+        self._n_coarse_steps = n_coarse_steps
+
+        self._rng = np.random.RandomState(seed)
+        self._pixel_params = None
+
+    def _set_pixel_parameters(self):
+        shape = (self._n_rows, self._n_cols)
+
+        vin_start = self._vin_values.min()
+        vin_range = self._vin_values.max() - vin_start
+        rng = self._rng
+
+        coarse_step = vin_range / self._n_coarse_steps
+
+        self._pixel_params = {
+            "coarse_offset": (vin_start - coarse_step
+                              + rng.normal(0, coarse_step / 4, shape)),
+            "coarse_step": coarse_step * rng.normal(1, 0.03, shape),
+            "fine_gain": rng.normal(0.8, 0.03, shape),
+            "fine_offset": rng.normal(20, 3, shape),
+            "reset_level": rng.uniform(2, 6, shape)
+        }
+
+    def _get_adc_values(self, position):
+        """Converts a position on the coarse ramp into ADC values.
+
+        Args:
+            position: The position in units of coarse steps.
+
+        Return:
+            The coarse, fine and gain values.
+        """
+
+        params = self._pixel_params
+
+        coarse = np.floor(position)
+        frac = position - coarse
+
+        fine = (params["fine_offset"]
+                + params["fine_gain"] * (N_FINE - 1) * frac)
+
+        coarse = np.clip(coarse, 0, N_COARSE - 1).astype(np.uint8)
+        fine = np.clip(np.round(fine), 0, N_FINE - 1).astype(np.uint8)
+        # high gain everywhere
+        gain = np.zeros(coarse.shape, dtype=np.uint8)
+
+        return coarse, fine, gain
+
+    def _generate_vin(self, vin):
+        params = self._pixel_params
+        shape = (self._n_frames_per_vin, self._n_rows, self._n_cols)
+
+        sample = np.empty(shape, dtype=np.uint16)
+        reset = np.empty(shape, dtype=np.uint16)
+
+        noise = self._noise / params["coarse_step"]
+        for frame in range(self._n_frames_per_vin):
+            position = ((vin - params["coarse_offset"])
+                        / params["coarse_step"]
+                        + self._rng.normal(0, 1, noise.shape) * noise)
+            sample[frame] = encode_dlsraw(*self._get_adc_values(position))
+
+            position = (params["reset_level"]
+                        + self._rng.normal(0, 1, noise.shape) * noise)
+            reset[frame] = encode_dlsraw(*self._get_adc_values(position))
+
+        return sample, reset
+
+    def run(self):
+        """Writes the raw files and the register file.
+
+        Return:
+            The input file name template (with placeholder "prefix") and the
+            name of the register file.
+        """
+
+        utils.create_dir(self._output_dir)
+
+        self._set_pixel_parameters()
+
+        in_fname = os.path.join(self._output_dir,
+                                "{prefix}_" + "{}.h5".format(self._run_id))
+
+        register = []
+        for i, vin in enumerate(self._vin_values):
+            prefix = "vin{:03d}".format(i)
+            fname = in_fname.format(prefix=prefix)
+
+            sample, reset = self._generate_vin(vin)
+
+            with h5py.File(fname, "w") as f:
+                f.create_dataset("data", data=sample)
+                f.create_dataset("reset", data=reset)
+
+            print("Written {} (Vin {})".format(fname, vin))
+            register.append("{}\t{}".format(vin, prefix))
+
+        meta_fname = os.path.join(self._output_dir, self._metadata_fname)
+        with open(meta_fname, "w") as f:
+            f.write("\n".join(register) + "\n")
+
+        return in_fname, meta_fname
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic P2M ADC ramp data"
+    )
+    parser.add_argument("-o", "--output",
+                        dest="output",
+                        type=str,
+                        required=True,
+                        help="Path of output directory for storing files")
+    parser.add_argument("--n_rows",
+                        type=int,
+                        default=1484,
+                        help="Number of rows of the sensor (multiple of 7)")
+    parser.add_argument("--n_cols",
+                        type=int,
+                        default=1440,
+                        help="Number of columns of the sensor")
+    parser.add_argument("--n_frames",
+                        type=int,
+                        default=10,
+                        help="Number of frames per Vin")
+    parser.add_argument("--n_vins",
+                        type=int,
+                        default=30,
+                        help="Number of Vin steps")
+    parser.add_argument("--vin_range",
+                        type=float,
+                        nargs=2,
+                        default=[20000, 43000],
+                        help="First and last Vin value")
+    parser.add_argument("--n_coarse_steps",
+                        type=int,
+                        default=N_COARSE - 4,
+                        help="Number of coarse steps spanned by the Vin "
+                             "range")
+    parser.add_argument("-r", "--run",
+                        dest="run_id",
+                        type=str,
+                        default="DLSraw",
+                        help="Non-changing part of file name")
+    parser.add_argument("--metadata_file",
+                        type=str,
+                        default="meta.dat",
+                        help="File name of the register file")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="Seed of the random number generator")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    args = get_arguments()
+
+    obj = Generator(output_dir=args.output,
+                    n_rows=args.n_rows,
+                    n_cols=args.n_cols,
+                    n_frames_per_vin=args.n_frames,
+                    vin_values=np.linspace(args.vin_range[0],
+                                           args.vin_range[1],
+                                           args.n_vins),
+                    n_coarse_steps=args.n_coarse_steps,
+                    run_id=args.run_id,
+                    metadata_fname=args.metadata_file,
+                    seed=args.seed)
+    obj.run()
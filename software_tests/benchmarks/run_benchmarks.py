@@ -0,0 +1,477 @@
+"""End-to-end benchmark of the calibration chain on synthetic data.
+
+Times gather, process (coarse and fine), gather and process in one go (run
+type "all"), merge and correction and writes throughput and peak memory of
+each stage into a json report.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+BASE_DIR = os.path.dirname(os.path.dirname(CURRENT_DIR))
+SHARED_DIR = os.path.join(BASE_DIR, "shared")
+
+CALIBRATION_SRC_DIR = os.path.join(BASE_DIR, "calibration", "src")
+ADCCAL_GATHER_METHOD_DIR = os.path.join(CALIBRATION_SRC_DIR,
+                                        "gather", "adccal", "methods")
+PROCESS_DIR = os.path.join(CALIBRATION_SRC_DIR, "process")
+ADCCAL_PROCESS_DIR = os.path.join(PROCESS_DIR, "adccal")
+ADCCAL_PROCESS_METHOD_DIR = os.path.join(ADCCAL_PROCESS_DIR, "methods")
+CORRECTION_SRC_DIR = os.path.join(BASE_DIR, "correction", "src")
+
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+from _version import __version__  # noqa E402
+from generate_data import Generator  # noqa E402
+import utils_trace  # noqa E402
+
+
+def _add_to_path(*paths):
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def run_gather(in_fname, meta_fname, out_fname, run_id, n_rows, n_cols):
+    _add_to_path(ADCCAL_GATHER_METHOD_DIR)
+    from file_per_vin_and_register_file import Gather
+
+    obj = Gather(input=os.path.dirname(in_fname),
+                 in_fname=in_fname,
+                 output=os.path.dirname(out_fname),
+                 out_fname=out_fname,
+                 meta_fname=meta_fname,
+                 run=run_id,
+                 n_rows=n_rows,
+                 n_cols=n_cols,
+                 part=0,
+                 method_properties=None)
+    obj.run()
+
+
+def run_process(in_fname, out_fname, run_id, method, method_properties):
+    _add_to_path(PROCESS_DIR, ADCCAL_PROCESS_DIR, ADCCAL_PROCESS_METHOD_DIR)
+    process_m = __import__(method).Process
+
+    obj = process_m(in_fname=in_fname,
+                    in_dir=os.path.dirname(in_fname),
+                    out_fname=out_fname,
+                    run=run_id,
+                    method=method,
+                    method_properties=method_properties)
+    obj.run()
+
+
+def run_all(in_fname, meta_fname, gather_fname, out_fname, run_id, n_rows,
+            n_cols, method, method_properties):
+    _add_to_path(CALIBRATION_SRC_DIR)
+    from analyse import Analyse
+
+    obj = Analyse(in_base_dir=os.path.dirname(in_fname),
+                  out_base_dir=os.path.dirname(os.path.dirname(out_fname)),
+                  create_outdir=True,
+                  run_id=run_id,
+                  run_type="all",
+                  measurement="adccal",
+                  n_cols=n_cols,
+                  method="file_per_vin_and_register_file",
+                  method_properties=None,
+                  n_processes=1,
+                  metadata_fname=os.path.basename(meta_fname),
+                  process_method=method,
+                  process_method_properties=method_properties,
+                  save_gathered=True)
+
+    # the sensor size is fixed in Analyse, thus only the job of the one part
+    # covering the generated data is run
+    obj._call_all(
+        gather_kwargs=dict(input=os.path.dirname(in_fname),
+                           in_fname=in_fname,
+                           output=os.path.dirname(gather_fname),
+                           out_fname=gather_fname,
+                           meta_fname=meta_fname,
+                           run=run_id,
+                           n_rows=n_rows,
+                           n_cols=n_cols,
+                           part=0,
+                           method_properties=None),
+        process_kwargs=dict(in_fname=gather_fname,
+                            in_dir=os.path.dirname(in_fname),
+                            out_fname=out_fname,
+                            run=run_id,
+                            method=method,
+                            method_properties=method_properties)
+    )
+
+
+def run_merge(input_dir_crs, input_dir_fn, out_fname):
+    _add_to_path(CALIBRATION_SRC_DIR)
+    from merge_constants import MergeConstants
+
+    obj = MergeConstants(input_dir_crs, input_dir_fn, out_fname)
+    obj.run()
+
+
+def run_correction(data_fname, constants_fname, out_fname):
+    _add_to_path(CORRECTION_SRC_DIR)
+    from run_correction import CorrectionBase
+
+    obj = CorrectionBase(data_fname=data_fname,
+                         dark_fname=None,
+                         constants_fname=constants_fname,
+                         output_fname=out_fname,
+                         method="correction_adc_default")
+    obj.run()
+
+
+def _measure(queue, func, kwargs, verbose):
+    """Runs a stage inside a fresh process and reports time, memory and the
+    trace of the stage.
+
+    Args:
+        queue: Where to put the result.
+        func: The stage to run.
+        kwargs (dict): The keyword arguments of the stage.
+        verbose (bool): Show the output of the stage.
+    """
+
+    try:
+        tracer = utils_trace.start_trace(func.__name__)
+
+        with open(os.devnull, "w") as devnull:
+            if verbose:
+                redirect = contextlib.suppress()
+            else:
+                redirect = contextlib.redirect_stdout(devnull)
+
+            with redirect:
+                t = time.time()
+                func(**kwargs)
+                duration = time.time() - t
+
+        # ru_maxrss is given in kilobytes on Linux
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        queue.put(("ok", duration, peak_memory / 1024, tracer.to_dict()))
+    except Exception:
+        queue.put(("error", traceback.format_exc(), None, None))
+
+
+class Benchmark(object):
+    """Runs the calibration stages one after the other on generated data.
+
+    Each stage is run in a separate process such that the peak memory
+    belongs to this stage only.
+    """
+
+    def __init__(self,
+                 work_dir,
+                 n_rows,
+                 n_cols,
+                 n_frames_per_vin,
+                 n_vins,
+                 process_method,
+                 n_repeats=1,
+                 verbose=False):
+
+        self._work_dir = work_dir
+        self._n_rows = n_rows
+        self._n_cols = n_cols
+        self._n_frames_per_vin = n_frames_per_vin
+        self._n_vins = n_vins
+        self._process_method = process_method
+        self._n_repeats = n_repeats
+        self._verbose = verbose
+
+        self._run_id = "DLSraw"
+        self._n_frames = self._n_frames_per_vin * self._n_vins
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._report = {}
+
+    def _run_stage(self, name, func, kwargs, n_pixels, n_frames):
+        """Runs and times one stage.
+
+        Args:
+            name (str): The name of the stage in the report.
+            func: The stage to run.
+            kwargs (dict): The keyword arguments of the stage.
+            n_pixels (int): The number of pixel values handled by the stage.
+            n_frames (int): The number of frames handled by the stage.
+        """
+
+        print("Run {} ...".format(name), end="")
+        sys.stdout.flush()
+
+        durations = []
+        peak_memory = 0
+        traces = []
+        for _ in range(self._n_repeats):
+            queue = self._ctx.Queue()
+            proc = self._ctx.Process(target=_measure,
+                                     args=(queue, func, kwargs,
+                                           self._verbose))
+            proc.start()
+            status, value, memory, trace = queue.get()
+            proc.join()
+
+            if status != "ok":
+                raise Exception("Stage {} failed:\n{}".format(name, value))
+
+            durations.append(value)
+            peak_memory = max(peak_memory, memory)
+            traces.append(trace)
+
+        duration = min(durations)
+        # the trace of the reported (fastest) run
+        trace = traces[durations.index(duration)]
+        print(" {:.3f} s".format(duration))
+
+        self._report["stages"][name] = {
+            "time_s": duration,
+            "times_s": durations,
+            "pixels_per_s": n_pixels / duration,
+            "frames_per_s": n_frames / duration if n_frames else None,
+            "peak_memory_mb": peak_memory,
+            "counters": trace["counters"],
+            "trace": trace["trace"]
+        }
+
+    def run(self):
+        """Generates the data and runs all stages.
+
+        Return:
+            The report as dictionary.
+        """
+
+        self._report = {
+            "date": str(datetime.datetime.now()),
+            "version": __version__,
+            "git_commit": get_git_commit(),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "parameters": {
+                "n_rows": self._n_rows,
+                "n_cols": self._n_cols,
+                "n_frames_per_vin": self._n_frames_per_vin,
+                "n_vins": self._n_vins,
+                "process_method": self._process_method,
+                "n_repeats": self._n_repeats
+            },
+            "stages": {}
+        }
+
+        raw_dir = os.path.join(self._work_dir, "raw")
+        gather_dir = os.path.join(self._work_dir, "gathered")
+        coarse_dir = os.path.join(self._work_dir, "processed_coarse")
+        fine_dir = os.path.join(self._work_dir, "processed_fine")
+        result_dir = os.path.join(self._work_dir, "result")
+        all_dir = os.path.join(self._work_dir, "all")
+        for d in [gather_dir, coarse_dir, fine_dir, result_dir,
+                  os.path.join(all_dir, "gathered"),
+                  os.path.join(all_dir, "processed")]:
+            os.makedirs(d, exist_ok=True)
+
+        print("Generate data in {} ...".format(raw_dir))
+        t = time.time()
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                generator = Generator(
+                    output_dir=raw_dir,
+                    n_rows=self._n_rows,
+                    n_cols=self._n_cols,
+                    n_frames_per_vin=self._n_frames_per_vin,
+                    vin_values=np.linspace(20000, 43000, self._n_vins),
+                    # have several Vin values on each coarse plateau to
+                    # give the fine fit something to work on
+                    n_coarse_steps=min(max(self._n_vins // 5, 1), 28),
+                    run_id=self._run_id
+                )
+                in_fname, meta_fname = generator.run()
+        print("Generating data took {:.3f} s".format(time.time() - t))
+
+        n_sensor = self._n_rows * self._n_cols
+        cols = "col0-{}".format(self._n_cols - 1)
+        gathered_fname = os.path.join(gather_dir,
+                                      "{}_gathered.h5".format(cols))
+
+        self._run_stage(name="gather",
+                        func=run_gather,
+                        kwargs=dict(in_fname=in_fname,
+                                    meta_fname=meta_fname,
+                                    out_fname=gathered_fname,
+                                    run_id=self._run_id,
+                                    n_rows=self._n_rows,
+                                    n_cols=self._n_cols),
+                        n_pixels=n_sensor * self._n_frames,
+                        n_frames=self._n_frames)
+
+        for adc_part, out_dir in [("coarse", coarse_dir),
+                                  ("fine", fine_dir)]:
+            method_properties = {
+                "fit_adc_part": adc_part,
+                "coarse_fitting_range": [2, 29]
+            }
+            out_fname = os.path.join(out_dir,
+                                     "{}_processed.h5".format(cols))
+
+            self._run_stage(name="process_" + adc_part,
+                            func=run_process,
+                            kwargs=dict(in_fname=gathered_fname,
+                                        out_fname=out_fname,
+                                        run_id=self._run_id,
+                                        method=self._process_method,
+                                        method_properties=method_properties),
+                            n_pixels=n_sensor * self._n_frames,
+                            n_frames=self._n_frames)
+
+        # gather and process in one go, saving the gathered data as well
+        method_properties = {
+            "fit_adc_part": "coarse",
+            "coarse_fitting_range": [2, 29]
+        }
+        self._run_stage(
+            name="all",
+            func=run_all,
+            kwargs=dict(in_fname=in_fname,
+                        meta_fname=meta_fname,
+                        gather_fname=os.path.join(
+                            all_dir, "gathered", "{}_gathered.h5".format(cols)
+                        ),
+                        out_fname=os.path.join(
+                            all_dir, "processed",
+                            "{}_processed.h5".format(cols)
+                        ),
+                        run_id=self._run_id,
+                        n_rows=self._n_rows,
+                        n_cols=self._n_cols,
+                        method=self._process_method,
+                        method_properties=method_properties),
+            n_pixels=n_sensor * self._n_frames,
+            n_frames=self._n_frames
+        )
+
+        constants_fname = os.path.join(result_dir, "constants.h5")
+        self._run_stage(name="merge",
+                        func=run_merge,
+                        kwargs=dict(input_dir_crs=coarse_dir,
+                                    input_dir_fn=fine_dir,
+                                    out_fname=constants_fname),
+                        n_pixels=n_sensor,
+                        n_frames=None)
+
+        self._run_stage(name="correction",
+                        func=run_correction,
+                        kwargs=dict(data_fname=in_fname.format(
+                                        prefix="vin000"
+                                    ),
+                                    constants_fname=constants_fname,
+                                    out_fname=os.path.join(result_dir,
+                                                           "corrected.h5")),
+                        n_pixels=n_sensor * self._n_frames_per_vin,
+                        n_frames=self._n_frames_per_vin)
+
+        return self._report
+
+
+def get_git_commit():
+    """Returns the current commit of the repository if available.
+    """
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         cwd=BASE_DIR,
+                                         stderr=subprocess.DEVNULL)
+        return commit.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the calibration chain on synthetic data"
+    )
+    parser.add_argument("--work_dir",
+                        type=str,
+                        default=None,
+                        help="Directory to write the data to (default: a "
+                             "temporary directory which is removed "
+                             "afterwards)")
+    parser.add_argument("--report",
+                        type=str,
+                        default="benchmark_report.json",
+                        help="File name of the json report")
+    parser.add_argument("--n_rows",
+                        type=int,
+                        default=1484,
+                        help="Number of rows of the sensor (multiple of 7)")
+    parser.add_argument("--n_cols",
+                        type=int,
+                        default=1440,
+                        help="Number of columns of the sensor")
+    parser.add_argument("--n_frames",
+                        type=int,
+                        default=10,
+                        help="Number of frames per Vin")
+    parser.add_argument("--n_vins",
+                        type=int,
+                        default=30,
+                        help="Number of Vin steps")
+    parser.add_argument("--process_method",
+                        type=str,
+                        default="process_pixel_calibration",
+                        help="The process method to benchmark")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=1,
+                        help="How often each stage is run (the fastest run "
+                             "is reported)")
+    parser.add_argument("--verbose",
+                        action="store_true",
+                        help="Show the output of the stages")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    args = get_arguments()
+
+    if args.work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix="p2m_benchmark_")
+    else:
+        work_dir = args.work_dir
+
+    try:
+        obj = Benchmark(work_dir=work_dir,
+                        n_rows=args.n_rows,
+                        n_cols=args.n_cols,
+                        n_frames_per_vin=args.n_frames,
+                        n_vins=args.n_vins,
+                        process_method=args.process_method,
+                        n_repeats=args.repeat,
+                        verbose=args.verbose)
+        report = obj.run()
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, sort_keys=True, indent=4)
+
+    print("\nReport written to {}".format(args.report))
@@ -0,0 +1,140 @@
+"""Checks the packed-word descrambling helpers against the bit array path.
+
+utils.decode_bitplanes and utils.byteswap_uint16 replaced the conversion of
+every word into an array of single bits (convert_uint_2_bits_ar,
+convert_bits_2_int_ar of the descramble methods). Both have to give exactly
+the same values, which is checked here on random words.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(CURRENT_DIR)))
+SHARED_DIR = os.path.join(BASE_DIR, "shared")
+DESCRAMBLE_METHOD_DIR = os.path.join(BASE_DIR,
+                                     "calibration",
+                                     "src",
+                                     "gather",
+                                     "descramble",
+                                     "methods")
+
+for path in [SHARED_DIR, DESCRAMBLE_METHOD_DIR]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import utils  # noqa E402
+from utils_methods import (convert_uint_2_bits_ar,  # noqa E402
+                           convert_bits_2_int_ar,
+                           convert_britishbits_ar)
+
+N_VALUES = 224  # n_adc * n_col_in_blk
+N_BITS = 15
+
+
+def byteswap_bitted(words):
+    """Swaps the bytes of 16 bit words the way the descramble methods did.
+    """
+
+    bitted = convert_uint_2_bits_ar(words, 16).astype('uint8')
+    byteinverted = np.zeros_like(bitted).astype('uint8')
+    byteinverted[..., 0:8] = bitted[..., 8:16]
+    byteinverted[..., 8:16] = bitted[..., 0:8]
+
+    return convert_bits_2_int_ar(byteinverted)
+
+
+def decode_bitted(words):
+    """Assembles the values from the bit planes via single bits.
+
+    Args:
+        words: Array (..., N_VALUES) of 16 bit words, each carrying 15 bits
+               of the stream behind a head bit.
+
+    Return:
+        The values (..., N_VALUES) as int array.
+    """
+
+    shape = words.shape[:-1]
+
+    # most significant bit first, remove the head bit of every word
+    bitted = convert_uint_2_bits_ar(words, 16)[..., ::-1].astype('uint8')
+    bitted = bitted[..., 1:]
+
+    # concatenate the words and split the stream into the bit planes
+    bitted = bitted.reshape(shape + (N_BITS, N_VALUES))
+    bitted = np.swapaxes(bitted, -1, -2)
+    bitted = convert_britishbits_ar(bitted)
+
+    # convert_bits_2_int_ar expects the least significant bit first
+    return convert_bits_2_int_ar(bitted[..., ::-1])
+
+
+def check(n_streams, seed):
+    """Compares both paths on random words.
+
+    Args:
+        n_streams (int): The number of bit plane streams to check.
+        seed (int): Seed of the random generator.
+
+    Return:
+        True if all values are identical.
+    """
+
+    rng = np.random.RandomState(seed)
+    words = rng.randint(0, 2**16, size=(n_streams, N_VALUES))
+    words = words.astype(np.uint16)
+
+    result = True
+
+    swapped = utils.byteswap_uint16(words)
+    if not np.array_equal(swapped, byteswap_bitted(words)):
+        print("byteswap_uint16 differs from the bit array path")
+        result = False
+
+    values = utils.decode_bitplanes(words, N_VALUES, N_BITS)
+    expected = decode_bitted(words)
+    if not np.array_equal(values, expected):
+        n_diff = np.sum(values != expected)
+        print("decode_bitplanes differs from the bit array path in {} of {} "
+              "values".format(n_diff, expected.size))
+        result = False
+
+    # the stream is split into gain, fine and coarse afterwards
+    (coarse, fine, gain) = utils.split(values)
+    if not (np.array_equal(gain, expected >> 13)
+            and np.array_equal(fine, (expected >> 5) & 0xFF)
+            and np.array_equal(coarse, expected & 0x1F)):
+        print("split of the decoded values differs")
+        result = False
+
+    return result
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Check the bit plane decoding against the bit array path"
+    )
+    parser.add_argument("--n_streams",
+                        type=int,
+                        default=2 * 212 * 44,
+                        help="Number of bit plane streams to check (default: "
+                             "one image, Sample and Reset)")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="Seed of the random generator")
+
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    args = get_arguments()
+
+    if check(args.n_streams, args.seed):
+        print("All values identical")
+    else:
+        sys.exit(1)